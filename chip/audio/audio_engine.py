@@ -1,7 +1,13 @@
-import struct
 import asyncio
-import time
+import os
 import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
 import numpy as np
 import sounddevice as sd
 import pvporcupine 
@@ -9,17 +15,58 @@ import pvporcupine
 from colorama import Fore, Style, init
 from chip.core import state
 from chip.utils import config
+from chip.audio.ring_buffer import FrameAssembler
+from chip.audio.vad import VadGate
+from chip.audio.resample import PolyphaseResampler
+from chip.audio.echo_cancel import EchoCanceller, EchoReference
 
 init(autoreset=True)
 
 if not hasattr(state, 'last_speech_time'):
     state.last_speech_time = 0
 
+def decode_to_pcm(path, samplerate):
+    """Decodes any audio file to mono int16 PCM via the platform decoder (afconvert on macOS, else ffmpeg)."""
+    if not os.path.exists(path):
+        return None
+    try:
+        if sys.platform == "darwin" and shutil.which("afconvert"):
+            with tempfile.NamedTemporaryFile(suffix=".wav") as tmp:
+                subprocess.run(
+                    ["afconvert", "-f", "WAVE", "-d", f"LEI16@{samplerate}", "-c", "1", path, tmp.name],
+                    check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                )
+                with wave.open(tmp.name, "rb") as w:
+                    return np.frombuffer(w.readframes(w.getnframes()), dtype=np.int16).copy()
+        if shutil.which("ffmpeg"):
+            result = subprocess.run(
+                ["ffmpeg", "-v", "quiet", "-i", path, "-f", "s16le", "-ac", "1", "-ar", str(samplerate), "-"],
+                check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+            )
+            return np.frombuffer(result.stdout, dtype=np.int16).copy()
+    except (subprocess.CalledProcessError, OSError, wave.Error):
+        pass
+    return None
+
+def native_samplerate(device, kind, fallback):
+    """The device's own sample rate, so the OS mixer never resamples behind our back."""
+    if not getattr(config, 'NATIVE_DEVICE_RATES', True):
+        return fallback
+    try:
+        return int(sd.query_devices(device, kind)["default_samplerate"])
+    except Exception:
+        return fallback
+
+class _Voice:
+    __slots__ = ("pcm", "pos", "gain")
+
+    def __init__(self, pcm, gain):
+        self.pcm = pcm
+        self.pos = 0
+        self.gain = gain
+
 class AudioEngine:
     def __init__(self):
-        self.samplerate = config.SAMPLE_RATE_TTS
-        self.blocksize = getattr(config, 'BLOCK_SIZE', 4096)
-        
         device_idx = None
         preferred = getattr(config, "PREFERRED_OUTPUT_DEVICE", None)
         if preferred:
@@ -28,6 +75,10 @@ class AudioEngine:
                 if preferred.lower() in d["name"].lower() and d["max_output_channels"] > 0:
                     device_idx = i
                     break
+
+        # Same block duration as at the TTS rate, whatever the device runs at
+        self.samplerate = native_samplerate(device_idx, 'output', config.SAMPLE_RATE_TTS)
+        self.blocksize = int(getattr(config, 'BLOCK_SIZE', 4096) * self.samplerate / config.SAMPLE_RATE_TTS)
         
         self.stream = sd.OutputStream(device=device_idx, 
             samplerate=self.samplerate,
@@ -37,66 +88,161 @@ class AudioEngine:
             callback=self._callback
         )
         
-        self._leftover_data = b''
-        self._is_starting_phrase = True
-        self._buffer_threshold = 2
+        self.buffer = state.audio_buffer
+        if self.samplerate != config.SAMPLE_RATE_TTS:
+            self.buffer.configure(
+                self.samplerate * getattr(config, 'PLAYBACK_BUFFER_SECONDS', 60),
+                PolyphaseResampler(config.SAMPLE_RATE_TTS, self.samplerate)
+            )
+        fade_len = max(1, int(self.samplerate * getattr(config, 'PLAYBACK_FADE_MS', 10) / 1000))
+        self._fade_in = np.linspace(0, 1, fade_len, dtype=np.float32)
+        self._fade_out = self._fade_in[::-1].copy()
+
+        # Adaptive pre-roll: grows after an underrun, decays slowly after clean phrases
+        self._min_threshold = self.blocksize // 2
+        self._max_threshold = self.samplerate
+        self._start_threshold = self.blocksize
         self._has_started_playing = False
+        self._is_starting_phrase = True
+        self._phrase_underruns = 0
+
+        self.underruns = 0
+
+        # What actually reached the speaker, for the mic-side echo canceller
+        self.echo_reference = EchoReference(self.samplerate) if getattr(config, 'AEC_ENABLED', False) else None
+        self._output_latency = getattr(self.stream, 'latency', 0) or 0
+
+        # Software mixer: speech (the ring) plus any number of one-shot earcon voices
+        self.earcons = {}
+        self._voices = []
+        self._mix = np.zeros(self.blocksize, dtype=np.float32)
+        self._scratch = np.zeros(self.blocksize, dtype=np.float32)
+        self.speech_gain = getattr(config, 'SPEECH_GAIN', 1.0)
+        self.earcon_gain = getattr(config, 'EARCON_GAIN', 0.5)
+        self.duck_gain = getattr(config, 'EARCON_DUCK_GAIN', 0.35)
 
     def start(self):
         self.stream.start()
-        print(f"{Fore.LIGHTBLACK_EX}[SYSTEM] Audio Output Started @ {self.samplerate}Hz{Style.RESET_ALL}")
+        resampled = f" (from {config.SAMPLE_RATE_TTS}Hz)" if self.buffer.resampler else ""
+        print(f"{Fore.LIGHTBLACK_EX}[SYSTEM] Audio Output Started @ {self.samplerate}Hz{resampled}{Style.RESET_ALL}")
+
+    @property
+    def overruns(self):
+        return self.buffer.overruns
+
+    def stats(self):
+        return {
+            "underruns": self.underruns,
+            "overruns": self.buffer.overruns,
+            "start_threshold_ms": round(self._start_threshold / self.samplerate * 1000),
+            "buffered_ms": round(self.buffer.available() / self.samplerate * 1000),
+        }
+
+    def _fade(self, samples, ramp):
+        n = min(samples.shape[0], ramp.shape[0])
+        np.multiply(samples[:n], ramp[:n], out=samples[:n], casting='unsafe')
 
-    def _apply_fade(self, audio_array, direction='in'):
-        length = len(audio_array)
-        ramp = np.linspace(0, 1, length) if direction == 'in' else np.linspace(1, 0, length)
-        return (audio_array * ramp).astype(np.int16)
+    def _end_phrase(self):
+        state.IS_SPEAKING = False
+        state.last_speech_time = time.time()
+        self._is_starting_phrase = True
+        self._has_started_playing = False
+        if not self._phrase_underruns:
+            self._start_threshold = max(self._min_threshold, int(self._start_threshold * 0.9))
+        self._phrase_underruns = 0
 
     def _callback(self, outdata, frames, time_info, status):
-        bytes_needed = frames * 2
-        output = b''
+        out = outdata[:, 0]
+        speech = self._fill_speech(out, frames)
+        if self._voices:
+            self._mix_earcons(out, frames, speech)
+        if self.echo_reference is not None:
+            self.echo_reference.push(out, time.perf_counter() + self._output_latency)
+
+    def _fill_speech(self, out, frames):
+        """Copies the next block of TTS audio into `out`. Returns the number of speech samples."""
+        available = self.buffer.available()
 
         if not self._has_started_playing:
-            if state.audio_queue.qsize() >= self._buffer_threshold:
+            # Start once enough is buffered, or the producer has finished and this is all there is
+            if available >= self._start_threshold or (available and not self.buffer.has_writers):
                 self._has_started_playing = True
             else:
-                outdata.fill(0)
-                return
+                out.fill(0)
+                if state.IS_SPEAKING and not available and not self.buffer.has_writers:
+                    self._end_phrase()
+                return 0
 
-        try:
-            while len(output) < bytes_needed:
-                if self._leftover_data:
-                    chunk = self._leftover_data
-                    self._leftover_data = b''
-                else:
-                    chunk = state.audio_queue.get_nowait()
-                output += chunk
-
-            if len(output) > bytes_needed:
-                self._leftover_data = output[bytes_needed:]
-                output = output[:bytes_needed]
-            
-            state.IS_SPEAKING = True
-            audio_array = np.frombuffer(output, dtype='int16')
-
-            if self._is_starting_phrase:
-                audio_array = self._apply_fade(audio_array, 'in')
-                self._is_starting_phrase = False
-
-            outdata[:] = audio_array.reshape(-1, 1)
-
-        except queue.Empty:
-            if len(output) > 0:
-                padding = bytes_needed - len(output)
-                output += b'\x00' * padding
-                outdata[:] = np.frombuffer(output, dtype='int16').reshape(-1, 1)
+        n = self.buffer.read_into(out)
+
+        if n == 0:
+            out.fill(0)
+            if self.buffer.has_writers:
+                self._underrun()
             else:
-                outdata.fill(0)
-                
-                if state.IS_SPEAKING:
-                    state.IS_SPEAKING = False
-                    state.last_speech_time = time.time() 
-                    self._is_starting_phrase = True
-                    self._has_started_playing = False
+                self._end_phrase()
+            return 0
+
+        state.IS_SPEAKING = True
+        if self._is_starting_phrase:
+            self._fade(out[:n], self._fade_in)
+            self._is_starting_phrase = False
+
+        if n < frames:
+            tail = out[max(0, n - self._fade_out.shape[0]):n]
+            self._fade(tail, self._fade_out[-tail.shape[0]:])
+            out[n:] = 0
+            if self.buffer.has_writers:
+                self._underrun()
+        return n
+
+    # --- Earcons ---
+    def load_earcon(self, name, path):
+        """Decodes a sound file once into PCM at the output rate. Safe to call from a worker thread."""
+        pcm = decode_to_pcm(path, self.samplerate)
+        if pcm is None:
+            print(f"{Fore.YELLOW}[AUDIO] Could not decode earcon '{name}' ({path}){Style.RESET_ALL}")
+            return False
+        self.earcons[name] = pcm.astype(np.float32)
+        return True
+
+    def play_earcon(self, name, gain=None):
+        """Mixes a preloaded earcon over whatever is playing. Never touches the speech ring."""
+        pcm = self.earcons.get(name)
+        if pcm is None:
+            return False
+        self._voices.append(_Voice(pcm, self.earcon_gain if gain is None else gain))
+        return True
+
+    def _mix_earcons(self, out, frames, speech):
+        if self._mix.shape[0] < frames:
+            self._mix = np.zeros(frames, dtype=np.float32)
+            self._scratch = np.zeros(frames, dtype=np.float32)
+        mix = self._mix[:frames]
+        np.multiply(out, self.speech_gain, out=mix, casting='unsafe')
+        # Earcons duck under speech rather than waiting for it to finish
+        duck = self.duck_gain if speech else 1.0
+
+        for voice in list(self._voices):
+            m = min(frames, voice.pcm.shape[0] - voice.pos)
+            # Scaled in place: no allocation on the PortAudio callback
+            scratch = self._scratch[:m]
+            np.multiply(voice.pcm[voice.pos:voice.pos + m], voice.gain * duck, out=scratch)
+            np.add(mix[:m], scratch, out=mix[:m])
+            voice.pos += m
+            if voice.pos >= voice.pcm.shape[0]:
+                self._voices.remove(voice)
+
+        np.clip(mix, -32768, 32767, out=mix)
+        np.copyto(out, mix, casting='unsafe')
+
+    def _underrun(self):
+        """Producer is still streaming but the ring ran dry: re-buffer with a larger pre-roll."""
+        self.underruns += 1
+        self._phrase_underruns += 1
+        self._start_threshold = min(self._max_threshold, int(self._start_threshold * 1.5))
+        self._has_started_playing = False
+        self._is_starting_phrase = True
 
     def stop(self):
         self.stream.stop()
@@ -110,58 +256,133 @@ class Microphone:
                 # keywords=["computer"]
                 keyword_paths=[config.KEYWORD_FILE_PATH] 
             )
-            self.pcm_buffer = [] 
+            self.frames = FrameAssembler(self.porcupine.frame_length, capacity=config.BLOCK_SIZE * 2)
             print(f"{Fore.GREEN}[SYSTEM] Wake Word Active: 'Hey Chip'{Style.RESET_ALL}")
         except Exception as e:
             print(f"{Fore.RED}[ERROR] Porcupine Init Failed: {e}{Style.RESET_ALL}")
             self.porcupine = None
+            self.frames = None
+
+        self.vad = VadGate() if getattr(config, 'VAD_ENABLED', True) else None
+
+        # Raw blocks from the PortAudio callback -> wake-word / forwarding worker
+        self._blocks = queue.Queue(maxsize=getattr(config, 'MIC_QUEUE_BLOCKS', 32))
+        self.overflows = 0
+        self.dropped_blocks = 0
+        self.resampler = None   # device rate -> SAMPLE_RATE_MIC, set once the stream is opened
+        self.aec = None         # set when the output engine provides an echo reference
+        self.echo_reference = None
+        self._input_latency = 0
 
     def start(self, device_index):
         asyncio.create_task(self._mic_loop(device_index))
 
+    def stats(self):
+        stats = {"overflows": self.overflows, "dropped_blocks": self.dropped_blocks}
+        if self.vad: stats["vad"] = self.vad.stats()
+        if self.aec: stats["aec"] = {**self.aec.stats(), "resyncs": self.echo_reference.resyncs}
+        return stats
+
+    def _forward(self, loop, block):
+        if self.vad:
+            self.vad.hold = state.stt_turn_open
+            data = self.vad.process(block)
+            if data is None:
+                return
+        else:
+            data = block.tobytes()
+        loop.call_soon_threadsafe(state.mic_queue.put_nowait, data)
+
+    def _cancel_echo(self, block, captured_at):
+        # The callback fires once a block is complete, so its first sample reached the mic a block earlier
+        starts_at = captured_at - self._input_latency - block.shape[0] / config.SAMPLE_RATE_MIC
+        starts_at += getattr(config, 'AEC_DELAY_MS', 0) / 1000
+        return self.aec.process(block, self.echo_reference.read(starts_at, block.shape[0]))
+
+    def _detect_wake_word(self, block):
+        for frame in self.frames.push(block):
+            if self.porcupine.process(frame) >= 0:
+                self.frames.reset()
+                return True
+        return False
+
+    def _worker(self, loop):
+        """Runs Porcupine and forwards audio off the realtime thread."""
+        # This variable tracks the "silence" window
+        ignore_audio_until = 0
+        reported_overflows = 0
+
+        while True:
+            item = self._blocks.get()
+            if item is None:
+                return
+            block, captured_at = item
+            if self.resampler:
+                block = self.resampler.process(block)
+            if self.aec:
+                block = self._cancel_echo(block, captured_at)
+
+            if self.overflows != reported_overflows:
+                reported_overflows = self.overflows
+                print(f"{Fore.YELLOW}[AUDIO] Mic input overflow (total: {reported_overflows}){Style.RESET_ALL}")
+
+            now = time.time()
+            time_since_active = now - getattr(state, 'last_speech_time', 0)
+
+            if state.IS_SPEAKING or time_since_active < 10.0:
+                # Conversation window already open: wake word is irrelevant, skip Porcupine
+                if now > ignore_audio_until:
+                    self._forward(loop, block)
+                continue
+
+            if self.porcupine and self._detect_wake_word(block):
+                print(f"{Fore.YELLOW}[WAKE WORD] Detected!{Style.RESET_ALL}")
+                state.last_speech_time = time.time()
+                ignore_audio_until = time.time() + 0.7
+                if self.vad: self.vad.reset()
+
     async def _mic_loop(self, device_index):
         loop = asyncio.get_running_loop()
-        
-        # This variable tracks the "silence" window
-        ignore_audio_until = 0 
-        
-        def callback(indata, frames, time_info, status):
-            nonlocal ignore_audio_until 
 
-            if state.IS_SPEAKING:
+        def callback(indata, frames, time_info, status):
+            if status.input_overflow:
+                self.overflows += 1
+            if state.IS_SPEAKING and not self.aec:
+                # Without echo cancellation the mic would just hear Chip talking
                 return
+            try:
+                self._blocks.put_nowait((indata[:, 0].copy(), time.perf_counter()))
+            except queue.Full:
+                self.dropped_blocks += 1
+
+        samplerate = native_samplerate(device_index, 'input', config.SAMPLE_RATE_MIC)
+        if samplerate != config.SAMPLE_RATE_MIC:
+            self.resampler = PolyphaseResampler(samplerate, config.SAMPLE_RATE_MIC)
+            print(f"{Fore.LIGHTBLACK_EX}[SYSTEM] Mic @ {samplerate}Hz, resampled to {config.SAMPLE_RATE_MIC}Hz{Style.RESET_ALL}")
 
-            if self.porcupine:
-                pcm_chunk = struct.unpack_from("h" * frames, indata)
-                self.pcm_buffer.extend(pcm_chunk)
-                while len(self.pcm_buffer) >= self.porcupine.frame_length:
-                    frame = self.pcm_buffer[:self.porcupine.frame_length]
-                    self.pcm_buffer = self.pcm_buffer[self.porcupine.frame_length:]
-                    result = self.porcupine.process(frame)
-                    if result >= 0:
-                        print(f"{Fore.YELLOW}[WAKE WORD] Detected!{Style.RESET_ALL}")
-                        
-                        state.last_speech_time = time.time()
-                        
-                        ignore_audio_until = time.time() + 0.7
-                        return
-
-            time_since_active = time.time() - getattr(state, 'last_speech_time', 0)
-            
-            if time_since_active < 10.0:
-                if time.time() > ignore_audio_until:
-                    loop.call_soon_threadsafe(state.mic_queue.put_nowait, indata.tobytes())
-
-        with sd.InputStream(
-            device=device_index, 
-            channels=1, 
-            samplerate=config.SAMPLE_RATE_MIC, 
-            dtype='int16', 
-            blocksize=config.BLOCK_SIZE,
-            callback=callback
-        ):
-            while True:
-                await asyncio.sleep(1)
+        reference = getattr(state.audio_engine, 'echo_reference', None)
+        if reference is not None:
+            self.echo_reference = reference
+            self.aec = EchoCanceller(config.SAMPLE_RATE_MIC)
+            state.echo_canceller = self.aec
+
+        worker = threading.Thread(target=self._worker, args=(loop,), daemon=True)
+        worker.start()
+
+        try:
+            with sd.InputStream(
+                device=device_index, 
+                channels=1, 
+                samplerate=samplerate, 
+                dtype='int16', 
+                blocksize=int(config.BLOCK_SIZE * samplerate / config.SAMPLE_RATE_MIC),
+                callback=callback
+            ) as stream:
+                self._input_latency = getattr(stream, 'latency', 0) or 0
+                while True:
+                    await asyncio.sleep(1)
+        finally:
+            self._blocks.put(None)
                 
 def select_microphone():    
     preferred = getattr(config, "PREFERRED_INPUT_DEVICE", None)
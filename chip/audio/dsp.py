@@ -0,0 +1,215 @@
+import time
+import struct
+import numpy as np
+
+from chip.utils import config
+
+INT16_MAX = 32767
+INT16_MIN = -32768
+
+def dbfs_to_linear(db):
+    return 10.0 ** (db / 20.0)
+
+class MicProcessor:
+    """
+    Vectorised mic conditioning for the STT uplink.
+    Chain: DC/high-pass -> fixed gain -> AGC -> noise gate -> saturating clip.
+    All scratch buffers are preallocated; process() never builds Python lists.
+    """
+    SUB_BLOCK = 256     # samples per closed-form IIR step (keeps a^-n well conditioned)
+    FRAME_MS = 10       # gate / AGC analysis frame
+
+    def __init__(self, samplerate=None, gain=None, highpass_hz=None, gate_dbfs=None,
+                 agc=None, agc_target_dbfs=None, agc_max_gain_db=None):
+        self.samplerate = samplerate or config.SAMPLE_RATE_MIC
+        self.gain = gain if gain is not None else getattr(config, 'MIC_GAIN', 1.0)
+        self.highpass_hz = highpass_hz if highpass_hz is not None else getattr(config, 'MIC_HIGHPASS_HZ', 0)
+        self.gate_dbfs = gate_dbfs if gate_dbfs is not None else getattr(config, 'MIC_NOISE_GATE_DBFS', None)
+        self.agc = agc if agc is not None else getattr(config, 'MIC_AGC', False)
+        agc_target = agc_target_dbfs if agc_target_dbfs is not None else getattr(config, 'MIC_AGC_TARGET_DBFS', -22)
+        agc_max_db = agc_max_gain_db if agc_max_gain_db is not None else getattr(config, 'MIC_AGC_MAX_GAIN_DB', 20)
+
+        # High-pass state (one-pole DC blocker: y[n] = a * (y[n-1] + x[n] - x[n-1]))
+        self._hp_a = 0.0
+        if self.highpass_hz and self.highpass_hz > 0:
+            rc = 1.0 / (2 * np.pi * self.highpass_hz)
+            dt = 1.0 / self.samplerate
+            self._hp_a = rc / (rc + dt)
+            n = np.arange(self.SUB_BLOCK, dtype=np.float64)
+            self._hp_pow_neg = self._hp_a ** (-n)
+            self._hp_pow_pos = self._hp_a ** (n + 1)
+        self._hp_prev_x = 0.0
+        self._hp_prev_y = 0.0
+
+        # Gate / AGC state
+        self._frame_len = max(1, self.samplerate * self.FRAME_MS // 1000)
+        self._gate_thresh = dbfs_to_linear(self.gate_dbfs) * INT16_MAX if self.gate_dbfs is not None else None
+        self._gate_floor = dbfs_to_linear(getattr(config, 'MIC_NOISE_GATE_FLOOR_DB', -30))
+        self._gate_hold = max(1, int(getattr(config, 'MIC_NOISE_GATE_HOLD_MS', 200) / self.FRAME_MS))
+        self._gate_history = np.zeros(self._gate_hold - 1, dtype=bool)
+        self._gate_last_gain = 1.0
+        self._agc_target = dbfs_to_linear(agc_target) * INT16_MAX
+        self._agc_max = dbfs_to_linear(agc_max_db)
+        self._agc_gain = 1.0
+
+        self._work = np.empty(0, dtype=np.float64)
+        self._diff = np.empty(0, dtype=np.float64)
+        self._out = np.empty(0, dtype=np.int16)
+
+    def _ensure_capacity(self, n):
+        if self._work.shape[0] < n:
+            self._work = np.empty(n, dtype=np.float64)
+            self._diff = np.empty(n, dtype=np.float64)
+            self._out = np.empty(n, dtype=np.int16)
+
+    def reset(self):
+        self._hp_prev_x = self._hp_prev_y = 0.0
+        self._gate_history[:] = False
+        self._gate_last_gain = 1.0
+        self._agc_gain = 1.0
+
+    def _highpass(self, x):
+        """One-pole high-pass solved in closed form per sub-block, so there is no per-sample Python loop."""
+        n = x.shape[0]
+        d = self._diff[:n]
+        d[0] = x[0] - self._hp_prev_x
+        np.subtract(x[1:], x[:-1], out=d[1:])
+        self._hp_prev_x = x[-1]
+
+        prev_y = self._hp_prev_y
+        step = self.SUB_BLOCK
+        for start in range(0, n, step):
+            seg = d[start:start + step]
+            m = seg.shape[0]
+            # y[k] = a^(k+1) * (y[-1] + sum_j a^-j * d[j])
+            seg *= self._hp_pow_neg[:m]
+            np.cumsum(seg, out=seg)
+            seg += prev_y
+            seg *= self._hp_pow_pos[:m]
+            prev_y = seg[-1]
+        self._hp_prev_y = prev_y
+        x[:] = d
+
+    def _frame_rms(self, x):
+        fl = self._frame_len
+        whole = (x.shape[0] // fl) * fl
+        if whole == 0:
+            return np.sqrt(np.mean(x * x, keepdims=True))
+        frames = x[:whole].reshape(-1, fl)
+        rms = np.sqrt(np.einsum('ij,ij->i', frames, frames) / fl)
+        if whole < x.shape[0]:
+            tail = x[whole:]
+            rms = np.append(rms, np.sqrt(np.mean(tail * tail)))
+        return rms
+
+    def _ramp(self, x, gains):
+        """Applies per-frame gains with linear interpolation between frame centres."""
+        fl = self._frame_len
+        n = x.shape[0]
+        centres = np.arange(gains.shape[0]) * fl + fl / 2.0
+        pos = np.arange(n, dtype=np.float64)
+        x *= np.interp(pos, np.concatenate(([-fl / 2.0], centres)), np.concatenate(([self._gate_last_gain], gains)))
+
+    def _agc_step(self, rms, voiced):
+        if not voiced.any():
+            return
+        level = float(np.sqrt(np.mean(rms[voiced] ** 2)))
+        if level <= 1.0:
+            return
+        desired = min(max(self._agc_target / level, 1.0 / self._agc_max), self._agc_max)
+        # Fast attack when we need to pull gain down (clipping risk), slow release upwards.
+        rate = 0.5 if desired < self._agc_gain else 0.1
+        self._agc_gain += (desired - self._agc_gain) * rate
+
+    def process(self, samples):
+        """
+        Processes an int16 block. Writes in place when the array is writable,
+        otherwise into an internal reusable buffer. Returns the processed int16 view.
+        """
+        n = samples.shape[0]
+        if n == 0:
+            return samples
+        self._ensure_capacity(n)
+        work = self._work[:n]
+        np.copyto(work, samples.reshape(-1), casting='unsafe')
+
+        if self._hp_a:
+            self._highpass(work)
+
+        total_gain = self.gain
+        rms = None
+        if self.agc or self._gate_thresh is not None:
+            rms = self._frame_rms(work) * self.gain
+
+        if rms is not None and self._gate_thresh is not None:
+            voiced = rms > self._gate_thresh
+        elif rms is not None:
+            voiced = rms > dbfs_to_linear(-60) * INT16_MAX
+        else:
+            voiced = None
+
+        if self.agc:
+            agc_before = self._agc_gain
+            self._agc_step(rms, voiced)
+            if agc_before != self._agc_gain:
+                work *= np.linspace(agc_before, self._agc_gain, n)
+            else:
+                total_gain *= self._agc_gain
+
+        if self._gate_thresh is not None:
+            flags = np.concatenate((self._gate_history, voiced))
+            # Hold: a frame stays open if any of the previous `hold` frames was voiced
+            held = np.convolve(flags.astype(np.int8), np.ones(self._gate_hold, dtype=np.int8), mode='valid') > 0
+            gains = np.where(held, 1.0, self._gate_floor)
+            self._ramp(work, gains)
+            self._gate_history = flags[-(self._gate_hold - 1):] if self._gate_hold > 1 else self._gate_history
+            self._gate_last_gain = float(gains[-1])
+
+        if total_gain != 1.0:
+            work *= total_gain
+        np.clip(work, INT16_MIN, INT16_MAX, out=work)
+
+        out = samples if samples.flags.writeable and samples.dtype == np.int16 else self._out[:n]
+        np.copyto(out.reshape(-1), work, casting='unsafe')
+        return out
+
+def _legacy_struct_gain(data, gain):
+    count = len(data) // 2
+    fmt = f"{count}h"
+    samples = list(struct.unpack(fmt, data))
+    boosted = [max(min(int(s * gain), 32767), -32768) for s in samples]
+    return struct.pack(fmt, *boosted)
+
+def benchmark(blocks=200, block_size=None):
+    """Per-block cost of the legacy struct loop vs. the vectorised chain."""
+    block_size = block_size or config.BLOCK_SIZE
+    rng = np.random.default_rng(0)
+    block = (rng.standard_normal(block_size) * 3000).astype(np.int16)
+    data = block.tobytes()
+    block_ms = block_size / config.SAMPLE_RATE_MIC * 1000
+
+    t0 = time.perf_counter()
+    for _ in range(blocks):
+        _legacy_struct_gain(data, 3.0)
+    legacy = (time.perf_counter() - t0) / blocks * 1e6
+
+    results = {"legacy_struct_gain": legacy}
+    variants = {
+        "gain_only": dict(gain=3.0, highpass_hz=0, gate_dbfs=None, agc=False),
+        "gain_highpass": dict(gain=3.0, highpass_hz=80, gate_dbfs=None, agc=False),
+        "full_chain": dict(gain=3.0, highpass_hz=80, gate_dbfs=-55, agc=True),
+    }
+    for name, kwargs in variants.items():
+        proc = MicProcessor(**kwargs)
+        t0 = time.perf_counter()
+        for _ in range(blocks):
+            proc.process(np.frombuffer(data, dtype=np.int16)).tobytes()
+        results[name] = (time.perf_counter() - t0) / blocks * 1e6
+
+    print(f"Block: {block_size} samples ({block_ms:.0f} ms @ {config.SAMPLE_RATE_MIC}Hz), {blocks} iterations")
+    for name, us in results.items():
+        print(f"  {name:<20} {us:>10.1f} us/block  ({us / 1000 / block_ms * 100:.3f}% of realtime)  x{legacy / us:.1f}")
+    return results
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,264 @@
+import sys
+import threading
+import time
+from collections import deque
+import numpy as np
+
+from chip.utils import config
+from chip.audio.resample import PolyphaseResampler
+
+class EchoCanceller:
+    """
+    Partitioned-block frequency-domain NLMS echo canceller (MDF).
+    The far-end (playback) signal is filtered through an adaptive estimate of
+    the speaker->mic path and subtracted from the mic. Adaptation freezes
+    during double talk (Geigel detector with hangover) so the user's own
+    voice doesn't bend the filter, and a light residual suppressor trims
+    what the linear filter leaves while only Chip is talking.
+    """
+    def __init__(self, samplerate=None, filter_ms=None, block=256, mu=0.8, dtd_ratio=0.6,
+                 dtd_hold_ms=120, residual_gain=None, near_end_ms=100):
+        self.samplerate = samplerate or config.SAMPLE_RATE_MIC
+        self.block = block
+        self.mu = mu
+        self.dtd_ratio = dtd_ratio
+        self.residual_gain = residual_gain if residual_gain is not None else getattr(config, 'AEC_RESIDUAL_GAIN', 0.3)
+        filter_ms = filter_ms or getattr(config, 'AEC_FILTER_MS', 128)
+        self.partitions = max(1, int(np.ceil(self.samplerate * filter_ms / 1000 / block)))
+        self._dtd_hold = max(1, int(dtd_hold_ms / 1000 * self.samplerate / block))
+        self._dtd_reset = int(self.samplerate / block)     # 1 s
+        self._near_end_blocks = max(1, int(near_end_ms / 1000 * self.samplerate / block))
+        self.reset()
+
+    def reset(self):
+        B, P = self.block, self.partitions
+        self._W = np.zeros((P, B + 1), dtype=np.complex128)
+        self._X = np.zeros((P, B + 1), dtype=np.complex128)
+        self._power = np.full(B + 1, 1e4)
+        self._x_prev = np.zeros(B)
+        self._far_peaks = deque([0.0] * (P + 1), maxlen=P + 1)
+        self._dt_hangover = 0
+        self._dt_run = 0
+        self._pending_mic = np.zeros(0, dtype=np.float64)
+        self._pending_ref = np.zeros(0, dtype=np.float64)
+        self._mic_energy = 0.0
+        self._err_energy = 0.0
+        self.blocks = 0
+        self.double_talk_blocks = 0
+        self._near_run = 0
+        self.near_end_at = None     # perf_counter() of the last sustained near-end speech over playback
+
+    def _step(self, d, x):
+        B = self.block
+        X = np.fft.rfft(np.concatenate((self._x_prev, x)))
+        self._x_prev = x
+        self._X[1:] = self._X[:-1]
+        self._X[0] = X
+
+        y = np.fft.irfft((self._W * self._X).sum(axis=0))[B:]
+        e = d - y
+
+        # Double talk: Geigel (near-end louder than recent far-end peaks) until the filter has
+        # converged, then also a sudden jump of the residual relative to the mic signal
+        self._far_peaks.append(np.abs(x).max())
+        far_peak = max(self._far_peaks)
+        far_active = far_peak > 64
+        near_talk = np.abs(d).max() > self.dtd_ratio * far_peak
+        mic_energy = float(np.dot(d, d))
+        if not near_talk and self.erle_db > 10 and mic_energy > B * 64 ** 2:
+            near_talk = float(np.dot(e, e)) > 0.25 * mic_energy
+        self._near_run = self._near_run + 1 if near_talk and far_active else 0
+        if self._near_run >= self._near_end_blocks:
+            # Single-block detections are common while converging; the user talking lasts
+            self.near_end_at = time.perf_counter()
+        if near_talk and far_active:
+            self._dt_hangover = self._dtd_hold
+            self._dt_run += 1
+            if self._dt_run > self._dtd_reset:
+                # "Double talk" that never ends is really a changed echo path: re-converge
+                self._mic_energy = self._err_energy = 0.0
+                self._dt_run = self._dt_hangover = 0
+        elif self._dt_hangover:
+            self._dt_hangover -= 1
+        if not near_talk and mic_energy > B * 64 ** 2:
+            # Only a confidently echo-only block ends a double-talk run; quiet gaps don't count
+            self._dt_run = 0
+        double_talk = self._dt_hangover > 0
+
+        self._power = 0.9 * self._power + 0.1 * (X.real ** 2 + X.imag ** 2)
+        if far_active and not double_talk:
+            E = np.fft.rfft(np.concatenate((np.zeros(B), e)))
+            # Step is shared across partitions, otherwise longer filters take proportionally bigger steps
+            G = (self.mu / self.partitions / (self._power + 1e3)) * np.conj(self._X) * E
+            # Gradient constraint: keep each partition a causal, B-tap filter
+            g = np.fft.irfft(G, axis=1)[:, :B]
+            self._W += np.fft.rfft(np.concatenate((g, np.zeros_like(g)), axis=1), axis=1)
+
+            self._mic_energy = 0.95 * self._mic_energy + 0.05 * float(np.dot(d, d))
+            self._err_energy = 0.95 * self._err_energy + 0.05 * float(np.dot(e, e))
+            e = e * self.residual_gain
+
+        self.blocks += 1
+        self.double_talk_blocks += double_talk
+        return e
+
+    def process(self, mic, ref):
+        """
+        Cancels `ref` (what was playing, aligned to `mic`, same rate) out of
+        `mic`. Works in whole blocks; any remainder is carried to the next
+        call, so the output can be up to block-1 samples shorter than the input.
+        """
+        self._pending_mic = np.concatenate((self._pending_mic, mic.astype(np.float64)))
+        self._pending_ref = np.concatenate((self._pending_ref, ref.astype(np.float64)))
+        n = min(self._pending_mic.shape[0], self._pending_ref.shape[0]) // self.block * self.block
+        out = np.empty(n)
+        for i in range(0, n, self.block):
+            out[i:i + self.block] = self._step(self._pending_mic[i:i + self.block], self._pending_ref[i:i + self.block])
+        self._pending_mic = self._pending_mic[n:]
+        self._pending_ref = self._pending_ref[n:]
+        np.clip(out, -32768, 32767, out=out)
+        return out.astype(np.int16)
+
+    @property
+    def erle_db(self):
+        """Echo return loss enhancement of the linear filter while only the far end is active."""
+        if not self._err_energy:
+            return 0.0
+        return float(10 * np.log10(max(self._mic_energy, 1e-9) / self._err_energy))
+
+    def stats(self):
+        return {
+            "erle_db": round(self.erle_db, 1),
+            "double_talk_pct": round(100 * self.double_talk_blocks / max(1, self.blocks), 1),
+        }
+
+class EchoReference:
+    """
+    Playback history for the echo canceller. The output callback pushes what
+    it plays (device rate) with the time it reaches the speaker; the mic
+    worker reads the matching span, resampled to the mic rate. Reads follow a
+    contiguous cursor and only re-align on drift, so the adaptive filter sees
+    a stable delay.
+    """
+    RESYNC_MS = 20
+
+    def __init__(self, samplerate, out_rate=None, seconds=2.0):
+        self.samplerate = samplerate
+        self.out_rate = out_rate or config.SAMPLE_RATE_MIC
+        self._buf = np.zeros(int(samplerate * seconds), dtype=np.int16)
+        self._lock = threading.Lock()
+        self._written = 0
+        self._anchor = None              # (sample index, time it plays) of the newest block
+        self._resampler = PolyphaseResampler(samplerate, self.out_rate)
+        self._cursor = None              # next device-rate sample to feed the resampler
+        self._fifo = np.zeros(0, dtype=np.int16)
+        self._fifo_index = 0.0           # device-rate position of _fifo[0]
+        self.resyncs = 0
+
+    def push(self, block, plays_at):
+        """Realtime side: one copy into the ring."""
+        n = block.shape[0]
+        cap = self._buf.shape[0]
+        with self._lock:
+            start = self._written % cap
+            first = min(n, cap - start)
+            self._buf[start:start + first] = block[:first]
+            self._buf[:n - first] = block[first:]
+            self._anchor = (self._written, plays_at)
+            self._written += n
+
+    def _copy(self, start, n):
+        out = np.zeros(n, dtype=np.int16)
+        cap = self._buf.shape[0]
+        with self._lock:
+            # Anything not played yet, or already overwritten, reads as silence
+            lo, hi = max(start, self._written - cap), min(start + n, self._written)
+            if hi > lo:
+                first = min(hi - lo, cap - lo % cap)
+                out[lo - start:lo - start + first] = self._buf[lo % cap:lo % cap + first]
+                out[lo - start + first:hi - start] = self._buf[:hi - lo - first]
+        return out
+
+    def read(self, starts_at, n):
+        """Reference samples (mic rate) for a mic block whose first sample was captured at `starts_at`."""
+        with self._lock:
+            anchor = self._anchor
+        if anchor is None:
+            return np.zeros(n, dtype=np.int16)
+        expected = anchor[0] + (starts_at - anchor[1]) * self.samplerate
+
+        if self._cursor is None or abs(expected - self._fifo_index) > self.samplerate * self.RESYNC_MS / 1000:
+            self._resampler.reset()
+            # Start the resampler ahead by its own group delay so its output lines up with the mic
+            self._cursor = int(round(expected + self._resampler.delay_ms * self.samplerate / 1000))
+            self._fifo = np.zeros(0, dtype=np.int16)
+            self._fifo_index = expected
+            self.resyncs += 1
+
+        ratio = self.samplerate / self.out_rate
+        while self._fifo.shape[0] < n:
+            need = int(np.ceil((n - self._fifo.shape[0]) * ratio)) + 1
+            self._fifo = np.concatenate((self._fifo, self._resampler.process(self._copy(self._cursor, need))))
+            self._cursor += need
+
+        out = self._fifo[:n]
+        self._fifo = self._fifo[n:]
+        self._fifo_index += n * ratio
+        return out
+
+def evaluate(pairs, block_size=None):
+    """
+    Offline ERLE over recorded (far, near) WAV pairs: far is what the speaker
+    played, near is what the mic heard at the same time. ERLE is measured
+    over far-end-only stretches after the first second of convergence.
+    """
+    from chip.audio.vad import read_wav
+    samplerate = config.SAMPLE_RATE_MIC
+    block_size = block_size or config.BLOCK_SIZE
+    for far_path, near_path in pairs:
+        far, near = read_wav(far_path, samplerate), read_wav(near_path, samplerate)
+        _report(f"{far_path} -> {near_path}", far, near, samplerate, block_size)
+
+def _report(name, far, near, samplerate, block_size):
+    n = min(far.shape[0], near.shape[0])
+    aec = EchoCanceller(samplerate, residual_gain=1.0)   # measure the linear filter on its own
+    started = time.perf_counter()
+    out = np.concatenate([aec.process(near[i:i + block_size], far[i:i + block_size]) for i in range(0, n, block_size)])
+    cpu_ms = (time.perf_counter() - started) * 1000 / (n / samplerate)
+
+    frame = aec.block
+    skip = samplerate // frame
+    count = out.shape[0] // frame
+    d = near[:count * frame].astype(np.float64).reshape(count, frame)[skip:]
+    e = out[:count * frame].astype(np.float64).reshape(count, frame)[skip:]
+    x = far[:count * frame].astype(np.float64).reshape(count, frame)[skip:]
+    far_only = np.sqrt((x ** 2).mean(axis=1)) > 100
+    if far_only.any():
+        erle = 10 * np.log10((d[far_only] ** 2).sum() / max((e[far_only] ** 2).sum(), 1e-9))
+    else:
+        erle = float("nan")
+    suppression = -20 * np.log10(EchoCanceller(samplerate).residual_gain)
+    print(f"{name}: ERLE {erle:.1f} dB (linear filter) +{suppression:.1f} dB residual suppression, "
+          f"{cpu_ms:.1f} ms CPU per s of audio, double talk {aec.stats()['double_talk_pct']}% of blocks")
+
+def benchmark(seconds=10):
+    """Synthetic check: far-end speech-like signal through a decaying room response plus mic noise."""
+    samplerate = config.SAMPLE_RATE_MIC
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * samplerate)) / samplerate
+    syllables = np.clip(np.sin(2 * np.pi * 3 * t), 0, None)
+    far = rng.standard_normal(t.shape[0]) * syllables * 4000
+    room = rng.standard_normal(int(0.06 * samplerate)) * np.exp(-np.arange(int(0.06 * samplerate)) / (0.012 * samplerate)) * 0.03
+    room = np.concatenate((np.zeros(int(0.008 * samplerate)), room))
+    near = np.convolve(far, room)[:far.shape[0]] + rng.standard_normal(far.shape[0]) * 10
+    _report("synthetic room (68 ms path)", far.astype(np.int16), np.clip(near, -32768, 32767).astype(np.int16),
+            samplerate, config.BLOCK_SIZE)
+
+if __name__ == "__main__":
+    if len(sys.argv) == 1:
+        benchmark()
+    elif len(sys.argv) % 2 == 1:
+        evaluate(list(zip(sys.argv[1::2], sys.argv[2::2])))
+    else:
+        print("Usage: python -m chip.audio.echo_cancel [far.wav near.wav ...]  (no args: synthetic benchmark)")
+        sys.exit(1)
@@ -0,0 +1,87 @@
+import time
+from math import gcd
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+class PolyphaseResampler:
+    """
+    Streaming rational resampler (in_rate -> out_rate) with a Kaiser-windowed
+    sinc prototype split into L polyphase branches. Each block is computed
+    with one gather + einsum; filter history and the output phase are carried
+    across blocks, so block boundaries are seamless.
+    """
+    def __init__(self, in_rate, out_rate, zero_crossings=8, rolloff=0.92, beta=8.0):
+        self.in_rate = int(in_rate)
+        self.out_rate = int(out_rate)
+        g = gcd(self.in_rate, self.out_rate)
+        self.up = self.out_rate // g
+        self.down = self.in_rate // g
+
+        L, M = self.up, self.down
+        taps = 1 if L == M else -(-2 * zero_crossings * max(L, M) // L)     # per phase, ceil
+        n = taps * L
+        cutoff = rolloff / max(L, M)
+        m = np.arange(n) - (n - 1) / 2.0
+        proto = cutoff * np.sinc(cutoff * m) * np.kaiser(n, beta) * L if n > 1 else np.ones(1)
+
+        # branch p holds proto[p::L], reversed so it lines up with an ascending input window
+        self.taps = taps
+        self._branches = proto.reshape(taps, L).T[:, ::-1].astype(np.float32).copy()
+        self.delay_ms = (n - 1) / 2.0 / (self.in_rate * L) * 1000
+        self.reset()
+
+    def reset(self):
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._next = 0    # upsampled index of the next output sample, relative to the current block start
+
+    def process(self, samples):
+        """Resamples an int16 (or float) block; returns int16."""
+        if self.up == self.down:
+            return samples.astype(np.int16, copy=False)
+        x = samples.astype(np.float32, copy=False).reshape(-1)
+        L, M = self.up, self.down
+        buf = np.concatenate((self._history, x))
+        span = x.shape[0] * L
+
+        if self._next < span:
+            positions = np.arange(self._next, span, M)
+            windows = sliding_window_view(buf, self.taps)[positions // L]
+            out = np.einsum('kt,kt->k', windows, self._branches[positions % L])
+            self._next = positions[-1] + M - span
+        else:
+            out = np.zeros(0, dtype=np.float32)
+            self._next -= span
+
+        self._history = buf[-(self.taps - 1):] if self.taps > 1 else self._history
+        np.clip(out, -32768, 32767, out=out)
+        return out.astype(np.int16)
+
+    def flush(self):
+        """Pushes the filter tail out (end of a stream) and resets state."""
+        tail = self.process(np.zeros(self.taps, dtype=np.float32))
+        self.reset()
+        return tail
+
+def benchmark(seconds=10, block_ms=100):
+    pairs = [(48000, 16000), (44100, 16000), (16000, 16000), (24000, 48000), (24000, 44100)]
+    print(f"{'conversion':<18}{'taps/phase':>11}{'cpu ms / s audio':>18}{'added latency':>15}{'sine SNR':>10}")
+    for in_rate, out_rate in pairs:
+        r = PolyphaseResampler(in_rate, out_rate)
+        t = np.arange(int(in_rate * seconds)) / in_rate
+        tone = (np.sin(2 * np.pi * 440 * t) * 12000).astype(np.int16)
+        block = int(in_rate * block_ms / 1000)
+
+        started = time.perf_counter()
+        out = np.concatenate([r.process(tone[i:i + block]) for i in range(0, tone.shape[0], block)])
+        cpu = (time.perf_counter() - started) * 1000 / seconds
+
+        # Compare the steady-state middle against an ideal tone shifted by the filter delay
+        ts = np.arange(out.shape[0]) / out_rate - r.delay_ms / 1000
+        ideal = np.sin(2 * np.pi * 440 * ts) * 12000
+        mid = slice(out_rate, out.shape[0] - out_rate)
+        err = out[mid] - ideal[mid]
+        snr = 10 * np.log10(np.mean(ideal[mid] ** 2) / max(np.mean(err ** 2), 1e-9))
+        print(f"{in_rate}->{out_rate:<10}{r.taps:>11}{cpu:>18.2f}{r.delay_ms:>12.2f} ms{snr:>8.1f} dB")
+
+if __name__ == "__main__":
+    benchmark()
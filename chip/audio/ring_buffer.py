@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import numpy as np
+
+class PcmRingBuffer:
+    """
+    Fixed-capacity int16 ring shared between the TTS producer (event loop)
+    and the PortAudio callback. Reads and writes are at most two memcpys.
+    Positions are monotonic sample counters, so callers can map what has
+    actually been played back to what was written.
+
+    An optional resampler converts producer audio to the device rate on the
+    way in; positions then count device-rate samples.
+    """
+    POLL_INTERVAL = 0.01
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self._buf = np.zeros(self.capacity, dtype=np.int16)
+        self._lock = threading.Lock()
+        self._read_pos = 0
+        self._write_pos = 0
+        self._carry = b''
+        self._writers = 0
+        self.overruns = 0
+        self.resampler = None
+
+    def configure(self, capacity, resampler=None):
+        """Re-sizes the ring for the output device. Only valid before playback starts."""
+        with self._lock:
+            self.capacity = int(capacity)
+            self._buf = np.zeros(self.capacity, dtype=np.int16)
+            self._read_pos = self._write_pos
+            self._carry = b''
+            self.resampler = resampler
+
+    @property
+    def read_pos(self):
+        return self._read_pos
+
+    @property
+    def write_pos(self):
+        return self._write_pos
+
+    def available(self):
+        return self._write_pos - self._read_pos
+
+    def free(self):
+        return self.capacity - self.available()
+
+    def empty(self):
+        return self.available() == 0
+
+    # --- Producer side ---
+    def begin_write(self):
+        """Marks a producer as active so the reader can tell an underrun from the end of a phrase."""
+        with self._lock:
+            self._writers += 1
+
+    def end_write(self):
+        with self._lock:
+            self._writers = max(0, self._writers - 1)
+            self._carry = b''
+            last = self._writers == 0
+        if last and self.resampler is not None:
+            # Push out the filter tail so the end of the phrase isn't clipped
+            self.write(self.resampler.flush())
+
+    @property
+    def has_writers(self):
+        return self._writers > 0
+
+    def _as_samples(self, data):
+        if isinstance(data, np.ndarray):
+            return data.reshape(-1).astype(np.int16, copy=False)
+        if self._carry:
+            data = self._carry + bytes(data)
+            self._carry = b''
+        usable = len(data) & ~1
+        if usable < len(data):
+            self._carry = bytes(data[usable:])
+        return np.frombuffer(data, dtype=np.int16, count=usable // 2)
+
+    def write(self, samples):
+        """Copies as many samples as fit. Returns the count written; a short write is an overrun."""
+        n_in = samples.shape[0]
+        with self._lock:
+            n = min(n_in, self.capacity - (self._write_pos - self._read_pos))
+            if n:
+                start = self._write_pos % self.capacity
+                first = min(n, self.capacity - start)
+                self._buf[start:start + first] = samples[:first]
+                if first < n:
+                    self._buf[:n - first] = samples[first:n]
+                self._write_pos += n
+            if n < n_in:
+                self.overruns += 1
+        return n
+
+    async def put(self, data):
+        """Writes all of `data` (bytes or int16 array), yielding to the loop while the ring is full."""
+        samples = self._as_samples(data)
+        if self.resampler is not None:
+            samples = self.resampler.process(samples)
+        while samples.shape[0]:
+            n = self.write(samples)
+            samples = samples[n:]
+            if samples.shape[0]:
+                await asyncio.sleep(self.POLL_INTERVAL)
+
+    # --- Consumer side ---
+    def read_into(self, out):
+        """Fills `out` (1-D int16 view) from the ring. Returns the number of samples copied."""
+        with self._lock:
+            n = min(out.shape[0], self._write_pos - self._read_pos)
+            if n:
+                start = self._read_pos % self.capacity
+                first = min(n, self.capacity - start)
+                out[:first] = self._buf[start:start + first]
+                if first < n:
+                    out[first:n] = self._buf[:n - first]
+                self._read_pos += n
+        return n
+
+    def clear(self):
+        """Drops everything buffered (barge-in). Positions stay monotonic."""
+        with self._lock:
+            self._read_pos = self._write_pos
+            self._carry = b''
+        if self.resampler is not None:
+            self.resampler.reset()
+
+class FrameAssembler:
+    """
+    Cuts fixed-length frames out of a stream of variable-sized blocks.
+    Frames are yielded as views into an internal buffer (no per-frame copy);
+    a view is only valid until the next call to push().
+    """
+    def __init__(self, frame_length, capacity=None):
+        self.frame_length = int(frame_length)
+        self._buf = np.zeros(capacity or self.frame_length * 4, dtype=np.int16)
+        self._start = 0
+        self._end = 0
+
+    def reset(self):
+        self._start = self._end = 0
+
+    def push(self, block):
+        pending = self._end - self._start
+        if self._start:
+            # Only the sub-frame remainder is moved, never more than frame_length - 1 samples
+            self._buf[:pending] = self._buf[self._start:self._end]
+            self._start, self._end = 0, pending
+        needed = pending + block.shape[0]
+        if needed > self._buf.shape[0]:
+            grown = np.zeros(needed, dtype=np.int16)
+            grown[:pending] = self._buf[:pending]
+            self._buf = grown
+        self._buf[self._end:needed] = block
+        self._end = needed
+
+        fl = self.frame_length
+        while self._end - self._start >= fl:
+            frame = self._buf[self._start:self._start + fl]
+            self._start += fl
+            yield frame
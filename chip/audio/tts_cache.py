@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+import time
+import numpy as np
+from colorama import Fore, Style, init
+
+from chip.utils import config
+
+init(autoreset=True)
+
+class PcmCache:
+    """
+    On-disk, content-addressed cache of synthesised linear16 PCM.
+    Keyed by voice, sample rate and normalised text; entries are played back
+    straight from a memory map. Size-bounded with least-recently-used eviction.
+    Phrases are only recorded once they have been spoken `min_repeats` times,
+    unless they are pinned (fillers and fixed system lines). Those counts are
+    kept for the `max_counts` most recently spoken phrases only.
+
+    All disk writes (audio files, evictions, the index) go through a
+    background writer thread, since put() and save() are called from the
+    event loop mid-stream. Audio still being written is served from memory.
+    """
+    INDEX_FILE = "index.json"
+    SAVE_EVERY = 20
+
+    def __init__(self, directory=None, max_bytes=None, voice=None, samplerate=None, min_repeats=None, max_counts=None):
+        self.directory = directory or getattr(config, 'TTS_CACHE_DIR', os.path.join("data", "tts_cache"))
+        self.max_bytes = max_bytes or int(getattr(config, 'TTS_CACHE_MAX_MB', 64) * 1024 * 1024)
+        self.voice = voice or config.TTS_VOICE
+        self.samplerate = samplerate or config.SAMPLE_RATE_TTS
+        self.min_repeats = min_repeats or getattr(config, 'TTS_CACHE_MIN_REPEATS', 2)
+        self.max_counts = max_counts or getattr(config, 'TTS_CACHE_MAX_COUNTS', 2000)
+        self.pinned = set()
+        self.hits = 0
+        self.misses = 0
+        self._dirty = 0
+        self._unwritten = {}    # key -> PCM bytes queued for the writer
+        self._jobs = queue.Queue()
+        self._writer = None
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._entries, self._counts = self._load_index()
+
+    # --- Index ---
+    def _index_path(self):
+        return os.path.join(self.directory, self.INDEX_FILE)
+
+    def _load_index(self):
+        try:
+            with open(self._index_path(), "r") as f:
+                data = json.load(f)
+            entries = {k: v for k, v in data.get("entries", {}).items() if os.path.exists(self._path(k))}
+            return entries, data.get("counts", {})
+        except (json.JSONDecodeError, IOError):
+            return {}, {}
+
+    def save(self):
+        """Queues an index write; the snapshot is taken now, serialised and written by the writer."""
+        self._prune_counts()
+        self._submit(("index", {k: dict(v) for k, v in self._entries.items()}, dict(self._counts)))
+        self._dirty = 0
+
+    # --- Background writer ---
+    def _submit(self, job):
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+            self._writer.start()
+        self._jobs.put(job)
+
+    def _writer_loop(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            try:
+                self._run_job(*job)
+            except OSError as e:
+                print(f"{Fore.YELLOW}[TTS CACHE] Write failed: {e}{Style.RESET_ALL}")
+
+    def _run_job(self, kind, *args):
+        if kind == "pcm":
+            key, pcm_bytes = args
+            tmp = self._path(key) + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(pcm_bytes[:len(pcm_bytes) & ~1])
+            os.replace(tmp, self._path(key))
+            if self._unwritten.get(key) is pcm_bytes:
+                del self._unwritten[key]
+        elif kind == "remove":
+            try:
+                os.remove(self._path(args[0]))
+            except FileNotFoundError:
+                pass
+        elif kind == "index":
+            entries, counts = args
+            tmp = self._index_path() + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"entries": entries, "counts": counts}, f)
+            os.replace(tmp, self._index_path())
+
+    def close(self, timeout=2.0):
+        """Saves the index and waits for pending writes (call at shutdown)."""
+        self.save()
+        self._jobs.put(None)
+        self._writer.join(timeout)
+
+    def _prune_counts(self):
+        # Insertion order is recency (note() re-inserts), so the oldest phrases go first
+        for key in list(self._counts)[:max(0, len(self._counts) - self.max_counts)]:
+            del self._counts[key]
+
+    def _touch(self):
+        self._dirty += 1
+        if self._dirty >= self.SAVE_EVERY:
+            self.save()
+
+    # --- Keys ---
+    @staticmethod
+    def normalise(text):
+        return re.sub(r"\s+", " ", text.strip())
+
+    def key(self, text):
+        raw = f"{self.voice}|{self.samplerate}|{self.normalise(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pcm")
+
+    # --- Public API ---
+    def pin(self, phrases):
+        self.pinned.update(self.normalise(p) for p in phrases)
+
+    def contains(self, text):
+        return self.key(text) in self._entries
+
+    def get(self, text):
+        """Returns a read-only int16 memmap of the cached audio, or None."""
+        key = self.key(text)
+        entry = self._entries.get(key)
+        if entry is None or not entry["bytes"]:
+            self.misses += 1
+            return None
+        try:
+            unwritten = self._unwritten.get(key)
+            if unwritten is not None:
+                pcm = np.frombuffer(unwritten, dtype=np.int16, count=len(unwritten) // 2)
+            else:
+                pcm = np.memmap(self._path(key), dtype=np.int16, mode="r")
+        except (OSError, ValueError):
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        entry["last_used"] = time.time()
+        self.hits += 1
+        self._touch()
+        return pcm
+
+    def note(self, text):
+        """Counts a spoken phrase. Returns True when it is worth recording to the cache."""
+        text = self.normalise(text)
+        if text in self.pinned:
+            return True
+        key = self.key(text)
+        count = self._counts.pop(key, 0) + 1
+        self._counts[key] = count
+        self._touch()
+        return count >= self.min_repeats
+
+    def put(self, text, pcm_bytes):
+        if not pcm_bytes or len(pcm_bytes) > self.max_bytes:
+            return
+        key = self.key(text)
+        self._unwritten[key] = pcm_bytes
+        self._submit(("pcm", key, pcm_bytes))
+        self._entries[key] = {"text": self.normalise(text)[:120], "bytes": len(pcm_bytes), "last_used": time.time()}
+        self._counts.pop(key, None)     # Cached now: no need to keep counting it
+        self._evict()
+        self.save()
+
+    def _evict(self):
+        total = sum(e["bytes"] for e in self._entries.values())
+        if total <= self.max_bytes:
+            return
+        for key, entry in sorted(self._entries.items(), key=lambda kv: kv[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            self._unwritten.pop(key, None)
+            self._submit(("remove", key))
+            total -= entry["bytes"]
+            del self._entries[key]
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "mb": round(sum(e["bytes"] for e in self._entries.values()) / 1024 / 1024, 2),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    async def warm(self, phrases, synthesize):
+        """Synthesises any missing phrases (sequentially, so boot traffic stays light) and pins them."""
+        self.pin(phrases)
+        missing = [p for p in dict.fromkeys(phrases) if not self.contains(p)]
+        for phrase in missing:
+            try:
+                pcm = await synthesize(phrase)
+                if pcm:
+                    self.put(phrase, pcm)
+            except Exception as e:
+                print(f"{Fore.YELLOW}[TTS CACHE] Warm failed for '{phrase}': {e}{Style.RESET_ALL}")
+        if missing:
+            print(f"{Fore.LIGHTBLACK_EX}[TTS CACHE] Warmed {len(missing)} phrases ({self.stats()['entries']} cached){Style.RESET_ALL}")
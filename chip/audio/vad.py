@@ -0,0 +1,221 @@
+import os
+import sys
+import wave
+from collections import deque
+import numpy as np
+
+from chip.utils import config
+
+class VoiceActivityDetector:
+    """
+    Energy + zero-crossing detector with an adaptive noise floor.
+    Features are computed for a whole block at once; only the per-frame
+    decision (a handful of frames per block) runs in Python.
+    """
+    def __init__(self, samplerate=None, frame_ms=None, threshold_db=None, min_dbfs=None):
+        self.samplerate = samplerate or config.SAMPLE_RATE_MIC
+        self.frame_length = int(self.samplerate * (frame_ms or getattr(config, 'VAD_FRAME_MS', 20)) / 1000)
+        self.threshold_db = threshold_db if threshold_db is not None else getattr(config, 'VAD_THRESHOLD_DB', 9.0)
+        self.min_dbfs = min_dbfs if min_dbfs is not None else getattr(config, 'VAD_MIN_DBFS', -60.0)
+        self.max_zcr = getattr(config, 'VAD_MAX_ZCR', 0.5)
+        self.noise_floor = None
+
+    def features(self, frames):
+        """frames: (n, frame_length) int16. Returns (energy_dbfs, zero_crossing_rate) per frame."""
+        x = frames.astype(np.float32)
+        power = np.einsum('ij,ij->i', x, x) / frames.shape[1]
+        energy = 10.0 * np.log10(power / (32768.0 ** 2) + 1e-12)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frames.shape[1]
+        return energy, zcr
+
+    def decide(self, energy, zcr):
+        if self.noise_floor is None:
+            self.noise_floor = energy
+        above = energy - self.noise_floor
+        speech = energy > self.min_dbfs and (
+            (above > self.threshold_db and zcr < self.max_zcr) or above > 2 * self.threshold_db
+        )
+        if speech:
+            # Slow creep so a step up in background noise is eventually absorbed
+            self.noise_floor += 0.002 * above
+        elif energy < self.noise_floor:
+            self.noise_floor = energy
+        else:
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * energy
+        return speech
+
+class VadGate:
+    """
+    Sits between the Microphone worker and state.mic_queue. Speech frames are
+    forwarded with a short pre-roll so the first phoneme is never clipped, a
+    hangover keeps trailing silence flowing long enough for Flux to close the
+    turn, and everything else is dropped (the STT sender sends keep-alives).
+    While `hold` is set (a Flux turn is open) every frame is forwarded, so
+    Flux's end-of-turn timeout, which runs on audio time, runs in real time.
+    """
+    def __init__(self, samplerate=None, preroll_ms=None, hangover_ms=None, trace=False):
+        self.vad = VoiceActivityDetector(samplerate)
+        fl_ms = self.vad.frame_length * 1000 / self.vad.samplerate
+        preroll_ms = preroll_ms if preroll_ms is not None else getattr(config, 'VAD_PREROLL_MS', 300)
+        hangover_ms = hangover_ms if hangover_ms is not None else getattr(config, 'VAD_HANGOVER_MS', 1500)
+        self._preroll = deque(maxlen=max(1, int(preroll_ms / fl_ms)))
+        self._hangover_frames = int(hangover_ms / fl_ms)
+        self._hang = 0
+        self._active = False
+        self._remainder = np.zeros(0, dtype=np.int16)
+        self.hold = False
+
+        self.frames_total = 0
+        self.frames_forwarded = 0
+        self.onsets = 0
+        self.trace = [] if trace else None
+
+    def reset(self):
+        self._preroll.clear()
+        self._hang = 0
+        self._active = False
+        self._remainder = np.zeros(0, dtype=np.int16)
+
+    def stats(self):
+        dropped = self.frames_total - self.frames_forwarded
+        return {
+            "frames": self.frames_total,
+            "forwarded": self.frames_forwarded,
+            "dropped_pct": round(100 * dropped / self.frames_total, 1) if self.frames_total else 0.0,
+            "onsets": self.onsets,
+        }
+
+    def process(self, block):
+        """Returns the bytes to forward for this int16 block, or None if it was all silence."""
+        fl = self.vad.frame_length
+        if self._remainder.shape[0]:
+            block = np.concatenate((self._remainder, block))
+        whole = (block.shape[0] // fl) * fl
+        self._remainder = block[whole:]
+        if not whole:
+            return None
+
+        frames = block[:whole].reshape(-1, fl)
+        energy, zcr = self.vad.features(frames)
+        out = []
+
+        for i in range(frames.shape[0]):
+            index = self.frames_total
+            self.frames_total += 1
+            if self.vad.decide(energy[i], zcr[i]):
+                self._hang = self._hangover_frames
+                if not self._active:
+                    self._active = True
+                    self.onsets += 1
+                    for pre_index, pre_frame in self._preroll:
+                        out.append(pre_frame)
+                        self._mark(pre_index)
+                    self._preroll.clear()
+            elif self._active:
+                if self._hang > 0:
+                    self._hang -= 1
+                else:
+                    self._active = False
+
+            if self._active or self.hold:
+                out.append(frames[i])
+                self._mark(index)
+            else:
+                self._preroll.append((index, frames[i]))
+
+        if not out:
+            return None
+        return np.concatenate(out).tobytes()
+
+    def _mark(self, index):
+        self.frames_forwarded += 1
+        if self.trace is not None:
+            self.trace.append(index)
+
+# --- Offline evaluation ---
+def read_wav(path, samplerate=None):
+    """Reads a WAV file as mono int16 at `samplerate` (linear interpolation if the file differs)."""
+    samplerate = samplerate or config.SAMPLE_RATE_MIC
+    with wave.open(path, "rb") as w:
+        if w.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAV is supported")
+        rate, channels = w.getframerate(), w.getnchannels()
+        pcm = np.frombuffer(w.readframes(w.getnframes()), dtype=np.int16)
+    if channels > 1:
+        pcm = pcm.reshape(-1, channels)[:, 0].copy()
+    if rate != samplerate:
+        n = int(pcm.shape[0] * samplerate / rate)
+        pcm = np.interp(np.arange(n) * rate / samplerate, np.arange(pcm.shape[0]), pcm).astype(np.int16)
+    return pcm
+
+def read_labels(path, samplerate, frame_length):
+    """Audacity label track (start<TAB>end<TAB>label, seconds) -> speech onset frame indexes."""
+    onsets = []
+    with open(path) as f:
+        for line in f:
+            fields = line.strip().split("\t")
+            if len(fields) >= 2:
+                onsets.append(int(float(fields[0]) * samplerate) // frame_length)
+    return onsets
+
+def reference_onsets(pcm, frame_length, min_speech_frames=5, merge_gap_frames=15):
+    """Non-causal oracle used when no labels exist: looks at the whole file's energy distribution."""
+    whole = (pcm.shape[0] // frame_length) * frame_length
+    energy, _ = VoiceActivityDetector().features(pcm[:whole].reshape(-1, frame_length))
+    speech = energy > max(np.percentile(energy, 20) + 12.0, -60.0)
+    onsets, start, gap = [], None, 0
+    for i, s in enumerate(speech):
+        if s:
+            if start is None:
+                start = i
+            gap = 0
+        elif start is not None:
+            gap += 1
+            if gap > merge_gap_frames:
+                if i - gap - start + 1 >= min_speech_frames:
+                    onsets.append(start)
+                start, gap = None, 0
+    if start is not None and len(speech) - gap - start >= min_speech_frames:
+        onsets.append(start)
+    return onsets
+
+def evaluate(paths, block_size=None):
+    block_size = block_size or config.BLOCK_SIZE
+    totals = {"frames": 0, "dropped": 0, "onsets": 0, "missed": 0}
+    for path in paths:
+        gate = VadGate(trace=True)
+        fl = gate.vad.frame_length
+        pcm = read_wav(path, gate.vad.samplerate)
+        for start in range(0, pcm.shape[0], block_size):
+            gate.process(pcm[start:start + block_size])
+
+        label_path = os.path.splitext(path)[0] + ".txt"
+        if os.path.exists(label_path):
+            onsets, source = read_labels(label_path, gate.vad.samplerate, fl), "labels"
+        else:
+            onsets, source = reference_onsets(pcm, fl), "oracle"
+        forwarded = set(gate.trace)
+        missed = [o for o in onsets if o not in forwarded]
+
+        s = gate.stats()
+        dropped = s["frames"] - s["forwarded"]
+        print(f"{os.path.basename(path)}: frames={s['frames']} dropped={dropped} ({s['dropped_pct']}%) "
+              f"onsets={len(onsets)} ({source}) missed={len(missed)} detected_onsets={s['onsets']}")
+        for o in missed:
+            print(f"    missed onset @ {o * fl / gate.vad.samplerate:.2f}s")
+        totals["frames"] += s["frames"]
+        totals["dropped"] += dropped
+        totals["onsets"] += len(onsets)
+        totals["missed"] += len(missed)
+
+    if len(paths) > 1 and totals["frames"]:
+        print(f"TOTAL: dropped {totals['dropped']}/{totals['frames']} frames "
+              f"({100 * totals['dropped'] / totals['frames']:.1f}%), missed {totals['missed']}/{totals['onsets']} onsets")
+    return totals
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m chip.audio.vad file.wav [file.wav ...]  (optional Audacity labels in file.txt)")
+        sys.exit(1)
+    evaluate(sys.argv[1:])
@@ -0,0 +1,87 @@
+import asyncio
+from colorama import Fore, Style, init
+
+from chip.utils import metrics
+
+init(autoreset=True)
+
+class BootGraph:
+    """
+    Boot as a dependency graph of async stages. Each stage starts as soon as
+    the stages it depends on have finished, so independent work (iMCP
+    restart, MCP servers, audio, wake word, context) overlaps. ready(name)
+    is the readiness gate other code awaits. Every stage lands on the boot
+    timeline, and report() names the critical path: the chain of stages
+    that decided when a target stage finished.
+    """
+    def __init__(self, timeline=None):
+        self.timeline = timeline or metrics.BootTimeline()
+        self.stages = {}    # name -> {"fn", "deps", "task", "start", "end"}
+
+    def add(self, name, fn, deps=()):
+        """`fn` is an async callable with no arguments; its return value is the stage result."""
+        self.stages[name] = {"fn": fn, "deps": tuple(deps), "task": None, "start": None, "end": None}
+
+    def start(self):
+        for name, stage in self.stages.items():
+            missing = [d for d in stage["deps"] if d not in self.stages]
+            if missing:
+                raise ValueError(f"Boot stage {name} depends on unknown stage(s): {', '.join(missing)}")
+        for name, stage in self.stages.items():
+            stage["task"] = asyncio.create_task(self._run(name))
+            # Failures are reported by _run; stages nobody waits on must not warn again at exit
+            stage["task"].add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _run(self, name):
+        stage = self.stages[name]
+        for dep in stage["deps"]:
+            await self.stages[dep]["task"]
+        stage["start"] = metrics.now_ms()
+        try:
+            return await stage["fn"]()
+        except Exception as e:
+            print(f"{Fore.RED}[BOOT] {name} failed: {e}{Style.RESET_ALL}")
+            raise
+        finally:
+            stage["end"] = metrics.now_ms()
+            self.timeline.add(name, stage["start"], stage["end"])
+
+    def task(self, name):
+        return self.stages[name]["task"]
+
+    async def ready(self, name):
+        return await self.stages[name]["task"]
+
+    def result(self, name, default=None):
+        task = self.stages[name]["task"]
+        if task is None or not task.done() or task.cancelled() or task.exception():
+            return default
+        return task.result()
+
+    def cancel(self):
+        for stage in self.stages.values():
+            if stage["task"] and not stage["task"].done():
+                stage["task"].cancel()
+
+    def critical_path(self, target):
+        """Stages from boot to `target`, following the dependency that finished last at each step."""
+        path = [target]
+        deps = self.stages[target]["deps"]
+        while deps:
+            last = max(deps, key=lambda d: self.stages[d]["end"] or 0)
+            path.insert(0, last)
+            deps = self.stages[last]["deps"]
+        return path
+
+    def report(self, *targets):
+        lines = [self.timeline.report()]
+        for target in targets:
+            end = self.stages[target]["end"]
+            if end is None:
+                lines.append(f"{target}: not ready yet")
+                continue
+            path = " -> ".join(
+                f"{name} ({self.stages[name]['end'] - self.stages[name]['start']:.0f}ms)" for name in self.critical_path(target)
+            )
+            lines.append(f"{target} ready at {(end - self.timeline.t0) / 1000:.2f}s; critical path: {path}")
+        return "\n".join(lines)
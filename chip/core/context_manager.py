@@ -2,6 +2,9 @@ import os
 import asyncio
 from google.genai import types
 from colorama import Fore, Style, init
+
+from chip.utils import config, history as history_utils
+
 init(autoreset=True)
 
 # File paths
@@ -47,7 +50,9 @@ async def generate_and_save_summary(full_history, services_module):
         response = await services_module.ask_llm(
             full_history, 
             system_instruction="You are a helpful summariser. DO NOT use functions. Respond only with plain text.",
-            tools=[] 
+            tools=[],
+            site="summary",
+            cache=False
         )
         if response.candidates and response.candidates[0].content.parts:
             part = response.candidates[0].content.parts[0]
@@ -64,4 +69,59 @@ async def generate_and_save_summary(full_history, services_module):
                 print(f"{Fore.LIGHTBLACK_EX}[SYSTEM] Skipped: Model returned empty text.{Style.RESET_ALL}")
                 
     except Exception as e:
-        print(f"{Fore.RED}[ERROR] Could not save summary: {e}{Style.RESET_ALL}")
\ No newline at end of file
+        print(f"{Fore.RED}[ERROR] Could not save summary: {e}{Style.RESET_ALL}")
+
+COMPACT_INSTRUCTION = (
+    "You compress conversation history for a voice assistant. DO NOT use functions. "
+    "Respond only with plain text: the facts, decisions, open tasks, tool results still relevant "
+    "and user preferences from the conversation, as a compact note under 200 words."
+)
+
+class HistoryCompactor:
+    """
+    Keeps the history under a token budget without blocking a turn. Past the
+    high-water mark, the oldest whole turns are summarised in the background
+    into a single memory block; the result is swapped in between turns.
+    """
+    def __init__(self, services_module, budget=None, compact_at=None, compact_to=None):
+        self.services = services_module
+        self.budget = budget or config.HISTORY_TOKEN_BUDGET
+        self.compact_at = compact_at or getattr(config, 'HISTORY_COMPACT_AT', 0.75)
+        self.compact_to = compact_to or getattr(config, 'HISTORY_COMPACT_TO', 0.4)
+        self._task = None
+        self.compactions = 0
+
+    def maybe_compact(self, history):
+        """Call after a turn: starts a background summary if the history is past the high-water mark."""
+        if self._task is not None or history_utils.estimator.tokens(history) < self.compact_at * self.budget:
+            return
+        cut = history_utils.keep_recent(history, self.compact_to * self.budget)
+        if cut <= 1:
+            return
+        self._task = asyncio.create_task(self._summarise(history[:cut]))
+
+    async def _summarise(self, messages):
+        request = types.Content(role="user", parts=[types.Part.from_text(text="Compress the conversation above into the note.")])
+        response = await self.services.ask_llm(messages + [request], system_instruction=COMPACT_INSTRUCTION, tools=[], site="compaction", cache=False)
+        text = response.text if response.candidates else None
+        return messages, (text or "").strip()
+
+    def apply(self, history):
+        """Call before a turn: swaps a finished summary in for the turns it covers. Never waits."""
+        if self._task is None or not self._task.done():
+            return history
+        task, self._task = self._task, None
+        try:
+            messages, summary = task.result()
+        except Exception as e:
+            print(f"{Fore.RED}[ERROR] History compaction failed: {e}{Style.RESET_ALL}")
+            return history
+        # The history may have been trimmed meanwhile; only replace an unchanged front
+        if not summary or len(history) < len(messages) or any(a is not b for a, b in zip(messages, history)):
+            return history
+        before = history_utils.estimator.tokens(messages)
+        memory = history_utils.memory_block(summary)
+        self.compactions += 1
+        print(f"{Fore.LIGHTBLACK_EX}[MEMORY] Compacted {len(messages)} messages (~{before:.0f} tokens) "
+              f"into ~{history_utils.estimator.content_tokens(memory):.0f} tokens{Style.RESET_ALL}")
+        return [memory] + history[len(messages):]
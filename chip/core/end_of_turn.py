@@ -0,0 +1,103 @@
+import asyncio
+import re
+import sys
+from colorama import Fore, Style, init
+
+from chip.core import state
+from chip.utils import config, metrics
+
+init(autoreset=True)
+
+# A turn ending on one of these is probably a pause, not the end of the request
+TRAILING_WORDS = {
+    "and", "but", "or", "so", "because", "if", "then", "than", "that", "which", "who", "when", "while",
+    "the", "a", "an", "to", "of", "for", "with", "from", "in", "on", "at", "about", "my", "your", "is", "are",
+    "um", "uh", "er", "like",
+}
+
+def looks_incomplete(transcript, require_punctuation=None):
+    """Trailing conjunction/article/filler or a dangling comma; optionally also no terminal punctuation."""
+    if require_punctuation is None:
+        require_punctuation = getattr(config, 'EOT_REQUIRE_PUNCTUATION', False)
+    text = transcript.strip()
+    if not text:
+        return False
+    if text[-1] in ",-" or text.endswith("..."):
+        return True
+    words = re.findall(r"[\w']+", text.lower())
+    if words and words[-1] in TRAILING_WORDS:
+        return True
+    return require_punctuation and text[-1] not in ".?!"
+
+def stt_params():
+    """Flux end-of-turn query parameters from config."""
+    params = {
+        "eot_threshold": getattr(config, 'FLUX_EOT_THRESHOLD', 0.7),
+        "eot_timeout_ms": getattr(config, 'FLUX_EOT_TIMEOUT_MS', 5000),
+    }
+    eager = getattr(config, 'FLUX_EAGER_EOT_THRESHOLD', None)
+    if eager is not None:
+        params["eager_eot_threshold"] = eager
+    return "".join(f"&{k}={v}" for k, v in params.items())
+
+class EndOfTurnGate:
+    """
+    Turns Flux TurnInfo events into user messages. EndOfTurn is dispatched
+    straight away unless the transcript looks incomplete; then it is held
+    for `hold_ms`, and if the user starts talking again the two halves are
+    sent as one message. Decision latency (last words heard -> dispatch) is
+    recorded per turn.
+    """
+    def __init__(self, dispatch, hold_ms=None):
+        self.dispatch = dispatch
+        self.hold_ms = hold_ms if hold_ms is not None else getattr(config, 'EOT_HOLD_MS', 600)
+        self._held = None           # transcript waiting out the hold
+        self._hold_task = None
+        self._last_words_at = None
+        self._eager_at = None
+
+    def start_of_turn(self):
+        if self._hold_task:
+            # The user carried on: keep the held words, they are merged into the next EndOfTurn
+            self._hold_task.cancel()
+            self._hold_task = None
+            print(f"{Fore.LIGHTBLACK_EX}[TURN] Continued after a pause{Style.RESET_ALL}")
+        self._eager_at = None
+
+    def update(self, transcript):
+        self._last_words_at = metrics.now_ms()
+
+    def eager_end_of_turn(self, transcript):
+        self._eager_at = metrics.now_ms()
+        if state.speculator: state.speculator.on_eager(transcript)
+
+    def turn_resumed(self):
+        self._eager_at = None
+
+    async def end_of_turn(self, transcript, confidence=None):
+        now = metrics.now_ms()
+        if self._eager_at is not None:
+            metrics.record_latency("eot_eager_lead", now - self._eager_at, log=False)
+        if self._held:
+            transcript = f"{self._held} {transcript}"
+            self._held = None
+        if self.hold_ms and looks_incomplete(transcript):
+            self._held = transcript
+            self._hold_task = asyncio.create_task(self._hold())
+            return
+        await self._send(transcript, confidence, held=False)
+
+    async def _hold(self):
+        await asyncio.sleep(self.hold_ms / 1000)
+        transcript, self._held, self._hold_task = self._held, None, None
+        await self._send(transcript, None, held=True)
+
+    async def _send(self, transcript, confidence, held):
+        sys.stdout.write("\r\033[K")
+        if self._last_words_at is not None:
+            decided = metrics.now_ms() - self._last_words_at
+            metrics.record_latency("eot_decision", decided, log=False)
+            detail = f" conf {confidence:.2f}" if confidence is not None else ""
+            print(f"{Fore.LIGHTBLACK_EX}[TURN] End of turn after {decided:.0f}ms{' (held)' if held else ''}{detail}{Style.RESET_ALL}")
+        self._last_words_at = None
+        await self.dispatch(transcript)
@@ -0,0 +1,339 @@
+import asyncio
+import datetime
+import hashlib
+import json
+import time
+from google.genai import types
+from colorama import Fore, Style, init
+
+from chip.utils import config, metrics
+from chip.core import state
+
+init(autoreset=True)
+
+def convert_tools(openai_tools):
+    """OpenAI-style tool specs (as listed by MCP) -> Gemini function declarations."""
+    if not openai_tools:
+        return None
+    declarations = []
+    for tool in openai_tools:
+        f = tool['function']
+        params = f.get('parameters', {}).copy()
+        if '$schema' in params:
+            del params['$schema']
+        declarations.append(types.FunctionDeclaration(
+            name=f['name'],
+            description=f.get('description'),
+            parameters=params
+        ))
+    return [types.Tool(function_declarations=declarations)]
+
+def _expiry(cache, fallback_seconds):
+    expire_time = getattr(cache, "expire_time", None)
+    if isinstance(expire_time, datetime.datetime):
+        return expire_time.timestamp()
+    return time.time() + fallback_seconds
+
+def _saved_caches(caches, model):
+    """Persisted resume entries for `model`: cache key -> {"cache_name", "expires_at", "cache_created_at"}."""
+    saved = caches.get(model, {})
+    if "cache_key" in saved:
+        # Older state files kept a single entry per model
+        saved = {saved["cache_key"]: saved}
+    return saved
+
+_state_lock = asyncio.Lock()   # resume entries of every manager share the state file
+
+class CacheManager:
+    """
+    Gemini context caches keyed by a hash of (model, system instruction, tool
+    declarations), so a changed prompt or tool set can never resume a stale
+    cache. Expiry is tracked locally; the TTL is only refreshed (in the
+    background) when a cache gets close to expiring. Creation also runs in
+    the background: until it finishes, callers get None and send uncached.
+
+    On top of that, prepare() rolls the stable older part of a long
+    conversation into its own cache once the uncached tail gets expensive,
+    so each request only sends the recent messages.
+    """
+    RETRY_SECONDS = 600     # after a failed create (e.g. prompt below the minimum cache size)
+
+    def __init__(self, client, model=None, ttl_seconds=None, refresh_margin=None):
+        self.client = client
+        self.model = model or config.LLM_MODEL
+        self.ttl_seconds = ttl_seconds or config.CACHE_SECONDS
+        self.refresh_margin = refresh_margin or min(3600, self.ttl_seconds // 4)
+        self._entries = {}      # key -> {"name", "expires_at"}
+        self._failed = {}       # key -> retry after (epoch)
+        self._pending = {}      # key -> create/resume/refresh task
+        self._tools = (None, None, None)    # last tools list seen: (tools, digest, converted)
+        self._resumable = dict(_saved_caches(state._load_state().get("caches", {}), self.model))
+        # Rolling conversation prefix: older history cached on top of the system prompt
+        self.prefix_enabled = getattr(config, 'CONTEXT_CACHE_ENABLED', True)
+        self.prefix_ttl = getattr(config, 'CONTEXT_CACHE_TTL_SECONDS', 1800)
+        self.roll_tokens = getattr(config, 'CONTEXT_CACHE_ROLL_TOKENS', 4000)
+        self.tail_messages = max(4, getattr(config, 'CONTEXT_CACHE_TAIL_MESSAGES', 6))
+        self._prefixes = {}     # key -> {"name", "messages", "expires_at"}
+        self._billed = {}       # key -> uncached prompt tokens of the last request
+        self.usage = {"requests": 0, "cache_hits": 0, "prompt_tokens": 0, "cached_tokens": 0, "prefix_caches": 0}
+
+    # --- Keys and tool declarations ---
+    def _tool_entry(self, tools):
+        # Tool lists are replaced, never mutated: one list is in use at a time, so one memo slot is enough
+        entry = self._tools
+        if entry[0] is not tools:
+            digest = hashlib.sha256(json.dumps(tools or [], sort_keys=True, default=str).encode()).hexdigest()
+            entry = (tools, digest, convert_tools(tools))
+            self._tools = entry
+        return entry
+
+    def gemini_tools(self, tools):
+        """Converted declarations, memoised per tools list."""
+        return self._tool_entry(tools)[2] if tools else None
+
+    def key(self, system_instruction, tools):
+        raw = f"{self.model}\0{system_instruction or ''}\0{self._tool_entry(tools)[1]}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    # --- Public API ---
+    async def get(self, system_instruction, tools, wait=False):
+        """Returns a usable cache name, or None to send the prompt uncached this time."""
+        key = self.key(system_instruction, tools)
+        entry = self._entries.get(key)
+        now = time.time()
+
+        if entry and entry["expires_at"] - now > 30:
+            if entry["expires_at"] - now < self.refresh_margin:
+                self._start(key, self._refresh(key))
+            return entry["name"]
+
+        self._entries.pop(key, None)
+        if self._failed.get(key, 0) > now:
+            return None
+        task = self._start(key, self._create(key, system_instruction, tools))
+        if wait:
+            await asyncio.shield(task)
+            entry = self._entries.get(key)
+            return entry["name"] if entry else None
+        return None
+
+    async def supersede(self, system_instruction, tools):
+        """
+        After the prompt or tool set changed: waits for the cache of the new
+        key, then deletes every other cache this manager holds, since nothing
+        will use them again and they would bill storage until their TTL.
+        """
+        name = await self.get(system_instruction, tools, wait=True)
+        await self.discard(keep=self.key(system_instruction, tools))
+        return name
+
+    async def discard(self, keep=None):
+        """Deletes all caches (and conversation prefixes) except those of key `keep`."""
+        for key in [k for k in self._entries if k != keep]:
+            entry = self._entries.pop(key)
+            self._drop_prefix(key)
+            await self._persist(key)
+            if entry["expires_at"] > time.time():
+                await self._delete(entry["name"])
+
+    async def prepare(self, system_instruction, tools, history):
+        """
+        Returns (cache name or None, contents to send). When a cached prefix
+        still matches the start of `history`, only the messages after it are sent.
+        """
+        key = self.key(system_instruction, tools)
+        cache_name = await self.get(system_instruction, tools)
+        if not self.prefix_enabled or cache_name is None:
+            return cache_name, history
+
+        contents = history
+        prefix = self._prefixes.get(key)
+        if prefix and self._prefix_matches(prefix, history):
+            cache_name, contents = prefix["name"], history[len(prefix["messages"]):]
+        elif prefix:
+            # Trimmed, rewritten or expired: back to the base cache until the next roll
+            self._drop_prefix(key)
+            prefix = None
+
+        if self._billed.get(key, 0) >= self.roll_tokens:
+            cut = self._roll_point(history, len(prefix["messages"]) if prefix else 0)
+            if cut:
+                self._billed[key] = 0
+                self._start(key + ":prefix", self._roll(key, system_instruction, tools, history[:cut]))
+        return cache_name, contents
+
+    def record_usage(self, system_instruction, tools, usage):
+        """Feeds usage_metadata back: drives rolling and the session hit-rate report."""
+        prompt = usage.prompt_token_count or 0
+        cached = getattr(usage, "cached_content_token_count", 0) or 0
+        self._billed[self.key(system_instruction, tools)] = prompt - cached
+        self.usage["requests"] += 1
+        self.usage["cache_hits"] += cached > 0
+        self.usage["prompt_tokens"] += prompt
+        self.usage["cached_tokens"] += cached
+
+    def stats(self):
+        u = self.usage
+        prices = metrics.prices(self.model)
+        discount = 1 - prices["cached"] / prices["input"]
+        return {
+            "requests": u["requests"],
+            "hit_rate_pct": round(100 * u["cache_hits"] / max(1, u["requests"]), 1),
+            "cached_tokens_pct": round(100 * u["cached_tokens"] / max(1, u["prompt_tokens"]), 1),
+            "billed_tokens_saved": int(u["cached_tokens"] * discount),
+            "prefix_caches": u["prefix_caches"],
+        }
+
+    def generate_config(self, cache_name, system_instruction, tools, **kwargs):
+        if cache_name:
+            return types.GenerateContentConfig(cached_content=cache_name, **kwargs)
+        return types.GenerateContentConfig(system_instruction=system_instruction, tools=self.gemini_tools(tools), **kwargs)
+
+    # --- Background work ---
+    def _start(self, key, coro):
+        task = self._pending.get(key)
+        if task is not None and not task.done():
+            coro.close()
+            return task
+        task = asyncio.create_task(coro)
+        self._pending[key] = task
+        return task
+
+    async def _create(self, key, system_instruction, tools):
+        resume = self._resumable.pop(key, None)
+        if resume and resume.get("cache_name"):
+            try:
+                cache = await self.client.aio.caches.get(name=resume["cache_name"])
+                self._entries[key] = {"name": cache.name, "expires_at": _expiry(cache, 0)}
+                print(f"{Fore.GREEN}[CACHE] Resumed: {cache.name}{Style.RESET_ALL}")
+                if self._entries[key]["expires_at"] - time.time() < self.refresh_margin:
+                    await self._refresh(key)
+                return
+            except Exception:
+                pass    # Expired or deleted server-side: create a new one
+
+        try:
+            print(f"{Fore.YELLOW}[CACHE] Creating new Gemini Cache...{Style.RESET_ALL}")
+            cache = await self.client.aio.caches.create(
+                model=self.model,
+                config=types.CreateCachedContentConfig(
+                    display_name="chip_session_cache",
+                    system_instruction=system_instruction,
+                    tools=self.gemini_tools(tools),
+                    ttl=f"{self.ttl_seconds}s"
+                )
+            )
+        except Exception as e:
+            print(f"{Fore.RED}[ERROR] Cache failed: {e}. Falling back to standard requests.{Style.RESET_ALL}")
+            self._failed[key] = time.time() + self.RETRY_SECONDS
+            return
+
+        self._entries[key] = {"name": cache.name, "expires_at": _expiry(cache, self.ttl_seconds)}
+        print(f"{Fore.GREEN}[CACHE] Created: {cache.name}{Style.RESET_ALL}")
+        await self._persist(key)
+
+    async def _persist(self, key):
+        """
+        Saves the resume entry for `key` (or forgets it, once it has no live
+        cache). Entries are kept per key, so caches for other instructions
+        never displace each other; expired ones are dropped on every save.
+        The state file is written off the event loop, one save at a time.
+        """
+        entry = dict(self._entries[key]) if key in self._entries else None
+        async with _state_lock:
+            await asyncio.to_thread(self._save_entry, key, entry)
+
+    def _save_entry(self, key, entry):
+        caches = state._load_state().get("caches", {})
+        now = time.time()
+        saved = {k: v for k, v in _saved_caches(caches, self.model).items() if v.get("expires_at", 0) > now}
+        if entry:
+            saved[key] = {
+                "cache_created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                **saved.get(key, {}),
+                "cache_name": entry["name"],
+                "expires_at": entry["expires_at"],
+            }
+        else:
+            saved.pop(key, None)
+        caches[self.model] = saved
+        state._update_state({"caches": caches})
+
+    async def _refresh(self, key):
+        entry = self._entries.get(key)
+        if not entry:
+            return
+        try:
+            cache = await self.client.aio.caches.update(
+                name=entry["name"],
+                config=types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s")
+            )
+            entry["expires_at"] = _expiry(cache, self.ttl_seconds)
+        except Exception:
+            print(f"{Fore.YELLOW}[CACHE] Refresh failed. Recreating...{Style.RESET_ALL}")
+            self._entries.pop(key, None)
+        await self._persist(key)
+
+    # --- Conversation prefix ---
+    def _prefix_matches(self, prefix, history):
+        messages = prefix["messages"]
+        if prefix["expires_at"] - time.time() < 30 or len(history) <= len(messages):
+            return False
+        # Identity, not equality: history only ever grows at the end or is trimmed at the front
+        return all(a is b for a, b in zip(messages, history))
+
+    def _roll_point(self, history, current):
+        """
+        Newest cut that leaves at least `tail_messages` uncached and starts the
+        tail on a user text message. Each cache write is billed, so it must
+        also move the prefix forward by at least as many messages.
+        """
+        for i in range(len(history) - self.tail_messages, current + self.tail_messages - 1, -1):
+            content = history[i]
+            if content.role == "user" and any(p.text for p in content.parts or []):
+                return i
+        return None
+
+    async def _roll(self, key, system_instruction, tools, messages):
+        try:
+            cache = await self.client.aio.caches.create(
+                model=self.model,
+                config=types.CreateCachedContentConfig(
+                    display_name="chip_conversation_cache",
+                    system_instruction=system_instruction,
+                    tools=self.gemini_tools(tools),
+                    contents=messages,
+                    ttl=f"{self.prefix_ttl}s"
+                )
+            )
+        except Exception as e:
+            print(f"{Fore.YELLOW}[CACHE] Conversation prefix not cached: {e}{Style.RESET_ALL}")
+            return
+        self._drop_prefix(key)
+        self._prefixes[key] = {"name": cache.name, "messages": messages, "expires_at": _expiry(cache, self.prefix_ttl)}
+        self.usage["prefix_caches"] += 1
+        print(f"{Fore.LIGHTBLACK_EX}[CACHE] Conversation prefix: {len(messages)} messages -> {cache.name}{Style.RESET_ALL}")
+
+    def _drop_prefix(self, key):
+        prefix = self._prefixes.pop(key, None)
+        if prefix and prefix["expires_at"] > time.time():
+            asyncio.create_task(self._delete(prefix["name"]))
+
+    async def _delete(self, name):
+        try:
+            await self.client.aio.caches.delete(name=name)
+        except Exception:
+            pass    # It expires on its own
+
+def with_current_time(history):
+    """
+    The current time is volatile, so it stays out of the cached prefix: it is
+    prepended to the latest user text message of a copy of the history.
+    """
+    stamp = datetime.datetime.now().strftime("%B %d, %Y @ %I:%M %p")
+    for i in range(len(history) - 1, -1, -1):
+        content = history[i]
+        if content.role == "user" and any(p.text for p in content.parts or []):
+            stamped = types.Content(role="user", parts=[types.Part.from_text(text=f"[CURRENT_TIME: {stamp}]")] + list(content.parts))
+            return history[:i] + [stamped] + history[i + 1:]
+    return history
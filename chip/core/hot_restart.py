@@ -0,0 +1,68 @@
+import asyncio
+import importlib
+import os
+from colorama import Fore, Style, init
+
+from chip.utils import config
+from chip.core import state, services, context_manager
+
+init(autoreset=True)
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Reloaded in place by a warm restart, so editing it does not need a new interpreter
+RELOADABLE = {os.path.join(PACKAGE_DIR, "utils", "config.py")}
+
+def _source_mtimes():
+    mtimes = {}
+    for root, _, files in os.walk(PACKAGE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            if name.endswith(".py") and path not in RELOADABLE:
+                mtimes[path] = os.stat(path).st_mtime_ns
+    return mtimes
+
+_boot_sources = _source_mtimes()
+
+def changed_sources():
+    """Python files (other than config.py) added, removed or modified since this process started."""
+    current = _source_mtimes()
+    return sorted(p for p in current.keys() | _boot_sources.keys() if current.get(p) != _boot_sources.get(p))
+
+async def warm_restart():
+    """
+    Restart without a new interpreter. Reloads config.py in place (every
+    module reads settings through the config module), re-reads the
+    personality and user customs, rebuilds the router, system prompt and
+    context caches, and reconnects only the MCP servers whose config
+    changed. Audio, the STT socket and healthy MCP sessions stay up.
+    Returns a report for the model, including the reloaded personality.
+    """
+    print(f"{Fore.CYAN}[SYSTEM] Warm restart: reloading configuration...{Style.RESET_ALL}")
+    try:
+        importlib.reload(config)
+    except Exception as e:
+        print(f"{Fore.RED}[ERROR] config.py failed to reload: {e}{Style.RESET_ALL}")
+        return f"Warm restart failed: config.py could not be loaded ({e}). Settings were left as they were; fix the file and restart again."
+    managers = set(services.cache_managers.values())
+    services.reload_routes()
+    personality, _ = context_manager.load_context()
+
+    lines = ["Warm restart complete: config, personality and user customs reloaded; system prompt and caches rebuilt."]
+    servers = state.mcp_servers
+    if servers is not None:
+        diff = await servers.reload(config.MCP_SERVERS, [config.RESTART_TOOL, config.READ_TOOL_OUTPUT_TOOL])
+        touched = [f"{kind} {', '.join(names)}" for kind, names in diff.items() if names]
+        lines.append(f"MCP servers: {'; '.join(touched) if touched else 'unchanged'}.")
+        tools = servers.tools
+    else:
+        tools = [config.RESTART_TOOL, config.READ_TOOL_OUTPUT_TOOL]
+
+    # A new prompt or tool set has a new cache key: start creating the caches now rather than on the next turn,
+    # then delete the superseded ones (and those of routes whose model changed) instead of leaving them to bill
+    for manager in services.cache_managers.values():
+        asyncio.create_task(manager.supersede(config.SYSTEM_PROMPT, tools))
+    for manager in managers - set(services.cache_managers.values()):
+        asyncio.create_task(manager.discard())
+
+    print(f"{Fore.GREEN}[SYSTEM] {' '.join(lines)}{Style.RESET_ALL}")
+    return "\n".join(lines) + f"\n\n### CURRENT CONFIGURATION\n{personality}"
@@ -10,59 +10,232 @@ from contextlib import AsyncExitStack
 from google.genai import types
 from colorama import init, Fore, Style
 
-from chip.utils import config, tools_handler, history as history_utils
-from chip.core import state, services, context_manager, mcp_connect, routines
+from chip.utils import config, metrics, tools_handler, history as history_utils
+from chip.utils.segmenter import SentenceSegmenter
+from chip.core import state, services, context_manager, mcp_connect, routines, turns, tts_pipeline, speculation, boot, hot_restart
 from chip.audio import audio_engine
 
 init(autoreset=True)
 
+async def run_turn(turn, history, should_speak, full_system_prompt, all_tools, tool_to_session, adopted=None):
+    """One user turn: LLM stream -> TTS -> tool rounds. Runs inside turn.run() so a barge-in can cancel it."""
+    tts = tts_pipeline.TtsPipeline(turn) if should_speak else None
+    try:
+        await _run_rounds(turn, tts, history, full_system_prompt, all_tools, tool_to_session, adopted)
+    finally:
+        if tts: await tts.close()
+        if adopted: adopted.cancel()
+
+async def _run_rounds(turn, tts, history, full_system_prompt, all_tools, tool_to_session, adopted=None):
+    should_speak = tts is not None
+    route = None    # chosen by the router on the first round, kept for the rest of the turn
+    # One segmenter for the whole turn: its early clause fires once, not once per round.
+    # An adopted speculation already spent it on its own stream.
+    segmenter = SentenceSegmenter(first_clause_chars=0) if adopted else SentenceSegmenter()
+    for loop_index in range(config.MAX_LLM_TURNS): 
+        turn.round = loop_index
+        full_content_parts = [] 
+        tool_calls = []         
+        
+        print(f"{Fore.MAGENTA}[CHIP] ", end="", flush=True)
+        
+        if adopted and loop_index == 0:
+            # Speculation adopted: the first round already ran on the stable partial transcript
+            stream = adopted.replay()
+        else:
+            stream = services.ask_llm_routed(history, system_instruction=full_system_prompt, tools=all_tools,
+                                             site="main", round_index=loop_index, route=route,
+                                             segmenter=segmenter)
+        async for chunk in stream:
+            if chunk["type"] == "text":
+                text = chunk["content"]
+                print(f"{Fore.MAGENTA}{text}{Style.RESET_ALL} ", end="", flush=True)
+                turn.add_generated(text)
+                if tts: tts.say(text, loop_index)
+            elif chunk["type"] == "complete_message":
+                full_content_parts = chunk["content"]
+                route = chunk.get("route", route)
+                tool_calls = [p.function_call for p in full_content_parts if p.function_call]
+
+        print(Style.RESET_ALL)
+        if full_content_parts:
+            turn.add_model_message(types.Content(role="model", parts=full_content_parts))
+
+        if not tool_calls:
+            services.router.note_turn(route, loop_index > 0)
+            break
+        
+        if tool_calls:
+            if should_speak and not any(fn.name == "restart_system" for fn in tool_calls):
+                if state.audio_engine: state.audio_engine.play_earcon("thinking")
+
+                filler_text = None
+                first_tool = tool_calls[0].name
+                
+                if loop_index == 0:
+                    filler_text = config.TOOL_SPECIFIC_FILLERS.get(first_tool)
+                    if not filler_text:
+                        filler_text = random.choice(config.FILLERS_START)
+                elif random.random() < 0.3:
+                    filler_text = random.choice(config.FILLERS_CONTINUED)
+                
+                if filler_text:
+                    print(f"{Fore.MAGENTA}[CHIP (Filler)] {filler_text}{Style.RESET_ALL}")
+                    tts.say(filler_text)
+                
+            tool_tasks = []
+            tool_names = []
+            warm_restarted = False
+            
+            for fn in tool_calls:
+                fname, fargs = fn.name, fn.args
+                
+                if fname == "restart_system":
+                    changed = hot_restart.changed_sources()
+                    if not (fargs or {}).get("full") and not changed:
+                        # Only config/data changed: reload in place, keeping audio, STT and MCP sessions
+                        if tts: tts.say("Reloading my configuration.")
+                        tool_names.append(fname)
+                        tool_tasks.append(hot_restart.warm_restart())
+                        warm_restarted = True
+                        continue
+                    if changed:
+                        print(f"{Fore.CYAN}[SYSTEM] Source changed: {', '.join(os.path.relpath(p) for p in changed)}{Style.RESET_ALL}")
+                    print(f"{Fore.CYAN}[SYSTEM] Restart initiated...{Style.RESET_ALL}")
+                    if tts:
+                        tts.say("Rebooting system.")
+                        await tts.close()
+                    subprocess.run(["pkill", "-f", "imcp-server"], stderr=subprocess.DEVNULL)
+                    if history: await context_manager.generate_and_save_summary(history, services)
+                    os.execv(sys.executable, [sys.executable, "-m", "chip.core.main"])
+
+                tool_names.append(fname)
+                if fname == "read_tool_output":
+                    tool_tasks.append(tools_handler.read_tool_output(fargs))
+                    continue
+                session = tool_to_session.get(fname)
+                tool_tasks.append(tools_handler.execute_tool(session, fname, fargs))
+
+            if tool_tasks:
+                gathered = asyncio.gather(*tool_tasks, return_exceptions=True)
+                shielded = warm_restarted or any(name in config.SIDE_EFFECT_TOOLS for name in tool_names)
+                try:
+                    results = await (asyncio.shield(gathered) if shielded else gathered)
+                    tool_outputs = tools_handler.function_responses(tool_names, results)
+                except asyncio.CancelledError:
+                    if shielded:
+                        # Side-effecting calls finish even on barge-in so history records what actually happened.
+                        # The responses are appended whatever happens, or the model's function calls go unanswered.
+                        results = [asyncio.CancelledError("interrupted before the result arrived")] * len(tool_names)
+                        try:
+                            results = await asyncio.shield(gathered)
+                        finally:
+                            history.append(types.Content(role="user", parts=tools_handler.function_responses(tool_names, results)))
+                    raise
+                except Exception as e:
+                    print(f"{Fore.RED}[ERROR] Tool Execution Failed: {e}{Style.RESET_ALL}")
+                    tool_outputs = [
+                        types.Part.from_function_response(name=name, response={"error": f"Tool execution failed: {str(e)}"})
+                        for name in tool_names
+                    ]
+                history.append(types.Content(role="user", parts=tool_outputs))
+                if warm_restarted:
+                    # The rest of the turn runs with the reloaded prompt and tool set
+                    full_system_prompt = config.SYSTEM_PROMPT
+                    if state.mcp_servers: all_tools, tool_to_session = state.mcp_servers.tools, state.mcp_servers.tool_to_session
+
 async def main():
-    services.restart_imcp()
-    
-    engine = audio_engine.AudioEngine()
-    engine.start()
+    timeline = metrics.BootTimeline()
+    graph = boot.BootGraph(timeline)
+    loop = asyncio.get_running_loop()
+    # Text input is accepted from the first moment; it waits in the input queue until the conversation loop starts
+    threading.Thread(target=services.console_listener, args=(loop,), daemon=True).start()
+    asyncio.create_task(services.warm_tts_cache())
 
-    personality_text, last_summary = context_manager.load_context()
+    root_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     full_system_prompt = config.SYSTEM_PROMPT 
 
     tm = tools_handler.ToolManager(config.MCP_SERVERS)
-    base_tools = [config.RESTART_TOOL]
+    base_tools = [config.RESTART_TOOL, config.READ_TOOL_OUTPUT_TOOL]
     history = []
+    compactor = context_manager.HistoryCompactor(services)
+    if getattr(config, 'SPECULATIVE_ENABLED', False):
+        state.speculator = speculation.Speculator(services.ask_llm_routed)
+    startup = routines.StartupRoutine(services, timeline)
+
+    # --- Boot stages ---
+    async def start_audio():
+        engine = audio_engine.AudioEngine()
+        engine.start()
+        state.audio_engine = engine
+        startup.begin()
+        return engine
+
+    async def load_earcons():
+        engine = graph.result("audio")
+        await asyncio.gather(*[
+            asyncio.to_thread(engine.load_earcon, name, os.path.join(root_path, rel_path))
+            for name, rel_path in config.EARCONS.items()
+        ])
+
+    async def start_mic():
+        mic = graph.result("wake word")
+        mic.start(audio_engine.select_microphone())
+        return mic
+
+    async def start_stt():
+        asyncio.create_task(services.start_deepgram_stt())
+        await state.stt_ready.wait()
+
+    async def connect_mcp(stack):
+        servers = mcp_connect.McpServers(tm, config.MCP_SERVERS, base_tools, timeline=timeline,
+                                         on_ready=startup.on_server_ready, gates={"iMCP": graph.task("imcp")})
+        stack.push_async_callback(servers.close)
+        state.mcp_servers = servers
+        await servers.start()
+        print(f"{Fore.GREEN}[SYSTEM] Ready. Loaded {len(servers.tools)} tools.{Style.RESET_ALL}")
+        return servers
+
+    async def greet():
+        servers = graph.result("mcp")
+        personality_text, last_summary = graph.result("context")
+        await startup.run(history, full_system_prompt, servers.tools, servers.tool_to_session, personality_text, last_summary)
+
+    async def warm_cache():
+        # Turns go out uncached until the cache exists
+        tools = graph.result("mcp").tools
+        await asyncio.gather(*[manager.get(full_system_prompt, tools, wait=True) for manager in services.cache_managers.values()])
 
     try:
         async with AsyncExitStack() as stack:
-            mcp_tools, tool_to_session = await mcp_connect.connect_servers(stack, tm, config.MCP_SERVERS)
-            all_tools = base_tools + mcp_tools
-            print(f"{Fore.GREEN}[SYSTEM] Ready. Loaded {len(all_tools)} tools.{Style.RESET_ALL}")
-            
-            history = await routines.run_startup_routine(
-                services, 
-                history, 
-                full_system_prompt, 
-                all_tools, 
-                tool_to_session,
-                personality_text,
-                last_summary
-            )
-            
-            mic_id = audio_engine.select_microphone()
-            mic = audio_engine.Microphone()
-            mic.start(mic_id)
-            
-            asyncio.create_task(services.start_deepgram_stt())
+            graph.add("imcp", services.restart_imcp)
+            graph.add("audio", start_audio)
+            graph.add("earcons", load_earcons, deps=["audio"])
+            graph.add("wake word", lambda: asyncio.to_thread(audio_engine.Microphone))
+            graph.add("mic", start_mic, deps=["audio", "wake word"])
+            graph.add("stt", start_stt, deps=["mic"])
+            graph.add("context", lambda: asyncio.to_thread(context_manager.load_context))
+            graph.add("mcp", lambda: connect_mcp(stack))
+            graph.add("greeting", greet, deps=["mcp", "context", "audio"])
+            graph.add("cache", warm_cache, deps=["mcp"])
+            graph.start()
 
-            loop = asyncio.get_running_loop()
-            threading.Thread(target=services.console_listener, args=(loop,), daemon=True).start()
-            
-            services._get_or_create_cache(full_system_prompt, all_tools)
+            # Voice goes live as soon as mic + STT are up; the conversation loop needs the tools and the greeting
+            await graph.ready("greeting")
+            servers = graph.result("mcp")
             
             os.system('clear')
+            print(f"{Fore.LIGHTBLACK_EX}{graph.report('stt', 'greeting')}{Style.RESET_ALL}")
             print(f"{Fore.CYAN}[SYSTEM] Chip Awake - {time.strftime('%a %d %b %H:%M:%S %Y')}{Style.RESET_ALL}")
             print(f"{Fore.LIGHTBLACK_EX}(Waiting for 'Hey Chip' or text input...){Style.RESET_ALL}")
 
             state.last_speech_time = 0 
 
             while True:
+                # Re-read each turn: tool drift in a lazily spawned server or a warm restart replaces them
+                all_tools, tool_to_session = servers.tools, servers.tool_to_session
+                full_system_prompt = config.SYSTEM_PROMPT     # rebuilt by a warm restart
+                if state.speculator: state.speculator.prepare(history, full_system_prompt, all_tools)
                 first_chunk = await state.input_queue.get()
                 
                 current_text = first_chunk.get("text", "") if isinstance(first_chunk, dict) else str(first_chunk)
@@ -74,19 +247,7 @@ async def main():
                         # print(f"{Fore.LIGHTBLACK_EX}[SYSTEM] Ignored (No wake word){Style.RESET_ALL}")
                         continue
 
-                speech_timeout = getattr(config, 'SPEECH_END_TIMEOUT', 0.8)
-                
-                if source == "mic":
-                    while True:
-                        try:
-                            next_chunk = await asyncio.wait_for(state.input_queue.get(), timeout=speech_timeout)
-                            next_text = next_chunk.get("text", "") if isinstance(next_chunk, dict) else str(next_chunk)
-                            if next_text.strip():
-                                current_text += " " + next_text
-                                print(f"{Fore.LIGHTBLACK_EX}[BUFFER] Merged: '...{next_text}'{Style.RESET_ALL}")
-                        except asyncio.TimeoutError:
-                            break
-                
+                # End of turn was already decided upstream (Flux events + EndOfTurnGate), so dispatch immediately
                 user_input = current_text.strip()
                 if not user_input: continue
 
@@ -101,99 +262,35 @@ async def main():
                 clean_text = user_input.replace("[USER] ", "") if user_input.startswith("[USER]") else user_input
                 if not user_input.startswith("[USER]"): 
                     print(f"{Fore.BLUE}[USER (Text)] {clean_text}{Style.RESET_ALL}")
+                adopted = state.speculator.take(clean_text) if state.speculator and source == "voice" else None
 
+                history = compactor.apply(history)
                 history.append(types.Content(role="user", parts=[types.Part.from_text(text=clean_text)]))
-                history = history_utils.safe_trim_history(history, max_length=config.HISTORY_MAX_LENGTH)
+                history = history_utils.trim_to_budget(history, compactor.budget, compactor.compact_to * compactor.budget)
 
+                turn = turns.begin_turn(history, speaking=should_speak)
                 try:
-                    for loop_index in range(config.MAX_LLM_TURNS): 
-                        full_content_parts = [] 
-                        tool_calls = []         
-                        
-                        print(f"{Fore.MAGENTA}[CHIP] ", end="", flush=True)
-                        
-                        async for chunk in services.ask_llm_stream(history, system_instruction=full_system_prompt, tools=all_tools):
-                            if chunk["type"] == "text":
-                                text = chunk["content"]
-                                print(f"{Fore.MAGENTA}{text}{Style.RESET_ALL} ", end="", flush=True)
-                                if should_speak: await services.stream_tts(iter([text])) 
-                            elif chunk["type"] == "complete_message":
-                                full_content_parts = chunk["content"]
-                                tool_calls = [p.function_call for p in full_content_parts if p.function_call]
-
-                        print(Style.RESET_ALL)
-                        if full_content_parts:
-                            history.append(types.Content(role="model", parts=full_content_parts))
-
-                        if not tool_calls: break
-                        
-                        if tool_calls:
-                            if should_speak and not any(fn.name == "restart_system" for fn in tool_calls):
-                                try:
-                                    base_path = os.path.dirname(os.path.abspath(__file__))
-                                    root_path = os.path.dirname(os.path.dirname(base_path))
-                                    sound_path = os.path.join(root_path, "sounds", "thinking.mp3")
-                                    
-                                    player = "afplay" if sys.platform == "darwin" else "play"
-
-                                    if os.path.exists(sound_path):
-                                        subprocess.Popen([player, sound_path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                                except Exception as e:
-                                    print(f"[ERROR] Sound failed: {e}")
-
-                                filler_text = None
-                                first_tool = tool_calls[0].name
-                                
-                                if loop_index == 0:
-                                    filler_text = config.TOOL_SPECIFIC_FILLERS.get(first_tool)
-                                    if not filler_text:
-                                        filler_text = random.choice(config.FILLERS_START)
-                                elif random.random() < 0.3:
-                                    filler_text = random.choice(config.FILLERS_CONTINUED)
-                                
-                                if filler_text:
-                                    print(f"{Fore.MAGENTA}[CHIP (Filler)] {filler_text}{Style.RESET_ALL}")
-                                    asyncio.create_task(services.stream_tts(iter([filler_text])))
-                                
-                            tool_tasks = []
-                            tool_names = []
-                            
-                            for fn in tool_calls:
-                                fname, fargs = fn.name, fn.args
-                                
-                                if fname == "restart_system":
-                                    print(f"{Fore.CYAN}[SYSTEM] Restart initiated...{Style.RESET_ALL}")
-                                    if should_speak: await services.stream_tts(iter(["Rebooting system."]))
-                                    subprocess.run(["pkill", "-f", "imcp-server"], stderr=subprocess.DEVNULL)
-                                    if history: await context_manager.generate_and_save_summary(history, services)
-                                    os.execv(sys.executable, [sys.executable, "-m", "chip.core.main"])
-
-                                session = tool_to_session.get(fname)
-                                tool_names.append(fname)
-                                tool_tasks.append(tools_handler.execute_tool(session, fname, fargs))
-
-                            if tool_tasks:
-                                try:
-                                    results = await asyncio.gather(*tool_tasks)
-                                    tool_outputs = [
-                                        types.Part.from_function_response(name=tool_names[i], response={"result": res})
-                                        for i, res in enumerate(results)
-                                    ]
-                                except Exception as e:
-                                    print(f"{Fore.RED}[ERROR] Tool Execution Failed: {e}{Style.RESET_ALL}")
-                                    tool_outputs = [
-                                        types.Part.from_function_response(name=name, response={"error": f"Tool execution failed: {str(e)}"})
-                                        for name in tool_names
-                                    ]
-                                history.append(types.Content(role="user", parts=tool_outputs))
-                                history = history_utils.sanitise_tool_outputs(history)
-
+                    await turn.run(run_turn(turn, history, should_speak, full_system_prompt, all_tools, tool_to_session, adopted))
                 except Exception as e: print(f"[ERROR] LLM Loop: {e}")
                 finally: state.set_processing(False)
+                compactor.maybe_compact(history)
 
     finally:
+        graph.cancel()
+        engine, mic = graph.result("audio"), graph.result("mic")
+        if engine: print(f"{Fore.LIGHTBLACK_EX}[AUDIO] Playback stats: {engine.stats()}{Style.RESET_ALL}")
+        if mic: print(f"{Fore.LIGHTBLACK_EX}[AUDIO] Mic stats: {mic.stats()}{Style.RESET_ALL}")
+        print(f"{Fore.LIGHTBLACK_EX}[TTS CACHE] {services.pcm_cache.stats()}{Style.RESET_ALL}")
+        for name, manager in services.cache_managers.items():
+            print(f"{Fore.LIGHTBLACK_EX}[CACHE] Context cache ({name}): {manager.stats()}{Style.RESET_ALL}")
+        print(f"{Fore.LIGHTBLACK_EX}[ROUTER] {services.router.stats()}{Style.RESET_ALL}")
+        if graph.result("mcp"): print(f"{Fore.LIGHTBLACK_EX}[MCP] {graph.result('mcp').stats()}{Style.RESET_ALL}")
+        print(f"{Fore.LIGHTBLACK_EX}[METRICS] Tokens: {metrics.token_summary().get('total', {})}{Style.RESET_ALL}")
+        if state.speculator: print(f"{Fore.LIGHTBLACK_EX}[SPECULATION] {state.speculator.stats()}{Style.RESET_ALL}")
+        services.pcm_cache.close()
         subprocess.run(["pkill", "-f", "imcp-server"], stderr=subprocess.DEVNULL)
         if history: await context_manager.generate_and_save_summary(history, services)
+        metrics.close()
 
 if __name__ == "__main__":
     try: asyncio.run(main())
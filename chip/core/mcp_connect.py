@@ -1,48 +1,355 @@
 import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
 from mcp.client.stdio import stdio_client
 from mcp import ClientSession
-from chip.utils import schema
+from chip.utils import config, schema, metrics
+from chip.core import state
 from colorama import init, Fore, Style
 init(autoreset=True)
 
-async def connect_single_server(stack, tool_manager, server_name):
-    """Connects to a single server and returns its tools and session."""
-    params = tool_manager.get_server_params(server_name)
+MANIFEST_FILE = getattr(config, 'MCP_MANIFEST_FILE', os.path.join("data", "mcp_manifest.json"))
+
+# --- Tool manifest: the tool list of each server as of its last connect ---
+def server_fingerprint(server_config):
+    """
+    Hash of the server's command, args and env, plus the size and mtime of
+    the executable and of any args that are files (scripts, dist bundles),
+    so an updated server invalidates its manifest entry.
+    """
+    h = hashlib.sha256(json.dumps(server_config, sort_keys=True, default=str).encode())
+    command = shutil.which(server_config["command"]) or server_config["command"]
+    for item in [command, *server_config.get("args", [])]:
+        if isinstance(item, str) and os.path.isfile(item):
+            st = os.stat(item)
+            h.update(f"\0{item}:{st.st_size}:{st.st_mtime_ns}".encode())
+    return h.hexdigest()
+
+def load_manifest():
     try:
-        print(f"{Fore.YELLOW}[/] BOOTING {server_name}...{Style.RESET_ALL}")
-        read, write = await stack.enter_async_context(stdio_client(params))
-        session = await stack.enter_async_context(ClientSession(read, write))
-        await session.initialize()
-        
-        mcp_tools_list = await session.list_tools()
-        
-        for tool in mcp_tools_list.tools:
-            if hasattr(tool, "inputSchema"):
-                tool.inputSchema = schema.clean_schema(tool.inputSchema)
-        
-        formatted_tools = tool_manager.get_openai_tools(mcp_tools_list.tools)
-        
-        server_tool_to_session = {t.name: session for t in mcp_tools_list.tools}
-        print(f"{Fore.GREEN}[+] BOOTED {server_name} with tools: {list(server_tool_to_session.keys())}{Style.RESET_ALL}")
-        
-        return formatted_tools, server_tool_to_session
-    except Exception as e:
-        print(f"{Fore.RED}[-] BOOTING FAILED {server_name}: {e}{Style.RESET_ALL}")
-        return [], {}
-
-async def connect_servers(stack, tool_manager, config_servers):
+        with open(MANIFEST_FILE, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_manifest(manifest):
+    os.makedirs(os.path.dirname(MANIFEST_FILE), exist_ok=True)
+    tmp = MANIFEST_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, MANIFEST_FILE)
+
+class ServerHandle:
+    """
+    One MCP server. Its tools can be advertised from the manifest before it
+    runs; it is spawned on the first call to one of them (or by start()).
+    The connection lives in its own task, so the server can be stopped
+    without touching the others. Stands in for the ClientSession in
+    tool_to_session: call_tool() waits for the server to be up.
+
+    Once up, the server is supervised: a lost connection or an unanswered
+    ping respawns it (only it) with exponential backoff. Calls made during
+    recovery wait up to MCP_RECOVERY_WAIT_SECONDS for it to come back.
+    Pings pause while a call is running, so each call has its own deadline
+    (MCP_CALL_TIMEOUT_SECONDS); a call that misses it is checked like a
+    failed one.
+    """
+    def __init__(self, name, tool_manager, tools=None, timeline=None, gate=None, on_connect=None):
+        self.name = name
+        self.tool_manager = tool_manager
+        self.tools = tools          # OpenAI-style specs; None until known
+        self.timeline = timeline
+        self.gate = gate            # awaited before spawning (e.g. the iMCP app restart)
+        self.on_connect = on_connect
+        self.session = None
+        self._runner = None
+        self._ready = None
+        self._stop = None
+        # Supervision
+        self.ping_seconds = getattr(config, 'MCP_PING_SECONDS', 30)
+        self.ping_timeout = getattr(config, 'MCP_PING_TIMEOUT', 5)
+        self.recovery_wait = getattr(config, 'MCP_RECOVERY_WAIT_SECONDS', 10)
+        self.call_timeout = getattr(config, 'MCP_CALL_TIMEOUT_SECONDS', 120)
+        self._supervisor = None
+        self._recovery = None       # future, resolved when a respawn succeeds
+        self._inflight = 0
+        self._down_since = None
+        self.restarts = 0
+        self.downtime = 0.0
+        self.last_error = None
+
+    @property
+    def tool_names(self):
+        return [t["function"]["name"] for t in self.tools or []]
+
+    @property
+    def running(self):
+        return self.session is not None
+
+    @property
+    def recovering(self):
+        return self._recovery is not None and not self._recovery.done()
+
+    async def start(self):
+        """Spawns the server if it is not running; returns its session."""
+        if self._runner is None or self._runner.done():
+            self._ready = asyncio.get_running_loop().create_future()
+            self._stop = asyncio.Event()
+            self._runner = asyncio.create_task(self._run())
+        return await asyncio.shield(self._ready)
+
+    async def call_tool(self, name, arguments):
+        if self.recovering:
+            print(f"{Fore.LIGHTBLACK_EX}[MCP] {name} queued while {self.name} recovers{Style.RESET_ALL}")
+            await self._await_recovery(self._recovery)
+        session = await self.start()
+        self._inflight += 1
+        try:
+            return await self._call(session, name, arguments)
+        except Exception as e:
+            problem = await self._ping(session)
+            if problem is None:
+                raise   # The server is fine; the call itself failed
+            await self._await_recovery(self.recover(f"{name} failed ({e}); {problem}"))
+            if name in config.SIDE_EFFECT_TOOLS:
+                raise   # May have run before the connection broke: never repeated blindly
+            return await self._call(self._ready.result(), name, arguments)
+        finally:
+            self._inflight -= 1
+
+    async def _call(self, session, name, arguments):
+        try:
+            return await asyncio.wait_for(session.call_tool(name, arguments), self.call_timeout)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"no reply from {self.name} in {self.call_timeout}s") from None
+
+    async def _await_recovery(self, recovery):
+        try:
+            await asyncio.wait_for(asyncio.shield(recovery), self.recovery_wait)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"{self.name} is still recovering ({self.last_error})") from None
+
+    async def stop(self):
+        if self._runner and not self._runner.done():
+            self._stop.set()
+            try:
+                await asyncio.wait_for(asyncio.gather(self._runner, return_exceptions=True), 5)
+            except asyncio.TimeoutError:
+                self._runner.cancel()   # Hung on shutdown: drop the connection
+
+    async def close(self):
+        if self._supervisor: self._supervisor.cancel()
+        await self.stop()
+
+    async def _run(self):
+        if self.gate is not None:
+            await asyncio.gather(self.gate, return_exceptions=True)
+        params = self.tool_manager.get_server_params(self.name)
+        started = metrics.now_ms()
+        try:
+            print(f"{Fore.YELLOW}[/] BOOTING {self.name}...{Style.RESET_ALL}")
+            async with stdio_client(params) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+
+                    mcp_tools_list = await session.list_tools()
+
+                    for tool in mcp_tools_list.tools:
+                        if hasattr(tool, "inputSchema"):
+                            tool.inputSchema = schema.clean_schema(tool.inputSchema)
+
+                    formatted_tools = self.tool_manager.get_openai_tools(mcp_tools_list.tools)
+                    self.session = session
+                    print(f"{Fore.GREEN}[+] BOOTED {self.name} with tools: {[t.name for t in mcp_tools_list.tools]}{Style.RESET_ALL}")
+                    if self.timeline: self.timeline.add(f"mcp {self.name}", started, metrics.now_ms())
+                    if self.on_connect: self.on_connect(self, formatted_tools)
+                    self._ready.set_result(session)
+                    if self._supervisor is None:
+                        self._supervisor = asyncio.create_task(self._supervise())
+                    await self._stop.wait()
+        except Exception as e:
+            if self._ready.done():
+                # Was up: the process died or its pipes broke
+                if not self._stop.is_set():
+                    self.recover(f"connection lost ({e})")
+            else:
+                print(f"{Fore.RED}[-] BOOTING FAILED {self.name}: {e}{Style.RESET_ALL}")
+                if self.timeline: self.timeline.add(f"mcp {self.name} (failed)", started, metrics.now_ms())
+                self._ready.set_exception(e)
+        finally:
+            self.session = None
+
+    # --- Supervision ---
+    async def _ping(self, session):
+        """None if the server answers a ping in time, otherwise what went wrong."""
+        if session is None or self._runner is None or self._runner.done():
+            return "process exited"
+        try:
+            await asyncio.wait_for(session.send_ping(), self.ping_timeout)
+            return None
+        except asyncio.TimeoutError:
+            return f"no ping reply in {self.ping_timeout}s"
+        except Exception as e:
+            return f"ping failed ({e})"
+
+    async def _supervise(self):
+        while True:
+            await asyncio.sleep(self.ping_seconds)
+            # A long tool call looks like a hang to a ping; a broken pipe during one surfaces in _run
+            if self.recovering or self._inflight or (self._stop and self._stop.is_set()):
+                continue
+            problem = await self._ping(self.session)
+            if problem:
+                self.recover(problem)
+
+    def recover(self, reason):
+        """Starts respawning this server (once, however many callers notice); returns the recovery future."""
+        if not self.recovering:
+            self._recovery = asyncio.get_running_loop().create_future()
+            asyncio.create_task(self._respawn(reason))
+        return self._recovery
+
+    async def _respawn(self, reason):
+        down_since = self._down_since = time.time()
+        self.last_error = reason
+        print(f"{Fore.YELLOW}[MCP] {self.name} unhealthy: {reason}. Respawning...{Style.RESET_ALL}")
+        await self.stop()
+        delay = getattr(config, 'MCP_RESPAWN_BACKOFF', 1.0)
+        while True:
+            try:
+                await self.start()
+                break
+            except Exception as e:
+                self.last_error = str(e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, getattr(config, 'MCP_RESPAWN_BACKOFF_MAX', 60))
+        self.restarts += 1
+        self.downtime += time.time() - down_since
+        print(f"{Fore.GREEN}[MCP] {self.name} recovered after {time.time() - down_since:.1f}s{Style.RESET_ALL}")
+        self._recovery.set_result(None)
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "restarts": self.restarts,
+            "downtime_s": round(self.downtime + (time.time() - self._down_since if self.recovering else 0), 1),
+            "last_error": self.last_error,
+        }
+
+class McpServers:
     """
-    Connects to all config servers asynchronously.
-    Returns: (all_tools_list, tool_to_session_map)
+    All configured MCP servers. Servers with a current manifest entry are
+    advertised from it at once and spawned lazily: on the first call to one
+    of their tools, or in the background once Chip has been idle for
+    MCP_IDLE_SPAWN_SECONDS. Servers without one are spawned during boot.
+    After every connect the live tool list is checked against the manifest;
+    on drift the manifest is rewritten and `tools` is rebuilt.
     """
-    tasks = [connect_single_server(stack, tool_manager, s) for s in config_servers]
-    results = await asyncio.gather(*tasks)
-    
-    all_tools = []
-    tool_to_session = {}
-    
-    for formatted_tools, server_tool_to_session in results:
-        all_tools.extend(formatted_tools)
-        tool_to_session.update(server_tool_to_session)
-        
-    return all_tools, tool_to_session
+    def __init__(self, tool_manager, server_configs, base_tools=(), timeline=None, on_ready=None, gates=None):
+        self.tool_manager = tool_manager
+        self.server_configs = server_configs
+        self.base_tools = list(base_tools)
+        self.timeline = timeline
+        self.on_ready = on_ready
+        self.gates = gates or {}
+        self.manifest = load_manifest()
+        self.handles = {}
+        self.tools = list(self.base_tools)     # replaced, never mutated, so caches keyed on it stay valid
+        self.tool_to_session = {}
+        self._idle_task = None
+
+    async def start(self):
+        """Advertises cached servers and boots the rest. Returns self."""
+        await self._add(list(self.server_configs))
+        self._idle_task = asyncio.create_task(self._spawn_when_idle())
+        return self
+
+    async def _add(self, names):
+        """Creates handles for `names`: advertised from the manifest when current, otherwise booted now."""
+        fresh = []
+        for name in names:
+            server_config = self.server_configs[name]
+            entry = self.manifest.get(name)
+            current = entry is not None and entry.get("fingerprint") == server_fingerprint(server_config)
+            handle = ServerHandle(name, self.tool_manager, entry["tools"] if current else None,
+                                  self.timeline, self.gates.get(name), self._on_connect)
+            self.handles[name] = handle
+            if not current:
+                fresh.append(handle)
+
+        cached = [self.handles[n] for n in names if self.handles[n].tools is not None]
+        if cached:
+            print(f"{Fore.GREEN}[+] Tools from manifest (spawned on first use): {', '.join(h.name for h in cached)}{Style.RESET_ALL}")
+        for handle in cached:
+            if self.on_ready: self.on_ready(handle.name, {t: handle for t in handle.tool_names})
+        await asyncio.gather(*[h.start() for h in fresh], return_exceptions=True)
+        self._rebuild()
+
+    async def reload(self, server_configs, base_tools=None):
+        """
+        Applies a new MCP_SERVERS: only servers that were added, removed or
+        whose config changed are (re)connected; the rest keep their sessions.
+        Returns {"added", "changed", "removed"} server names.
+        """
+        if base_tools is not None:
+            self.base_tools = list(base_tools)
+        old, self.server_configs = self.server_configs, server_configs
+        self.tool_manager.server_configs = server_configs
+        diff = {
+            "added": [n for n in server_configs if n not in old],
+            "changed": [n for n in server_configs if n in old and old[n] != server_configs[n]],
+            "removed": [n for n in old if n not in server_configs],
+        }
+        self.gates = {}     # boot-time gates (iMCP restart) are long done
+        await asyncio.gather(*[self.handles.pop(n).close() for n in diff["changed"] + diff["removed"] if n in self.handles],
+                             return_exceptions=True)
+        await self._add(diff["added"] + diff["changed"])
+        return diff
+
+    def _on_connect(self, handle, tools):
+        tools = json.loads(json.dumps(tools, default=str))     # compare like-for-like with the JSON manifest
+        server_config = self.server_configs[handle.name]
+        entry = self.manifest.get(handle.name) or {}
+        if entry.get("tools") != tools or entry.get("fingerprint") != server_fingerprint(server_config):
+            self.manifest[handle.name] = {"fingerprint": server_fingerprint(server_config), "tools": tools}
+            save_manifest(self.manifest)
+
+        advertised, handle.tools = handle.tools, tools
+        if advertised is None:
+            # Booted without a manifest entry: its tools are new to the caller
+            if self.on_ready: self.on_ready(handle.name, {t: handle for t in handle.tool_names})
+        elif advertised != tools:
+            old, new = {t["function"]["name"] for t in advertised}, set(handle.tool_names)
+            changes = [f"+{n}" for n in sorted(new - old)] + [f"-{n}" for n in sorted(old - new)] or ["schemas"]
+            print(f"{Fore.YELLOW}[MCP] {handle.name} tools changed since the manifest ({', '.join(changes)}); updated{Style.RESET_ALL}")
+            self._rebuild()
+
+    def _rebuild(self):
+        tools = list(self.base_tools)
+        tool_to_session = {}
+        for handle in self.handles.values():
+            tools.extend(handle.tools or [])
+            tool_to_session.update({t: handle for t in handle.tool_names})
+        self.tools, self.tool_to_session = tools, tool_to_session
+
+    async def _spawn_when_idle(self):
+        idle_seconds = getattr(config, 'MCP_IDLE_SPAWN_SECONDS', 30)
+        if idle_seconds is None:
+            return
+        await asyncio.sleep(idle_seconds)
+        for handle in list(self.handles.values()):
+            while state.IS_PROCESSING:
+                await asyncio.sleep(1)
+            if not handle.running:
+                await asyncio.gather(handle.start(), return_exceptions=True)
+
+    def stats(self):
+        """Per server that has been spawned: running, restarts, downtime, last error."""
+        return {name: h.stats() for name, h in self.handles.items() if h._runner is not None}
+
+    async def close(self):
+        if self._idle_task: self._idle_task.cancel()
+        await asyncio.gather(*[h.close() for h in self.handles.values()], return_exceptions=True)
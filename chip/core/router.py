@@ -0,0 +1,131 @@
+import re
+import sys
+from collections import Counter
+from colorama import Fore, Style, init
+
+from chip.utils import config, metrics
+
+init(autoreset=True)
+
+def _tool_words(name):
+    """'calendar_findFreeTime' -> {'calendar', 'find', 'free', 'time'}"""
+    return {w.lower() for w in re.findall(r"[A-Z]?[a-z]+", name) if len(w) > 2}
+
+def _stem(word):
+    return word[:-1] if word.endswith("s") and len(word) > 3 else word
+
+def _normalise(text):
+    """Lower-cased, stemmed words joined by single spaces and padded, for whole-word phrase matching."""
+    return " " + " ".join(_stem(w) for w in re.findall(r"[a-z']+", text.lower())) + " "
+
+class ModelRouter:
+    """
+    Picks a route (model + thinking level from LLM_ROUTES) per user turn from
+    cheap features: transcript length, whether the previous turn used tools,
+    and which tools the transcript points at (ROUTER_TOOL_KEYWORDS, or the
+    words of the tool's name minus ROUTER_STOPWORDS for tools it does not
+    list). Routes are ordered cheapest first; escalate() moves a failing
+    round to the next one.
+    """
+    def __init__(self, routes=None, default=None):
+        self.routes = routes or getattr(config, 'LLM_ROUTES', {"default": {"model": config.LLM_MODEL}})
+        self.order = list(self.routes)
+        self.default = default or getattr(config, 'LLM_DEFAULT_ROUTE', self.order[0])
+        self.capable = self.order[-1]
+        self.long_words = getattr(config, 'ROUTER_LONG_WORDS', 25)
+        self.capable_tools = getattr(config, 'ROUTER_CAPABLE_TOOLS', set())
+        keywords = getattr(config, 'ROUTER_TOOL_KEYWORDS', {})
+        stopwords = getattr(config, 'ROUTER_STOPWORDS', set())
+        self._keywords = {
+            name: {_normalise(k) for k in keywords.get(name) or _tool_words(name) - stopwords}
+            for name in config.TOOL_SPECIFIC_FILLERS
+        }
+        self.previous_used_tools = False
+        self.counts = Counter()
+        self.escalations = 0
+
+    def settings(self, route):
+        return self.routes.get(route) or self.routes[self.default]
+
+    def likely_tools(self, transcript):
+        text = _normalise(transcript)
+        return [name for name, keywords in self._keywords.items() if any(k in text for k in keywords)]
+
+    def choose(self, transcript):
+        """Returns (route, reason) for a user turn."""
+        if len(self.order) == 1:
+            return self.default, "single route"
+        words = len(transcript.split())
+        likely = self.likely_tools(transcript)
+        heavy = [t for t in likely if t in self.capable_tools]
+        if heavy:
+            route, reason = self.capable, f"tools {', '.join(heavy)}"
+        elif words > self.long_words:
+            route, reason = self.capable, f"{words} words"
+        elif self.previous_used_tools and not likely:
+            route, reason = self.capable, "follow-up to a tool turn"
+        else:
+            route, reason = self.default, f"{words} words" + (f", tools {', '.join(likely)}" if likely else "")
+        return route, reason
+
+    def route_for(self, history):
+        """Route for the latest user text message in `history`."""
+        for content in reversed(history):
+            if content.role == "user":
+                text = " ".join(p.text for p in content.parts or [] if p.text)
+                if text:
+                    return self.choose(text)
+        return self.default, "no user text"
+
+    def note_turn(self, route, used_tools):
+        self.counts[route] += 1
+        self.previous_used_tools = used_tools
+
+    def escalate(self, route, error):
+        i = self.order.index(route) if route in self.order else len(self.order) - 1
+        if i + 1 >= len(self.order):
+            return None
+        self.escalations += 1
+        nxt = self.order[i + 1]
+        print(f"{Fore.YELLOW}[ROUTER] {route} -> {nxt}: {error}{Style.RESET_ALL}")
+        return nxt
+
+    def stats(self):
+        latency = metrics.latency_summary()
+        return {
+            "turns": dict(self.counts),
+            "escalations": self.escalations,
+            "first_chunk_p50_ms": {r: latency[f"llm_first_chunk_{r}"]["p50"] for r in self.order if f"llm_first_chunk_{r}" in latency},
+        }
+
+# --- Self-check: python -m chip.core.router ---
+CASES = [
+    # (transcript, previous turn used tools, expected route)
+    ("can you get me the weather", False, "fast"),
+    ("any new messages", False, "fast"),
+    ("create a reminder to buy milk", False, "fast"),
+    ("send a text to mom", False, "fast"),
+    ("what time is it", False, "fast"),
+    ("play some jazz", False, "fast"),
+    ("what about tomorrow", True, "capable"),
+    ("and the day after", True, "capable"),
+    ("what's on my calendar tomorrow", True, "fast"),
+    ("send an email to Sam saying I'm running late", False, "capable"),
+    ("search the web for flights to Rome", False, "capable"),
+    ("run the backup script in the terminal", False, "capable"),
+]
+
+def main():
+    # Shipped ROUTER_TOOL_KEYWORDS / ROUTER_CAPABLE_TOOLS, two stand-in routes
+    router = ModelRouter(routes={"fast": {"model": "fast"}, "capable": {"model": "capable"}}, default="fast")
+    failures = 0
+    for transcript, used_tools, expected in CASES:
+        router.previous_used_tools = used_tools
+        route, reason = router.choose(transcript)
+        ok = route == expected
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {transcript!r}: {route} ({reason}){'' if ok else f', expected {expected}'}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
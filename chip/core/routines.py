@@ -1,131 +1,150 @@
+import asyncio
+import datetime
 import time
 from google.genai import types
-from chip.utils import config
-from chip.core import state
+from chip.utils import config, metrics, tools_handler
+from chip.core import state, tts_pipeline
 from colorama import Fore, Style, init
 
 init(autoreset=True)
 
-async def run_startup_routine(services, history, system_prompt, all_tools, tool_to_session, personality, summary):
+def _prefetch_args(args):
+    """Fills the {today_start}/{today_end}/{tomorrow_end} placeholders in STARTUP_PREFETCH arguments."""
+    today = datetime.datetime.now().astimezone().replace(hour=0, minute=0, second=0, microsecond=0)
+    times = {
+        "today_start": today.isoformat(),
+        "today_end": (today + datetime.timedelta(days=1)).isoformat(),
+        "tomorrow_end": (today + datetime.timedelta(days=2)).isoformat(),
+    }
+    return {k: v.format(**times) if isinstance(v, str) else v for k, v in (args or {}).items()}
+
+class StartupRoutine:
     """
-    Performs a Quick Recall on every boot.
-    Only performs a Full Startup (Calendar/Email) if > 1 hour since last boot.
+    Performs a Quick Recall on every boot, or a Full Startup (Calendar/Email)
+    if more than QUICK_RECALL_SECONDS since the last one.
+
+    The full startup always needs the same data, so those calls
+    (STARTUP_PREFETCH) start as soon as their server has booted, while the
+    other servers are still coming up, and go into the startup prompt. Tools
+    the model asks for on top run in parallel, and the greeting is streamed
+    through the TTS pipeline as it is generated. Every stage is recorded on
+    the boot timeline.
     """
-    state_data = state._load_state()
-    last_startup = state_data.get("last_startup", 0)
-    time_since_boot = time.time() - last_startup
-    
-    context_block = (
-        f"### CURRENT CONFIGURATION\n"
-        f"{personality}\n\n"
-        f"### MEMORY (PREVIOUS SESSION)\n"
-        f"{summary}\n\n"
-        f"### INSTRUCTION\n"
-        f"Internalise the personality and memory above for this session. "
-    )
+    def __init__(self, services, timeline=None):
+        self.services = services
+        self.timeline = timeline or metrics.BootTimeline()
+        last_startup = state._load_state().get("last_startup", 0)
+        self.full = time.time() - last_startup > getattr(config, 'QUICK_RECALL_SECONDS', 3600)
+        self.wanted = getattr(config, 'STARTUP_PREFETCH', {}) if self.full else {}
+        self.prefetch = {}  # tool name -> task
+        self.tts = None
+
+    def begin(self, speak=True):
+        """Call once audio is up, before the MCP servers are: the announcement plays while they boot."""
+        if speak:
+            self.tts = tts_pipeline.TtsPipeline()
+        if self.full:
+            print(f"{Fore.LIGHTBLACK_EX}[SYSTEM] Initiating Full Startup Routine...{Style.RESET_ALL}")
+            if self.tts: self.tts.say("Initiating full startup routine")
+            state._update_state({"last_startup": time.time()})
+
+    def on_server_ready(self, server_name, tool_to_session):
+        """mcp_connect on_ready hook: starts the prefetches this server can serve."""
+        for name, args in self.wanted.items():
+            if name in tool_to_session and name not in self.prefetch:
+                self.prefetch[name] = asyncio.create_task(self._fetch(tool_to_session[name], name, _prefetch_args(args)))
+
+    async def _fetch(self, session, name, args):
+        with self.timeline.stage(f"prefetch {name}"):
+            return await tools_handler.execute_tool(session, name, args)
 
-    if time_since_boot <= 3600:
-        startup_prompt = (
+    async def _prefetched(self):
+        """Prefetch results as a prompt block; calls still running after STARTUP_PREFETCH_TIMEOUT are left out."""
+        if not self.wanted:
+            return ""
+        tasks = list(self.prefetch.values())
+        if tasks:
+            with self.timeline.stage("prefetch wait"):
+                await asyncio.wait(tasks, timeout=getattr(config, 'STARTUP_PREFETCH_TIMEOUT', 10))
+        blocks = []
+        for name in self.wanted:
+            task = self.prefetch.get(name)
+            if task is None:
+                continue    # Server not available: the model can still try the tool itself
+            if not task.done():
+                task.cancel()
+                continue
+            result = tools_handler.spill_store.spill(task.result(), name)
+            blocks.append(f"#### {name}\n{result}")
+        return "### PREFETCHED TOOL RESULTS\n" + "\n\n".join(blocks) + "\n\n" if blocks else ""
+
+    def _prompt(self, personality, summary, prefetched):
+        context_block = (
+            f"### CURRENT CONFIGURATION\n"
+            f"{personality}\n\n"
+            f"### MEMORY (PREVIOUS SESSION)\n"
+            f"{summary}\n\n"
+            f"### INSTRUCTION\n"
+            f"Internalise the personality and memory above for this session. "
+        )
+        if not self.full:
+            return (
+                f"{context_block}\n"
+                f"SYSTEM QUICK RECALL initiated at {config.TIME} on {config.DATE}. "
+                "1. Use the 'recall' tool to check for any immediate 'active projects' or 'current focus' in my memory to ensure you are up to date."
+                "2. Synthesize that result with the context above into a warm, very short spoken greeting (under 15 words). (don't tell the user that you're ready to assist or anything similar)"
+            )
+        return (
             f"{context_block}\n"
-            f"SYSTEM QUICK RECALL initiated at {config.TIME} on {config.DATE}. "
-            "1. Use the 'recall' tool to check for any immediate 'active projects' or 'current focus' in my memory to ensure you are up to date."
-            "2. Synthesize that result with the context above into a warm, very short spoken greeting (under 15 words). (don't tell the user that you're ready to assist or anything similar)"
+            f"{prefetched}"
+            f"SYSTEM STARTUP PROTOCOL initiated at {config.TIME} on {config.DATE}. "
+            "1. Today's Google Calendar events and unread emails are above where available; use your tools only for anything missing or failed. "
+            "2. Synthesise these findings + your memory into a warm, short spoken greeting."
         )
-        
-        history.append(types.Content(role="user", parts=[types.Part.from_text(text=startup_prompt)]))
-        
-        short_startup_complete = False
-        startup_turns = 0
-        
-        while not short_startup_complete and startup_turns < 5:
-            startup_turns += 1
-            response = await services.ask_llm(history, system_instruction=system_prompt, tools=all_tools)
-            if not response.candidates: break
-            
-            candidate = response.candidates[0]
-            history.append(candidate.content)
-            
-            tool_calls = [p.function_call for p in candidate.content.parts if p.function_call]
-            text_parts = [p.text for p in candidate.content.parts if p.text]
 
-            for text in text_parts:
-                print(f"{Fore.MAGENTA}[CHIP] {text}{Style.RESET_ALL}")
-                await services.stream_tts(iter([text]))
-            
-            if not tool_calls:
-                short_startup_complete = True
-                print(f"{Fore.LIGHTBLACK_EX}[SYSTEM] Quick Recall complete.{Style.RESET_ALL}")
-            else:
-                response_parts = []
-                for fn in tool_calls:
-                    fname, fargs = fn.name, fn.args
-                    session = tool_to_session.get(fname)
-                    res_str = ""
-                    if session:
-                        try:
-                            print(f"{Fore.LIGHTBLACK_EX}[SYSTEM] Quick Recall Tool: {fname}{Style.RESET_ALL}")
-                            res = await session.call_tool(fname, fargs)
-                            res_str = "".join([c.text if hasattr(c, 'text') else str(c) for c in res.content])
-                        except Exception as e: res_str = f"Error: {e}"
-                    else: res_str = f"Error: Tool {fname} not found."
-                    response_parts.append(types.Part.from_function_response(name=fname, response={"result": res_str}))
-                
-                history.append(types.Content(role="user", parts=response_parts))
-        
+    async def run(self, history, system_prompt, all_tools, tool_to_session, personality, summary):
+        label = "Full Startup" if self.full else "Quick Recall"
+        try:
+            prefetched = await self._prefetched()
+            history.append(types.Content(role="user", parts=[types.Part.from_text(text=self._prompt(personality, summary, prefetched))]))
+
+            for round_index in range(getattr(config, 'STARTUP_MAX_ROUNDS', 5)):
+                parts = await self._round(history, system_prompt, all_tools, round_index)
+                if not parts: break
+                history.append(types.Content(role="model", parts=parts))
+
+                tool_calls = [p.function_call for p in parts if p.function_call]
+                if not tool_calls:
+                    print(f"{Fore.LIGHTBLACK_EX}[SYSTEM] {label} complete.{Style.RESET_ALL}")
+                    break
+
+                tool_names = [fn.name for fn in tool_calls]
+                print(f"{Fore.LIGHTBLACK_EX}[SYSTEM] {label} Tools: {', '.join(tool_names)}{Style.RESET_ALL}")
+                with self.timeline.stage(f"startup tools {round_index}"):
+                    results = await asyncio.gather(*[
+                        tools_handler.execute_tool(tool_to_session.get(fn.name), fn.name, fn.args) for fn in tool_calls
+                    ])
+                history.append(types.Content(role="user", parts=tools_handler.function_responses(tool_names, results)))
+        finally:
+            if self.tts:
+                with self.timeline.stage("greeting audio"):
+                    await self.tts.close()
         return history
-    
-    # PROCEED: Full Startup Routine (Occurs if > 1 hour)
-    print(f"{Fore.LIGHTBLACK_EX}[SYSTEM] Initiating Full Startup Routine...{Style.RESET_ALL}")
-    await services.stream_tts(iter(["Initiating full startup routine"]))
-    
-    state._update_state({"last_startup": time.time()})
-    
-    startup_prompt = (
-        f"{context_block}\n"
-        f"SYSTEM STARTUP PROTOCOL initiated at {config.TIME} on {config.DATE}. "
-        "1. Use your tools to list my Google Calendar events for today. "
-        "2. Check for any unread emails. "
-        "3. Synthesise these findings + your memory into a warm, short spoken greeting."
-    )
-    
-    history.append(types.Content(role="user", parts=[types.Part.from_text(text=startup_prompt)]))
-    
-    startup_complete = False
-    startup_turns = 0
-    
-    while not startup_complete and startup_turns < 5:
-        startup_turns += 1
-        response = await services.ask_llm(history, system_instruction=system_prompt, tools=all_tools)
-        if not response.candidates: break
-        
-        candidate = response.candidates[0]
-        history.append(candidate.content)
-        
-        tool_calls = [p.function_call for p in candidate.content.parts if p.function_call]
-        text_parts = [p.text for p in candidate.content.parts if p.text]
 
-        for text in text_parts:
-            print(f"{Fore.LIGHTBLACK_EX}[CHIP (Startup)] {text}{Style.RESET_ALL}")
-            await services.stream_tts(iter([text]))
-        
-        if not tool_calls:
-            startup_complete = True
-            print(f"{Fore.LIGHTBLACK_EX}[SYSTEM] Full Startup complete.{Style.RESET_ALL}")
-        else:
-            response_parts = []
-            for fn in tool_calls:
-                fname, fargs = fn.name, fn.args
-                session = tool_to_session.get(fname)
-                res_str = ""
-                if session:
-                    try:
-                        print(f"{Fore.LIGHTBLACK_EX}[SYSTEM] Startup Tool: {fname}{Style.RESET_ALL}")
-                        res = await session.call_tool(fname, fargs)
-                        res_str = "".join([c.text if hasattr(c, 'text') else str(c) for c in res.content])
-                    except Exception as e: res_str = f"Error: {e}"
-                else: res_str = f"Error: Tool {fname} not found."
-                response_parts.append(types.Part.from_function_response(name=fname, response={"result": res_str}))
-            
-            history.append(types.Content(role="user", parts=response_parts))
-            
-    return history
\ No newline at end of file
+    async def _round(self, history, system_prompt, all_tools, round_index):
+        parts = []
+        colour, prefix = (Fore.LIGHTBLACK_EX, "[CHIP (Startup)]") if self.full else (Fore.MAGENTA, "[CHIP]")
+        speaking = False
+        with self.timeline.stage(f"startup llm {round_index}"):
+            async for chunk in self.services.ask_llm_stream(history, system_instruction=system_prompt, tools=all_tools,
+                                                            site="startup", round_index=round_index):
+                if chunk["type"] == "text":
+                    if not speaking:
+                        speaking = True
+                        print(f"{colour}{prefix} ", end="", flush=True)
+                    print(f"{colour}{chunk['content']}{Style.RESET_ALL} ", end="", flush=True)
+                    if self.tts: self.tts.say(chunk["content"], round_index)
+                elif chunk["type"] == "complete_message":
+                    parts = chunk["content"]
+        if speaking: print(Style.RESET_ALL)
+        return parts
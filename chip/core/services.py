@@ -1,19 +1,22 @@
 import asyncio
 import json
 import sys
+import time
 import httpx
-import re
 import os
-import subprocess
-import time
 import datetime
 from google import genai
 from google.genai import types
 import websockets
-import struct
+import numpy as np
 
-from chip.utils import config
-from chip.core import state
+from chip.utils import config, metrics, history as history_utils
+from chip.utils.segmenter import SentenceSegmenter
+from chip.core import state, turns, end_of_turn
+from chip.core.gemini_cache import CacheManager, with_current_time
+from chip.core.router import ModelRouter
+from chip.audio import dsp
+from chip.audio.tts_cache import PcmCache
 
 from colorama import init, Fore, Style
 init(autoreset=True)
@@ -21,7 +24,23 @@ init(autoreset=True)
 client = genai.Client(api_key=config.GEMINI_API_KEY)
 httpx_client = httpx.AsyncClient(timeout=10.0)
 
-ACTIVE_CACHE = None
+router = ModelRouter()
+# One context cache per route: a cache only serves the model it was created for
+cache_managers = {name: CacheManager(client, model=route["model"]) for name, route in router.routes.items()}
+cache_manager = cache_managers[router.default]
+
+def reload_routes():
+    """After a config reload: rebuilds the router, keeping the cache manager of every route whose model is unchanged."""
+    global router, cache_managers, cache_manager
+    router = ModelRouter()
+    cache_managers = {
+        name: cache_managers[name] if name in cache_managers and cache_managers[name].model == route["model"]
+        else CacheManager(client, model=route["model"])
+        for name, route in router.routes.items()
+    }
+    cache_manager = cache_managers[router.default]
+
+pcm_cache = PcmCache()
 
 # --- System Utilities ---
 def console_listener(loop):
@@ -33,134 +52,92 @@ def console_listener(loop):
                 asyncio.run_coroutine_threadsafe(state.input_queue.put(payload), loop)
         except: break
 
-def restart_imcp():
+async def _run(*cmd):
+    proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+    return await proc.wait()
+
+async def restart_imcp():
     print(f"{Fore.LIGHTBLACK_EX}[SYSTEM] Restarting iMCP to ensure clean connection...{Style.RESET_ALL}")
-    subprocess.run(["pkill", "-f", "iMCP"], stderr=subprocess.DEVNULL)
-    subprocess.run(["pkill", "-f", "imcp-server"], stderr=subprocess.DEVNULL)
-    time.sleep(1)
+    await _run("pkill", "-f", "iMCP")
+    await _run("pkill", "-f", "imcp-server")
+    await asyncio.sleep(1)
     try:
-        subprocess.run(
-            ["open", "/Applications/iMCP.app"], 
-            check=True, 
-            stdout=subprocess.DEVNULL, 
-            stderr=subprocess.DEVNULL
-        )
+        code = await _run("open", "/Applications/iMCP.app")
+        if code != 0:
+            raise RuntimeError(f"open exited with status {code}")
         print(f"{Fore.LIGHTBLACK_EX}[SYSTEM] iMCP launching... waiting 1s for initialisation...{Style.RESET_ALL}")
-        time.sleep(1) 
+        await asyncio.sleep(1)
     except Exception as e:
         print(f"{Fore.RED}[ERROR] Failed to launch iMCP: {e}{Style.RESET_ALL}")
 
-def _convert_tools_to_gemini(openai_tools):
-    if not openai_tools:
-        return None
-    declarations = []
-    for tool in openai_tools:
-        f = tool['function']
-        params = f.get('parameters', {}).copy()
-        if '$schema' in params:
-            del params['$schema']
-        declarations.append(types.FunctionDeclaration(
-            name=f['name'],
-            description=f.get('description'),
-            parameters=params 
-        ))
-    return [types.Tool(function_declarations=declarations)]
-
 STATE_FILE = f"data/{config.STATE_JSON}"
 
-def _get_or_create_cache(system_instruction, tools):
-    global ACTIVE_CACHE
-    gemini_tools = _convert_tools_to_gemini(tools) if tools else None
-    ttl_seconds = f"{config.CACHE_SECONDS}s"
-
-    if ACTIVE_CACHE is None:
-        state_data = state._load_state()
-        cache_name = state_data.get("cache_name")
-        
-        if cache_name:
-            try:
-                # Verify cache actually exists on server
-                ACTIVE_CACHE = client.caches.get(name=cache_name)
-                print(f"{Fore.GREEN}[CACHE] Resumed: {ACTIVE_CACHE.name}{Style.RESET_ALL}")
-            except Exception:
-                # Silent fail: Cache expired/deleted. Proceed to create new.
-                ACTIVE_CACHE = None
-
-    # 2. Update TTL if cache exists
-    if ACTIVE_CACHE:
-        try:
-            client.caches.update(
-                name=ACTIVE_CACHE.name,
-                config=types.UpdateCachedContentConfig(ttl=ttl_seconds)
-            )
-            return ACTIVE_CACHE.name
-        except Exception:
-            print(f"{Fore.YELLOW}[CACHE] Refresh failed. Recreating...{Style.RESET_ALL}")
-            ACTIVE_CACHE = None
-
-    try:
-        print(f"{Fore.YELLOW}[CACHE] Creating new Gemini Cache...{Style.RESET_ALL}")
-        ACTIVE_CACHE = client.caches.create(
-            model=config.LLM_MODEL,
-            config=types.CreateCachedContentConfig(
-                display_name="chip_session_cache",
-                system_instruction=system_instruction,
-                tools=gemini_tools,
-                ttl=ttl_seconds
-            )
-        )
-        print(f"{Fore.GREEN}[CACHE] Created: {ACTIVE_CACHE.name}{Style.RESET_ALL}")
-
-        state._update_state({
-            "cache_name": ACTIVE_CACHE.name,
-            "cache_created_at": datetime.datetime.now(datetime.timezone.utc).isoformat()
-        })
-        
-        return ACTIVE_CACHE.name
-
-    except Exception as e:
-        print(f"{Fore.RED}[ERROR] Cache failed: {e}. Falling back to standard requests.{Style.RESET_ALL}")
-        ACTIVE_CACHE = None
-        return None
+def near_end_speech():
+    """
+    Whether a StartOfTurn heard while Chip is talking is the user: only if the
+    echo canceller's double-talk detector heard near-end speech within
+    AEC_BARGE_IN_WINDOW_MS. Residual echo Flux mistakes for speech must not
+    cancel Chip's own reply. Without AEC the mic is muted during playback.
+    """
+    aec = state.echo_canceller
+    if aec is None:
+        return True
+    window = getattr(config, 'AEC_BARGE_IN_WINDOW_MS', 1500) / 1000
+    return aec.near_end_at is not None and time.perf_counter() - aec.near_end_at < window
 
 async def start_deepgram_stt():
     url = (
-        f"wss://api.deepgram.com/v2/listen?"
+        f"{config.DEEPGRAM_STT_URL}?"
         f"model=flux-general-en&"
         f"encoding=linear16&"
-        f"sample_rate={config.SAMPLE_RATE_MIC}" 
+        f"sample_rate={config.SAMPLE_RATE_MIC}"
+        f"{end_of_turn.stt_params()}"
     )
     
     headers = {"Authorization": f"Token {config.DEEPGRAM_API_KEY}"}
-    DIGITAL_GAIN = 3.0
+    mic_dsp = dsp.MicProcessor(samplerate=config.SAMPLE_RATE_MIC)
+
+    # The VAD drops silence locally, so idle periods only need a short keep-alive frame
+    keepalive_samples = int(config.SAMPLE_RATE_MIC * getattr(config, 'STT_KEEPALIVE_MS', 20) / 1000)
+    KEEPALIVE_FRAME = b'\x00' * (keepalive_samples * 2)
 
-    SILENCE_FRAME = b'\x00' * 9600
+    async def dispatch(transcript):
+        print(f"{Fore.GREEN}[USER] {transcript}{Style.RESET_ALL}")
+        await state.input_queue.put({"text": f"[USER] {transcript}", "source": "voice"})
+
+    gate = end_of_turn.EndOfTurnGate(dispatch)
 
     while True:
         try:
             async with websockets.connect(url, additional_headers=headers) as ws:
+                state.stt_ready.set()
+                state.stt_turn_open = False
 
                 async def sender():
                     while True:
                         try:
                             data = await asyncio.wait_for(state.mic_queue.get(), timeout=0.5)
                             
-                            if DIGITAL_GAIN != 1.0 and len(data) % 2 == 0:
-                                count = len(data) // 2
-                                fmt = f"{count}h"
-                                samples = list(struct.unpack(fmt, data))
-                                boosted = [max(min(int(s * DIGITAL_GAIN), 32767), -32768) for s in samples]
-                                data = struct.pack(fmt, *boosted)
+                            if len(data) % 2 == 0:
+                                data = mic_dsp.process(np.frombuffer(data, dtype=np.int16)).tobytes()
 
                             await ws.send(data)
                             
                         except asyncio.TimeoutError:
-                            await ws.send(SILENCE_FRAME)
+                            await ws.send(KEEPALIVE_FRAME)
                             
                         except Exception:
                             break
 
+                def barge_in():
+                    if state.is_speaking():
+                        sys.stdout.write(f"{Fore.RED}[INTERRUPT] Stopping TTS...{Style.RESET_ALL}\n")
+                    turns.interrupt()
+                    gate.start_of_turn()
+                    if state.speculator: state.speculator.reset()
+
                 async def receiver():
+                    echo_turn = False   # a Flux turn that started while Chip talked, with no near-end speech heard
                     async for msg in ws:
                         try:
                             res = json.loads(msg)
@@ -168,27 +145,40 @@ async def start_deepgram_stt():
                                 event = res.get("event")
                                 transcript = res.get("transcript", "")
 
+                                if echo_turn and event in ("Update", "EagerEndOfTurn", "TurnResumed"):
+                                    if not near_end_speech():
+                                        continue
+                                    # The user did start talking over Chip within this turn
+                                    echo_turn = False
+                                    barge_in()
+
                                 if event == "StartOfTurn":
-                                    if hasattr(state, 'is_speaking') and state.is_speaking():
-                                        sys.stdout.write(f"{Fore.RED}[INTERRUPT] Stopping TTS...{Style.RESET_ALL}\n")
-                                        while not state.audio_queue.empty():
-                                            try: state.audio_queue.get_nowait()
-                                            except: pass
-                                    # Fallback if function missing
-                                    elif not state.audio_queue.empty():
-                                        while not state.audio_queue.empty():
-                                            try: state.audio_queue.get_nowait()
-                                            except: pass
+                                    state.stt_turn_open = True
+                                    echo_turn = state.is_speaking() and not near_end_speech()
+                                    if echo_turn:
+                                        print(f"{Fore.LIGHTBLACK_EX}[ECHO] Speech during playback without near-end talk; not interrupting{Style.RESET_ALL}")
+                                    else:
+                                        barge_in()
 
                                 elif event == "Update" and transcript:
                                     sys.stdout.write(f"\r\033[K{Fore.CYAN}[LISTENING] {transcript}{Style.RESET_ALL}")
                                     sys.stdout.flush()
+                                    gate.update(transcript)
+                                    if state.speculator: state.speculator.on_update(transcript)
+
+                                elif event == "EagerEndOfTurn" and transcript:
+                                    gate.eager_end_of_turn(transcript)
 
-                                elif event == "EndOfTurn" and transcript:
-                                    sys.stdout.write(f"\r\033[K") 
-                                    print(f"{Fore.GREEN}[USER] {transcript}{Style.RESET_ALL}")
-                                    payload = {"text": f"[USER] {transcript}", "source": "voice"}
-                                    await state.input_queue.put(payload)
+                                elif event == "TurnResumed":
+                                    gate.turn_resumed()
+
+                                elif event == "EndOfTurn":
+                                    state.stt_turn_open = False
+                                    if echo_turn:
+                                        echo_turn = False
+                                        print(f"{Fore.LIGHTBLACK_EX}[ECHO] Ignored: {transcript}{Style.RESET_ALL}")
+                                    elif transcript:
+                                        await gate.end_of_turn(transcript, res.get("end_of_turn_confidence"))
 
                         except Exception as e:
                             print(f"{Fore.RED}[ERROR] Parse: {e}{Style.RESET_ALL}")
@@ -199,121 +189,195 @@ async def start_deepgram_stt():
             print(f"{Fore.RED}[ERROR] Deepgram Disconnected: {e}. Reconnecting in 2s...{Style.RESET_ALL}")
             await asyncio.sleep(2)
 
-async def stream_tts(text_iterator):
-    async def content_generator():
-        if hasattr(text_iterator, '__aiter__'):
-            async for item in text_iterator:
-                yield item
-        else:
-            for item in text_iterator:
-                yield item
-                
-    async for text_chunk in content_generator():
-        if not text_chunk.strip(): continue
-        await _fetch_audio(text_chunk)
-
-async def _fetch_audio(text):
-    state.set_speaking(True)
-    url = f"https://api.deepgram.com/v1/speak?model={config.TTS_VOICE}&encoding=linear16&sample_rate={config.SAMPLE_RATE_TTS}&container=none"
+def _speak_request():
+    url = f"{config.DEEPGRAM_SPEAK_URL}?model={config.TTS_VOICE}&encoding=linear16&sample_rate={config.SAMPLE_RATE_TTS}&container=none"
     headers = {
         "Authorization": f"Token {config.DEEPGRAM_API_KEY}",
         "Content-Type": "application/json"
     }
-    try:
-        async with httpx_client.stream("POST", url, headers=headers, json={"text": text}) as r:
-            async for chunk in r.aiter_bytes(chunk_size=2048):
-                if chunk:
-                    state.audio_queue.put(chunk)
-    except Exception as e:
-        print(f"{Fore.RED}[ERROR] TTS Streaming failed: {e}{Style.RESET_ALL}")
-    finally:
-        state.set_speaking(False)
-
-async def ask_llm_stream(history, system_instruction=None, tools=None):
-    
-    # 1. Try to use Cache
-    cache_name = _get_or_create_cache(system_instruction, tools)
-    
-    generate_config = None
-
-    if cache_name:
-        generate_config = types.GenerateContentConfig(
-            cached_content=cache_name,
-            temperature=0.7
-        )
-    else:
-        gemini_tools = _convert_tools_to_gemini(tools) if tools else None
-        generate_config = types.GenerateContentConfig(
-            system_instruction=system_instruction,
-            tools=gemini_tools,
-            temperature=0.7
-        )
+    return url, headers
+
+async def _synthesize(text):
+    """Downloads the full PCM for `text` without playing it (cache warming)."""
+    url, headers = _speak_request()
+    r = await httpx_client.post(url, headers=headers, json={"text": text})
+    r.raise_for_status()
+    return r.content
+
+def cache_phrases():
+    return (
+        list(config.TOOL_SPECIFIC_FILLERS.values())
+        + config.FILLERS_START
+        + config.FILLERS_CONTINUED
+        + getattr(config, 'TTS_CACHE_PHRASES', [])
+    )
 
+async def warm_tts_cache():
+    await pcm_cache.warm(cache_phrases(), _synthesize)
+
+async def stream_audio(text, chunk_size=2048):
+    """Yields PCM for `text`: from the PCM cache when possible, otherwise streamed from Deepgram."""
+    cached = pcm_cache.get(text)
+    if cached is not None:
+        yield cached
+        return
+
+    recorded = [] if pcm_cache.note(text) else None
+    url, headers = _speak_request()
+    started = metrics.now_ms()
+    first = True
+    async with httpx_client.stream("POST", url, headers=headers, json={"text": text}) as r:
+        if r.status_code != 200:
+            raise RuntimeError(f"Deepgram speak returned {r.status_code}")
+        async for chunk in r.aiter_bytes(chunk_size=chunk_size):
+            if chunk:
+                if first:
+                    metrics.record_latency("tts_ttfb", metrics.now_ms() - started)
+                    first = False
+                yield chunk
+                if recorded is not None: recorded.append(chunk)
+    if recorded:
+        pcm_cache.put(text, b"".join(recorded))
+
+class MalformedToolCall(Exception):
+    pass
+
+def _check_tool_calls(parts, tools, finish_reason):
+    """Raises MalformedToolCall for a call the model flagged as broken, an unknown tool or missing required args."""
+    if finish_reason in (types.FinishReason.MALFORMED_FUNCTION_CALL, types.FinishReason.UNEXPECTED_TOOL_CALL):
+        raise MalformedToolCall(f"finish reason {finish_reason.name}")
+    calls = [p.function_call for p in parts if p.function_call]
+    if not calls:
+        return
+    specs = {t["function"]["name"]: t["function"] for t in tools or []}
+    for call in calls:
+        spec = specs.get(call.name)
+        if spec is None:
+            raise MalformedToolCall(f"unknown tool {call.name}")
+        missing = [r for r in (spec.get("parameters") or {}).get("required", []) if r not in (call.args or {})]
+        if missing:
+            raise MalformedToolCall(f"{call.name} missing {', '.join(missing)}")
+
+def _route_config(route, cache_name, system_instruction, tools):
+    settings = router.settings(route)
+    manager = cache_managers.get(route, cache_manager)
+    extra = {"temperature": 0.7}
+    if settings.get("thinking_level"):
+        extra["thinking_config"] = types.ThinkingConfig(thinking_level=settings["thinking_level"])
+    return settings["model"], manager.generate_config(cache_name, system_instruction, tools, **extra)
+
+async def ask_llm_stream(history, system_instruction=None, tools=None, site="main", round_index=None, on_usage=None, route=None, segmenter=None):
+    route = route or router.default
+    manager = cache_managers.get(route, cache_manager)
+    cache_name, contents = await manager.prepare(system_instruction, tools, history)
+    estimated = history_utils.estimator.request_tokens(system_instruction, tools, history)
+    model, generate_config = _route_config(route, cache_name, system_instruction, tools)
+
+    started = metrics.now_ms()
     stream = await client.aio.models.generate_content_stream(
-        model=config.LLM_MODEL,
-        contents=history,
+        model=model,
+        contents=with_current_time(contents),
         config=generate_config
     )
 
     accumulated_parts = []
-    text_buffer = ""
-    printed_usage = False
-
-    async for chunk in stream:
-        if chunk.usage_metadata and not printed_usage:
-            u = chunk.usage_metadata
-            cached = u.cached_content_token_count if hasattr(u, 'cached_content_token_count') else 0
-            new_bits = u.prompt_token_count - cached
-            # print(f"\n\033[92m[METRICS] Total Context: {u.prompt_token_count} | Cached: {cached} | Billed: {new_bits} | Output: {u.candidates_token_count}\033[0m")
-            printed_usage = True
-
-        if chunk.candidates and chunk.candidates[0].content.parts:
-            for part in chunk.candidates[0].content.parts:
-                accumulated_parts.append(part)
+    segmenter = segmenter or SentenceSegmenter()
+    usage = None
+    finish_reason = None
+    completed = False
+
+    try:
+        async for chunk in stream:
+            if started is not None:
+                metrics.record_latency(f"llm_first_chunk_{route}", metrics.now_ms() - started, log=False)
+                started = None
+            if chunk.usage_metadata:
+                if usage is None:
+                    # Prompt counts are final from the first chunk; they drive the caches and estimator
+                    manager.record_usage(system_instruction, tools, chunk.usage_metadata)
+                    history_utils.estimator.observe(estimated, chunk.usage_metadata.prompt_token_count)
+                usage = chunk.usage_metadata
+
+            if chunk.candidates:
+                finish_reason = chunk.candidates[0].finish_reason or finish_reason
+            if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
+                for part in chunk.candidates[0].content.parts:
+                    accumulated_parts.append(part)
                 
-                if part.text:
-                    text_buffer += part.text
-                    
-                    sentences = re.split(r'(?<=[.?!])\s+', text_buffer)
-                    
-                    if len(sentences) > 1:
-                        for sentence in sentences[:-1]:
-                            if sentence.strip():
-                                yield {"type": "text", "content": sentence.strip()}
-                        text_buffer = sentences[-1]
-
-    if text_buffer.strip():
-        yield {"type": "text", "content": text_buffer.strip()}
+                    if part.text:
+                        for sentence in segmenter.feed(part.text):
+                            yield {"type": "text", "content": sentence}
+        completed = True
+    finally:
+        # On barge-in the consuming task is cancelled; close the HTTP stream so Gemini stops generating
+        if hasattr(stream, "aclose"):
+            await stream.aclose()
+        if usage is not None:
+            record = metrics.record_tokens(site, usage, round_index, model=model, cancelled=not completed)
+            if on_usage: on_usage(record)
+
+    _check_tool_calls(accumulated_parts, tools, finish_reason)
+    for sentence in segmenter.flush():
+        yield {"type": "text", "content": sentence}
     
-    yield {"type": "complete_message", "content": accumulated_parts}
-
-async def ask_llm(history, system_instruction=None, tools=None):
-    cache_name = _get_or_create_cache(system_instruction, tools)
-    generate_config = None
-
-    if cache_name:
-        generate_config = types.GenerateContentConfig(
-            cached_content=cache_name,
-            temperature=0.7
-        )
+    yield {"type": "complete_message", "content": accumulated_parts, "route": route}
+
+async def ask_llm_routed(history, system_instruction=None, tools=None, site="main", round_index=None, on_usage=None, route=None, segmenter=None):
+    """
+    ask_llm_stream on the route the router picks for the latest user message
+    (or `route`, to keep a turn on one route). A round that fails before it
+    said anything, or that ends in a malformed tool call, is retried on the
+    next route; text already spoken is not repeated by the retry, and the
+    retry's message carries the spoken text in place of its own, so history
+    matches what was played. Pass the turn's `segmenter` so its early clause
+    fires only once per turn.
+    """
+    if route is None:
+        route, reason = router.route_for(history)
+        print(f"{Fore.LIGHTBLACK_EX}[ROUTER] {route} ({reason}){Style.RESET_ALL}")
+    spoken = []
+    while True:
+        retrying_after_speech = bool(spoken)
+        try:
+            async for chunk in ask_llm_stream(history, system_instruction=system_instruction, tools=tools, site=site,
+                                              round_index=round_index, on_usage=on_usage, route=route,
+                                              segmenter=segmenter):
+                if chunk["type"] == "text":
+                    if retrying_after_speech: continue
+                    spoken.append(chunk["content"])
+                elif chunk["type"] == "complete_message" and retrying_after_speech:
+                    parts = [types.Part.from_text(text=" ".join(spoken))] + [p for p in chunk["content"] if not p.text]
+                    chunk = {**chunk, "content": parts}
+                yield chunk
+            return
+        except Exception as e:
+            nxt = router.escalate(route, e) if (not spoken or isinstance(e, MalformedToolCall)) else None
+            if nxt is None:
+                raise
+            if segmenter: segmenter.discard()
+            route = nxt
+
+async def ask_llm(history, system_instruction=None, tools=None, site="main", round_index=None, route=None, cache=True):
+    """cache=False for one-off instructions (summaries, compaction) that would never reuse a context cache."""
+    route = route or router.default
+    manager = cache_managers.get(route, cache_manager)
+    if cache:
+        cache_name, contents = await manager.prepare(system_instruction, tools, history)
     else:
-        gemini_tools = _convert_tools_to_gemini(tools) if tools else None
-        generate_config = types.GenerateContentConfig(
-            system_instruction=system_instruction,
-            tools=gemini_tools,
-            temperature=0.7
-        )
+        cache_name, contents = None, history
+    estimated = history_utils.estimator.request_tokens(system_instruction, tools, history)
+    model, generate_config = _route_config(route, cache_name, system_instruction, tools)
 
     response = await client.aio.models.generate_content(
-        model=config.LLM_MODEL,
-        contents=history,
+        model=model,
+        contents=with_current_time(contents),
         config=generate_config
     )
     
     if response.usage_metadata:
         u = response.usage_metadata
-        cached = u.cached_content_token_count if hasattr(u, 'cached_content_token_count') else 0
-        new_bits = u.prompt_token_count - cached
-        # print(f"\033[92m[METRICS] Total Context: {u.prompt_token_count} | Cached: {cached} | Billed: {new_bits} | Output: {u.candidates_token_count}\033[0m")
+        if cache: manager.record_usage(system_instruction, tools, u)
+        history_utils.estimator.observe(estimated, u.prompt_token_count)
+        metrics.record_tokens(site, u, round_index, model=model)
     
     return response
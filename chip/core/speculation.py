@@ -0,0 +1,179 @@
+import asyncio
+import re
+from google.genai import types
+from colorama import Fore, Style, init
+
+from chip.core import state
+from chip.utils import config, metrics
+
+init(autoreset=True)
+
+def normalise(transcript):
+    return " ".join(re.sub(r"[^\w\s']", " ", transcript.lower()).split())
+
+class Speculation:
+    """
+    The first LLM round for a partial transcript, run ahead of EndOfTurn.
+    Chunks are buffered, never spoken; tool calls in them are only executed
+    if the turn adopts the speculation, so nothing with side effects runs
+    on a guess.
+    """
+    def __init__(self, transcript, llm, history, system_instruction, tools):
+        self.transcript = transcript
+        self.key = normalise(transcript)
+        self.started_at = metrics.now_ms()
+        self.first_token_at = None
+        self.adopted_at = None
+        self.usage = None
+        self.chunks = []
+        self.done = False
+        self._changed = asyncio.Event()
+        contents = list(history) + [types.Content(role="user", parts=[types.Part.from_text(text=transcript)])]
+        self.task = asyncio.create_task(self._run(llm, contents, system_instruction, tools))
+
+    async def _run(self, llm, contents, system_instruction, tools):
+        try:
+            async for chunk in llm(contents, system_instruction=system_instruction, tools=tools,
+                                   site="speculative", round_index=0, on_usage=self._on_usage):
+                if chunk["type"] == "text" and self.first_token_at is None:
+                    self.first_token_at = metrics.now_ms()
+                self.chunks.append(chunk)
+                self._changed.set()
+        finally:
+            self.done = True
+            self._changed.set()
+
+    def _on_usage(self, record):
+        self.usage = record
+
+    @property
+    def failed(self):
+        return self.task.done() and not self.task.cancelled() and self.task.exception() is not None
+
+    def cancel(self):
+        self.task.cancel()
+
+    async def replay(self):
+        """Streams the buffered chunks, then the rest as they arrive, like ask_llm_stream."""
+        i = 0
+        while True:
+            while i < len(self.chunks):
+                chunk = self.chunks[i]
+                i += 1
+                if chunk["type"] == "text" and self.adopted_at is not None and self.first_token_at is not None:
+                    self._record_saving()
+                yield chunk
+            if self.done:
+                if self.failed:
+                    raise self.task.exception()
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+    def _record_saving(self):
+        # Without speculation the first token would have come one TTFT after the final transcript
+        ttft = self.first_token_at - self.started_at
+        saved = self.adopted_at + ttft - max(self.adopted_at, self.first_token_at)
+        metrics.record_latency("speculation_saved", saved)
+        self.adopted_at = None
+
+class Speculator:
+    """
+    Watches Flux Update events. Once a partial transcript has been stable for
+    `stable_ms` (or at once on EagerEndOfTurn), starts a Speculation for it; EndOfTurn either adopts it (the
+    final transcript matches) or discards it. Tracks hit rate, wasted tokens
+    and latency saved so the threshold can be tuned.
+    """
+    def __init__(self, llm, stable_ms=None, min_words=None):
+        self.llm = llm
+        self.stable_ms = stable_ms or getattr(config, 'SPECULATIVE_STABLE_MS', 300)
+        self.min_words = min_words or getattr(config, 'SPECULATIVE_MIN_WORDS', 2)
+        self.current = None
+        self._context = None
+        self._partial = None
+        self._timer = None
+        self.attempts = 0
+        self.hits = 0
+        self.misses = 0
+        self.wasted_tokens = 0
+        self.wasted_cost = 0.0
+
+    def prepare(self, history, system_instruction, tools):
+        """Main loop, while idle: what a speculative request should be sent with."""
+        self._context = (history, system_instruction, tools)
+
+    def on_update(self, transcript):
+        key = normalise(transcript)
+        if key == self._partial:
+            return
+        self._partial = key
+        if self.current and self.current.key != key:
+            self._discard()
+        if self._timer:
+            self._timer.cancel()
+        if len(key.split()) >= self.min_words:
+            self._timer = asyncio.create_task(self._arm(transcript, key))
+
+    def on_eager(self, transcript):
+        """Flux EagerEndOfTurn: speculate now instead of waiting for the partial to settle."""
+        self.on_update(transcript)
+        if self._timer:
+            self._timer.cancel()
+        self._start(transcript, normalise(transcript))
+
+    async def _arm(self, transcript, key):
+        await asyncio.sleep(self.stable_ms / 1000)
+        self._start(transcript, key)
+
+    def _start(self, transcript, key):
+        if self._partial != key or self.current or not self._context or state.IS_PROCESSING:
+            return
+        history, system_instruction, tools = self._context
+        self.current = Speculation(transcript, self.llm, history, system_instruction, tools)
+        self.attempts += 1
+
+    def reset(self):
+        """A new user turn started: nothing from the previous one carries over."""
+        if self._timer:
+            self._timer.cancel()
+        self._partial = None
+        if self.current:
+            self._discard()
+
+    def take(self, transcript):
+        """EndOfTurn: returns the Speculation to adopt, or None."""
+        if self._timer:
+            self._timer.cancel()
+        self._partial = None
+        spec, self.current = self.current, None
+        if spec is None:
+            return None
+        if spec.key == normalise(transcript) and not spec.failed:
+            self.hits += 1
+            spec.adopted_at = metrics.now_ms()
+            print(f"{Fore.LIGHTBLACK_EX}[SPECULATION] Hit: started {spec.adopted_at - spec.started_at:.0f}ms early{Style.RESET_ALL}")
+            return spec
+        self.current = spec
+        self._discard()
+        return None
+
+    def _discard(self):
+        spec, self.current = self.current, None
+        self.misses += 1
+        spec.cancel()
+        spec.task.add_done_callback(lambda _: self._waste(spec))
+
+    def _waste(self, spec):
+        if spec.usage:
+            self.wasted_tokens += spec.usage["billed"] + spec.usage["output"]
+            self.wasted_cost += spec.usage["cost"]
+
+    def stats(self):
+        saved = metrics.latency_summary().get("speculation_saved", {})
+        return {
+            "attempts": self.attempts,
+            "hit_rate_pct": round(100 * self.hits / max(1, self.hits + self.misses), 1),
+            "wasted_tokens": self.wasted_tokens,
+            "wasted_usd": round(self.wasted_cost, 4),
+            "saved_ms_p50": saved.get("p50"),
+        }
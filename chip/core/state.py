@@ -1,10 +1,12 @@
 import asyncio
-import queue
 import os
 import json
 import time
 import datetime
 
+from chip.utils import config
+from chip.audio.ring_buffer import PcmRingBuffer
+
 STATE_FILE = os.path.join("data", "chip_state.json")
 
 def _load_state():
@@ -30,11 +32,18 @@ def _update_state(updates):
         
 input_queue = asyncio.Queue()  # Text from STT -> LLM
 mic_queue = asyncio.Queue()    # Audio from Mic -> Deepgram STT
-audio_queue = queue.Queue()    # Audio from TTS -> Speakers
+stt_ready = asyncio.Event()    # Set once the Deepgram socket is connected
+stt_turn_open = False          # Flux StartOfTurn..EndOfTurn: the VAD gate stays open so EOT timeouts run on real audio
+audio_buffer = PcmRingBuffer(config.SAMPLE_RATE_TTS * getattr(config, 'PLAYBACK_BUFFER_SECONDS', 60))  # Audio from TTS -> Speakers
 
 # Internal states
 IS_SPEAKING = False
 IS_PROCESSING = False
+audio_engine = None            # chip.audio.audio_engine.AudioEngine once started (earcons, AEC reference)
+echo_canceller = None          # chip.audio.echo_cancel.EchoCanceller when AEC is on (barge-in guard)
+current_turn = None            # chip.core.turns.Turn for the turn being answered (barge-in target)
+speculator = None              # chip.core.speculation.Speculator when SPECULATIVE_ENABLED
+mcp_servers = None             # chip.core.mcp_connect.McpServers once MCP boot has started
 
 def set_processing(val):
     global IS_PROCESSING
@@ -0,0 +1,150 @@
+import asyncio
+from collections import deque
+from colorama import Fore, Style, init
+
+from chip.core import state, services
+from chip.utils import config, metrics
+
+init(autoreset=True)
+
+class _Segment:
+    def __init__(self, text, round_index):
+        self.text = text
+        self.round_index = round_index
+        self.chunks = asyncio.Queue()   # PCM chunks, None when the download finished
+        self.task = None
+
+class TtsPipeline:
+    """
+    Decouples speech from the LLM stream. say() only enqueues; a dispatcher
+    synthesises up to `prefetch` segments concurrently while a player writes
+    their audio to the playback ring strictly in order.
+
+    - Very short sentences queued back to back are combined into one request.
+    - The first segment is never combined (the turn's segmenter already cut
+      it at a clause) and is streamed in small chunks so the first audio
+      sample arrives as early as possible.
+    """
+    def __init__(self, turn=None, prefetch=None):
+        self.turn = turn
+        self.prefetch = prefetch or getattr(config, 'TTS_PREFETCH', 3)
+        self.min_chars = getattr(config, 'TTS_MIN_SEGMENT_CHARS', 40)
+        self._inbox = deque()
+        self._inbox_ready = asyncio.Event()
+        self._segments = deque()
+        self._ready = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.prefetch)
+        self._dispatched = 0
+        self._closed = False
+        self._first_said = None
+        self._first_audio = False
+
+        self._dispatcher = self._spawn(self._dispatch())
+        self._player = self._spawn(self._play())
+
+    def _spawn(self, coro):
+        return self.turn.spawn(coro) if self.turn else asyncio.create_task(coro)
+
+    # --- Producer API ---
+    def say(self, text, round_index=None):
+        if text and text.strip():
+            if self._first_said is None:
+                self._first_said = metrics.now_ms()
+            self._inbox.append((text.strip(), round_index))
+            self._inbox_ready.set()
+
+    async def close(self):
+        """Waits until everything queued so far has been written to the playback ring."""
+        self._inbox.append(None)
+        self._inbox_ready.set()
+        await asyncio.gather(self._dispatcher, self._player)
+
+    # --- Dispatcher ---
+    def _coalesce(self, text, round_index):
+        """Appends any short sentences already waiting in the inbox (same round only)."""
+        while len(text) < self.min_chars and self._inbox:
+            item = self._inbox[0]
+            if item is None or item[1] != round_index:
+                break
+            self._inbox.popleft()
+            text = f"{text} {item[0]}"
+        return text
+
+    async def _next_item(self):
+        while not self._inbox:
+            self._inbox_ready.clear()
+            await self._inbox_ready.wait()
+        return self._inbox.popleft()
+
+    def _start_segment(self, text, round_index):
+        segment = _Segment(text, round_index)
+        chunk_size = 512 if self._dispatched == 0 else 2048
+        segment.task = self._spawn(self._download(segment, chunk_size))
+        self._dispatched += 1
+        self._segments.append(segment)
+        self._ready.set()
+
+    async def _dispatch(self):
+        try:
+            while True:
+                item = await self._next_item()
+                if item is None:
+                    break
+                text, round_index = item
+                if self._dispatched == 0:
+                    await self._slots.acquire()
+                    self._start_segment(text, round_index)
+                    continue
+                # Waiting for a free slot first lets more short sentences pile up to be combined
+                await self._slots.acquire()
+                self._start_segment(self._coalesce(text, round_index), round_index)
+        finally:
+            self._closed = True
+            self._ready.set()
+
+    async def _download(self, segment, chunk_size):
+        try:
+            async for chunk in services.stream_audio(segment.text, chunk_size=chunk_size):
+                segment.chunks.put_nowait(chunk)
+        except Exception as e:
+            print(f"{Fore.RED}[ERROR] TTS Streaming failed: {e}{Style.RESET_ALL}")
+        finally:
+            segment.chunks.put_nowait(None)
+            self._slots.release()
+
+    # --- Player ---
+    async def _play(self):
+        ring = state.audio_buffer
+        writing = False
+        try:
+            while True:
+                if not self._segments:
+                    if writing:
+                        ring.end_write()
+                        writing = False
+                    if self._closed:
+                        return
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+
+                segment = self._segments.popleft()
+                if not writing:
+                    ring.begin_write()
+                    writing = True
+                start_pos = None
+                while True:
+                    chunk = await segment.chunks.get()
+                    if chunk is None:
+                        break
+                    if start_pos is None:
+                        start_pos = ring.write_pos
+                        if not self._first_audio:
+                            self._first_audio = True
+                            metrics.record_latency("tts_first_audio", metrics.now_ms() - self._first_said)
+                    await ring.put(chunk)
+                if self.turn is not None and start_pos is not None:
+                    self.turn.mark_spoken(start_pos, ring.write_pos, segment.text, segment.round_index)
+        finally:
+            if writing:
+                ring.end_write()
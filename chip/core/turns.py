@@ -0,0 +1,164 @@
+import asyncio
+from google.genai import types
+from colorama import Fore, Style, init
+
+from chip.core import state
+from chip.utils import metrics
+
+init(autoreset=True)
+
+INTERRUPTED_MARKER = "[interrupted by user]"
+
+class Turn:
+    """
+    Cancellation scope for one user turn. Everything the turn spawns (LLM
+    stream, TTS fetches, fillers, tool calls) is tracked here so a barge-in
+    can trip them all at once, and every spoken sentence is recorded against
+    the playback ring so history can be cut back to what was actually heard.
+    """
+    def __init__(self, history, speaking=True):
+        self.history = history
+        self.start_index = len(history)
+        self.speaking = speaking
+        self.cancelled = False
+        self.played_pos = None
+        self._tasks = set()
+
+        self.round = 0
+        self._round_messages = {}   # round -> index of its model message in history
+        self._generated = {}        # round -> [sentences]
+        self._marks = []            # (round, start_pos, end_pos, text) in playback ring samples
+
+    # --- Task tracking ---
+    def track(self, task):
+        if self.cancelled:
+            task.cancel()
+            return task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def spawn(self, coro):
+        return self.track(asyncio.create_task(coro))
+
+    def cancel(self, played_pos=None):
+        if self.cancelled:
+            return
+        self.cancelled = True
+        self.played_pos = played_pos
+        for task in list(self._tasks):
+            task.cancel()
+
+    @property
+    def active(self):
+        return bool(self._tasks)
+
+    async def run(self, coro):
+        """Runs the turn body; if a barge-in cancels it, unwinds and reconciles history."""
+        task = self.spawn(coro)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if not self.cancelled:
+                raise
+            self.reconcile_history(self.played_pos)
+
+    # --- Bookkeeping used to reconcile history ---
+    def add_generated(self, text):
+        self._generated.setdefault(self.round, []).append(text)
+
+    def add_model_message(self, content):
+        self._round_messages[self.round] = len(self.history)
+        self.history.append(content)
+
+    def mark_spoken(self, start_pos, end_pos, text, round_index=None):
+        self._marks.append((round_index, start_pos, end_pos, text))
+
+    def _spoken_by_round(self, played_pos):
+        spoken, cut_round = {}, None
+        for round_index, start, end, text in self._marks:
+            if round_index is None:
+                continue
+            if end <= played_pos:
+                spoken.setdefault(round_index, []).append(text)
+            elif start < played_pos:
+                words = text.split()
+                heard = int(len(words) * (played_pos - start) / max(1, end - start))
+                spoken.setdefault(round_index, []).append(" ".join(words[:heard]))
+                cut_round = round_index if cut_round is None else min(cut_round, round_index)
+            elif cut_round is None or round_index < cut_round:
+                cut_round = round_index
+        return spoken, cut_round
+
+    def reconcile_history(self, played_pos):
+        """Rewrites this turn's model messages to contain only what the user actually heard."""
+        if self.speaking:
+            spoken, cut_round = self._spoken_by_round(played_pos)
+        else:
+            spoken, cut_round = self._generated, None
+
+        in_progress = self.round not in self._round_messages
+        if cut_round is None and in_progress:
+            cut_round = self.round
+
+        if cut_round is not None:
+            # Walk backwards so dropping an emptied message doesn't shift the ones still to visit
+            for round_index, msg_index in sorted(self._round_messages.items(), reverse=True):
+                if round_index < cut_round or msg_index >= len(self.history):
+                    continue
+                content = self.history[msg_index]
+                parts = []
+                if round_index == cut_round:
+                    text = " ".join(spoken.get(round_index, []))
+                    parts.append(types.Part.from_text(text=f"{text} {INTERRUPTED_MARKER}".strip()))
+                parts.extend(p for p in content.parts if p.function_call)
+                if parts:
+                    self.history[msg_index] = types.Content(role="model", parts=parts)
+                else:
+                    del self.history[msg_index]
+
+        # A model turn whose tool calls never got responses would break the call/response pairing
+        last = self.history[-1] if len(self.history) > self.start_index else None
+        if last is not None and last.role == "model" and any(p.function_call for p in last.parts):
+            text_parts = [p for p in last.parts if p.text]
+            self.history.pop()
+            if text_parts:
+                self.history.append(types.Content(role="model", parts=text_parts))
+            last = self.history[-1] if len(self.history) > self.start_index else None
+
+        if last is None or last.role != "model":
+            text = " ".join(spoken.get(self.round, [])) if in_progress else ""
+            self.history.append(types.Content(role="model", parts=[types.Part.from_text(text=f"{text} {INTERRUPTED_MARKER}".strip())]))
+
+def begin_turn(history, speaking=True):
+    turn = Turn(history, speaking)
+    state.current_turn = turn
+    return turn
+
+def interrupt():
+    """
+    Barge-in: silence playback, cancel the current turn's work and cut its
+    history back to what was heard. Safe to call when nothing is in flight.
+    """
+    turn = getattr(state, "current_turn", None)
+    started = metrics.now_ms()
+    played_pos = state.audio_buffer.read_pos
+    was_playing = state.is_speaking() or not state.audio_buffer.empty()
+    state.audio_buffer.clear()
+
+    if turn is None or turn.cancelled or not (was_playing or turn.active):
+        return
+
+    running = turn.active
+    turn.cancel(played_pos)
+    if not running:
+        # Turn already finished and only its audio was playing; otherwise Turn.run() reconciles
+        turn.reconcile_history(played_pos)
+    print(f"{Fore.RED}[INTERRUPT] Turn cancelled.{Style.RESET_ALL}")
+    if was_playing:
+        asyncio.create_task(_report_silence(started))
+
+async def _report_silence(started, timeout=2.0):
+    while state.is_speaking() and metrics.now_ms() - started < timeout * 1000:
+        await asyncio.sleep(0.002)
+    metrics.record_latency("interrupt_to_silence", metrics.now_ms() - started)
@@ -0,0 +1,159 @@
+import asyncio
+import json
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+import websockets
+
+def _query(path, name, default, cast=int):
+    try:
+        return cast(parse_qs(urlsplit(path).query).get(name, [default])[0])
+    except (TypeError, ValueError):
+        return default
+
+class DeepgramStub:
+    """
+    Local stand-in for the two Deepgram endpoints Chip uses.
+
+    - /v2/listen (websocket): an energy detector over the uploaded linear16
+      audio drives Flux-style TurnInfo events. StartOfTurn on the first voiced
+      frame, Update as words are "recognised", EndOfTurn after `eot_ms` of
+      silence (EagerEndOfTurn at half that, when eager_eot_threshold is set).
+      Transcripts come from expect(), one per turn. A turn expected with a
+      confidence below eot_threshold only ends on eot_timeout_ms of silence,
+      as Flux does when it is unsure the user has finished.
+    - /v1/speak (HTTP): streams synthetic linear16 at the requested rate,
+      after `ttfb_ms`, at `speed` times real time.
+    """
+    def __init__(self, eot_ms=400, ttfb_ms=150, speed=4.0, voiced_dbfs=-45, ms_per_word=300):
+        self.eot_ms = eot_ms
+        self.ttfb_ms = ttfb_ms
+        self.speed = speed
+        self.voiced_dbfs = voiced_dbfs
+        self.ms_per_word = ms_per_word
+        self.stt_url = None
+        self.speak_url = None
+        self.speak_requests = []
+        self._transcripts = deque()
+        self._ws_server = None
+        self._http_server = None
+
+    def expect(self, transcript, confidence=0.9):
+        self._transcripts.append((transcript, confidence))
+
+    async def start(self):
+        self._ws_server = await websockets.serve(self._listen, "127.0.0.1", 0)
+        self._http_server = await asyncio.start_server(self._speak, "127.0.0.1", 0)
+        ws_port = self._ws_server.sockets[0].getsockname()[1]
+        http_port = self._http_server.sockets[0].getsockname()[1]
+        self.stt_url = f"ws://127.0.0.1:{ws_port}/v2/listen"
+        self.speak_url = f"http://127.0.0.1:{http_port}/v1/speak"
+        return self
+
+    async def close(self):
+        for server in (self._ws_server, self._http_server):
+            if server:
+                server.close()
+                await server.wait_closed()
+
+    # --- STT ---
+    async def _listen(self, ws):
+        # Turn detection runs on audio time (like Flux), not on when packets happen to arrive
+        samplerate = _query(ws.request.path, "sample_rate", 16000)
+        # Eager end of turn is opt-in, as with Flux; it fires halfway to EndOfTurn
+        eager_ms = self.eot_ms / 2 if "eager_eot_threshold" in ws.request.path else None
+        threshold = _query(ws.request.path, "eot_threshold", 0.7, float)
+        timeout_ms = _query(ws.request.path, "eot_timeout_ms", 5000)
+        frame = int(samplerate * 0.02)
+        active, words, heard, voiced_ms, silence_ms, eager_sent = False, [], 0, 0.0, 0.0, False
+        confidence, end_ms = 0.9, self.eot_ms
+
+        async def send(event, transcript="", confidence=None):
+            message = {"type": "TurnInfo", "event": event, "transcript": transcript}
+            if confidence is not None:
+                message["end_of_turn_confidence"] = confidence
+            await ws.send(json.dumps(message))
+
+        try:
+            async for message in ws:
+                if not isinstance(message, bytes) or len(message) < 2:
+                    continue
+                pcm = np.frombuffer(message[:len(message) & ~1], dtype=np.int16).astype(np.float32)
+                for i in range(0, pcm.shape[0], frame):
+                    chunk = pcm[i:i + frame]
+                    chunk_ms = chunk.shape[0] / samplerate * 1000
+                    rms = np.sqrt(np.mean(chunk ** 2))
+                    if 20 * np.log10(max(rms, 1e-3) / 32768.0) >= self.voiced_dbfs:
+                        if not active:
+                            text, confidence = self._transcripts.popleft() if self._transcripts else ("hello", 0.9)
+                            active, words, heard, voiced_ms = True, text.split(), 0, 0.0
+                            end_ms = self.eot_ms if confidence >= threshold else timeout_ms
+                            await send("StartOfTurn")
+                        silence_ms = 0.0
+                        voiced_ms += chunk_ms
+                        if eager_sent:
+                            eager_sent = False
+                            await send("TurnResumed", " ".join(words[:heard]))
+                        recognised = min(len(words), 1 + int(voiced_ms / self.ms_per_word))
+                        if recognised > heard:
+                            heard = recognised
+                            await send("Update", " ".join(words[:heard]))
+                    elif active:
+                        silence_ms += chunk_ms
+                        if eager_ms is not None and not eager_sent and silence_ms >= eager_ms:
+                            eager_sent = True
+                            await send("EagerEndOfTurn", " ".join(words), 0.5)
+                        if silence_ms >= end_ms:
+                            active, eager_sent = False, False
+                            await send("EndOfTurn", " ".join(words), confidence)
+        except websockets.ConnectionClosed:
+            pass
+
+    # --- TTS ---
+    @staticmethod
+    def _voice(text, samplerate):
+        """A vowel-ish buzz roughly as long as the sentence would take to say."""
+        seconds = max(0.3, len(text) / 15.0)
+        t = np.arange(int(seconds * samplerate)) / samplerate
+        envelope = 0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)
+        tone = sum(np.sin(2 * np.pi * f * t) / k for k, f in enumerate((180, 360, 540), start=1))
+        return (tone * envelope * 6000).astype(np.int16)
+
+    async def _speak(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                path = request_line.decode("latin-1").split()[1]
+                length = 0
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header.decode("latin-1").partition(":")
+                    if name.strip().lower() == "content-length":
+                        length = int(value.strip())
+                body = json.loads(await reader.readexactly(length)) if length else {}
+                text = body.get("text", "")
+                samplerate = _query(path, "sample_rate", 24000)
+                self.speak_requests.append(text)
+
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: audio/l16\r\nTransfer-Encoding: chunked\r\n\r\n")
+                await writer.drain()
+                await asyncio.sleep(self.ttfb_ms / 1000)
+
+                pcm = self._voice(text, samplerate).tobytes()
+                chunk = int(samplerate * 0.04) * 2
+                for i in range(0, len(pcm), chunk):
+                    part = pcm[i:i + chunk]
+                    writer.write(f"{len(part):x}\r\n".encode() + part + b"\r\n")
+                    await writer.drain()
+                    await asyncio.sleep(0.04 / self.speed)
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, IndexError, asyncio.CancelledError):
+            # Cancelled is the server shutting down an idle keep-alive connection
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,213 @@
+import sys
+import threading
+import time
+import types
+import numpy as np
+
+from chip.utils import metrics
+
+class _Flags:
+    input_overflow = False
+    output_underflow = False
+
+    def __bool__(self):
+        return False
+
+def _dbfs(frame):
+    rms = np.sqrt(np.mean(frame.astype(np.float32) ** 2)) if frame.shape[0] else 0.0
+    return 20 * np.log10(max(rms, 1e-3) / 32768.0)
+
+class ClipSource:
+    """What the fake microphone hears: queued clips, then silence. Thread-safe."""
+    def __init__(self, samplerate):
+        self.samplerate = samplerate
+        self._lock = threading.Lock()
+        self._pending = []
+        self._current = None
+        self._pos = 0
+        self.started_at = None      # ms (metrics clock) when the current clip's first sample was "spoken"
+
+    def play(self, pcm):
+        with self._lock:
+            self._pending.append(pcm)
+            self.started_at = None
+
+    def read(self, frames, block_start_ms):
+        block = np.zeros(frames, dtype=np.int16)
+        with self._lock:
+            if self._current is None and self._pending:
+                # Clips start on a block boundary so their start time is exact
+                self._current, self._pos = self._pending.pop(0), 0
+                self.started_at = block_start_ms
+            if self._current is not None:
+                n = min(frames, self._current.shape[0] - self._pos)
+                block[:n] = self._current[self._pos:self._pos + n]
+                self._pos += n
+                if self._pos >= self._current.shape[0]:
+                    self._current = None
+        return block
+
+class OutputSink:
+    """Captures everything the fake speaker is asked to play and timestamps the first sample of each phrase."""
+    def __init__(self, samplerate, keep=False):
+        self.samplerate = samplerate
+        self.keep = keep
+        self.captured = []
+        self.first_sample_at = None
+        self._armed = False
+
+    def arm(self):
+        self.first_sample_at = None
+        self._armed = True
+
+    def write(self, block, block_start_ms):
+        if self.keep:
+            self.captured.append(block.copy())
+        if self._armed:
+            nonzero = np.flatnonzero(block)
+            if nonzero.shape[0]:
+                self.first_sample_at = block_start_ms + nonzero[0] / self.samplerate * 1000
+                self._armed = False
+
+    def pcm(self):
+        return np.concatenate(self.captured) if self.captured else np.zeros(0, dtype=np.int16)
+
+class _Stream:
+    """Shared pacing for the fake PortAudio streams: one callback per block, in real time, on its own thread."""
+    # Input callbacks fire once a block has been captured, output callbacks as it starts playing
+    fires_at_block_end = False
+
+    def __init__(self, device=None, channels=1, samplerate=None, dtype='int16', blocksize=None, callback=None, **kwargs):
+        self.device = device
+        self.channels = channels
+        self.samplerate = int(samplerate)
+        self.blocksize = int(blocksize or 1024)
+        self.callback = callback
+        self.active = False
+        self._thread = None
+
+    def start(self):
+        self.active = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.active = False
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+
+    def close(self):
+        self.active = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        self.close()
+
+    def _run(self):
+        period = self.blocksize / self.samplerate
+        deadline = time.perf_counter()
+        while self.active:
+            if self.fires_at_block_end:
+                deadline += period
+                time.sleep(max(0.0, deadline - time.perf_counter()))
+                self._tick(metrics.now_ms() - period * 1000)
+            else:
+                self._tick(metrics.now_ms())
+                deadline += period
+                time.sleep(max(0.0, deadline - time.perf_counter()))
+
+class FakeInputStream(_Stream):
+    source = None
+    fires_at_block_end = True
+
+    def _tick(self, block_start_ms):
+        block = self.source.read(self.blocksize, block_start_ms)
+        self.callback(block.reshape(-1, 1), self.blocksize, None, _Flags())
+
+class FakeOutputStream(_Stream):
+    sink = None
+
+    def _tick(self, block_start_ms):
+        out = np.zeros((self.blocksize, self.channels), dtype=np.int16)
+        self.callback(out, self.blocksize, None, _Flags())
+        self.sink.write(out[:, 0], block_start_ms)
+
+class FakePorcupine:
+    """
+    Wake word stand-in. When armed, fires at the end of the first voiced run
+    of at least `min_voiced_ms`, which is where Porcupine fires on a real
+    keyword. Disarms after firing so only one wake is reported per clip.
+    """
+    frame_length = 512
+    sample_rate = 16000
+
+    def __init__(self, min_voiced_ms=250, threshold_dbfs=-40):
+        self.min_frames = int(min_voiced_ms / 1000 * self.sample_rate / self.frame_length)
+        self.threshold_dbfs = threshold_dbfs
+        self.fired_at = None
+        self._armed = False
+        self._voiced = 0
+
+    def arm(self):
+        self.fired_at = None
+        self._voiced = 0
+        self._armed = True
+
+    def process(self, frame):
+        if not self._armed:
+            return -1
+        if _dbfs(frame) > self.threshold_dbfs:
+            self._voiced += 1
+            return -1
+        if self._voiced >= self.min_frames:
+            self._armed = False
+            self.fired_at = metrics.now_ms()
+            return 0
+        self._voiced = 0
+        return -1
+
+    def delete(self):
+        pass
+
+def install(samplerate=48000, keep_output=False):
+    """
+    Registers fake `sounddevice` and `pvporcupine` modules. Must run before
+    chip.audio.audio_engine is imported. Returns the shared source, sink and
+    wake word objects the harness drives.
+    """
+    source = ClipSource(samplerate)
+    sink = OutputSink(samplerate, keep=keep_output)
+    porcupine = FakePorcupine()
+    FakeInputStream.source = source
+    FakeOutputStream.sink = sink
+
+    devices = [
+        {"name": "Harness Microphone", "max_input_channels": 1, "max_output_channels": 0, "default_samplerate": float(samplerate)},
+        {"name": "Harness Speaker", "max_input_channels": 0, "max_output_channels": 1, "default_samplerate": float(samplerate)},
+    ]
+    default = types.SimpleNamespace(device=[0, 1])
+
+    def query_devices(device=None, kind=None):
+        if kind is not None:
+            return devices[device if device is not None else default.device[0 if kind == 'input' else 1]]
+        if device is not None:
+            return devices[device]
+        return devices
+
+    sd = types.ModuleType("sounddevice")
+    sd.query_devices = query_devices
+    sd.default = default
+    sd.InputStream = FakeInputStream
+    sd.OutputStream = FakeOutputStream
+    sd.CallbackFlags = _Flags
+
+    pv = types.ModuleType("pvporcupine")
+    pv.create = lambda *args, **kwargs: porcupine
+
+    sys.modules["sounddevice"] = sd
+    sys.modules["pvporcupine"] = pv
+    return types.SimpleNamespace(source=source, sink=sink, porcupine=porcupine, samplerate=samplerate)
@@ -0,0 +1,261 @@
+"""
+End-to-end voice latency replay, without hardware or network:
+
+    WAV clip -> fake mic -> Microphone (wake word, VAD) -> local Deepgram
+    stand-in (Flux TurnInfo) -> LLM -> TtsPipeline -> local /v1/speak ->
+    AudioEngine -> captured speaker output
+
+Usage:
+    python -m chip.harness.replay                      # synthetic clips, scripted LLM
+    python -m chip.harness.replay a.wav b.wav --transcript "what's on today"
+    python -m chip.harness.replay a.wav --live-llm     # real Gemini (needs GEMINI_API_KEY)
+
+Each clip is "hey chip" followed by a command. If an Audacity label file
+(a.txt) sits next to a clip, its labels are used as the transcript.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import tempfile
+import wave
+import numpy as np
+
+SEGMENT_FRAME_MS = 20
+
+def _segments(pcm, samplerate, threshold_dbfs=-40, min_gap_ms=300):
+    """Voiced (start, end) spans in seconds, from a simple energy threshold."""
+    frame = int(samplerate * SEGMENT_FRAME_MS / 1000)
+    frames = pcm[:pcm.shape[0] // frame * frame].astype(np.float32).reshape(-1, frame)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    voiced = 20 * np.log10(np.maximum(rms, 1e-3) / 32768.0) > threshold_dbfs
+    spans, start, gap = [], None, 0
+    for i, v in enumerate(voiced):
+        if v:
+            start = i if start is None else start
+            gap = 0
+        elif start is not None:
+            gap += 1
+            if gap * SEGMENT_FRAME_MS >= min_gap_ms:
+                spans.append((start, i - gap + 1))
+                start, gap = None, 0
+    if start is not None:
+        spans.append((start, len(voiced) - gap))
+    return [(s * SEGMENT_FRAME_MS / 1000, e * SEGMENT_FRAME_MS / 1000) for s, e in spans]
+
+def synthetic_clip(samplerate, command_seconds=1.6, seed=0):
+    """Low noise floor, a short 'hey chip' burst, a pause, then a longer command."""
+    rng = np.random.default_rng(seed)
+    def voice(seconds, f0):
+        t = np.arange(int(seconds * samplerate)) / samplerate
+        syllables = 0.55 + 0.45 * np.sin(2 * np.pi * 4.5 * t)
+        tone = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in (1, 2, 3, 4))
+        return tone * syllables * 5000
+    def silence(seconds):
+        return np.zeros(int(seconds * samplerate))
+    pcm = np.concatenate([silence(0.3), voice(0.5, 140), silence(0.9), voice(command_seconds, 120), silence(1.2)])
+    pcm += rng.normal(0, 15, pcm.shape[0])
+    return np.clip(pcm, -32768, 32767).astype(np.int16)
+
+def _clip_transcript(path, fallback):
+    labels = os.path.splitext(path)[0] + ".txt"
+    if os.path.exists(labels):
+        with open(labels) as f:
+            words = [line.strip().split("\t")[2] for line in f if len(line.strip().split("\t")) >= 3]
+        if words:
+            return " ".join(words)
+    return fallback
+
+def scripted_llm(reply, ttft_ms, ms_per_word):
+    """Stands in for services.ask_llm_stream: a fixed reply streamed word by word through the real segmenter."""
+    from google.genai import types
+    from chip.utils.segmenter import SentenceSegmenter
+
+    async def ask_llm_stream(history, system_instruction=None, tools=None, segmenter=None, **kwargs):
+        segmenter = segmenter or SentenceSegmenter()
+        await asyncio.sleep(ttft_ms / 1000)
+        for word in re.findall(r"\S+\s*", reply):
+            for sentence in segmenter.feed(word):
+                yield {"type": "text", "content": sentence}
+            await asyncio.sleep(ms_per_word / 1000)
+        for sentence in segmenter.flush():
+            yield {"type": "text", "content": sentence}
+        yield {"type": "complete_message", "content": [types.Part.from_text(text=reply)]}
+    return ask_llm_stream
+
+def _timed(stream_fn, marks):
+    async def ask_llm_stream(*args, **kwargs):
+        from chip.utils import metrics
+        async for chunk in stream_fn(*args, **kwargs):
+            if chunk["type"] == "text" and "first_token" not in marks:
+                marks["first_token"] = metrics.now_ms()
+            yield chunk
+    return ask_llm_stream
+
+def _median(values):
+    values = sorted(v for v in values if v is not None)
+    return values[len(values) // 2] if values else None
+
+def _fmt(ms):
+    return "   -   " if ms is None else f"{ms:7.0f}"
+
+async def replay(args, devices):
+    from google.genai import types
+    from chip.utils import config, metrics
+    from chip.core import state, services, turns, speculation, main as chip_main
+    from chip.audio import audio_engine
+    from chip.audio.tts_cache import PcmCache
+    from chip.harness.deepgram_stub import DeepgramStub
+
+    stub = await DeepgramStub(eot_ms=args.eot_ms, ttfb_ms=args.tts_ttfb_ms).start()
+    config.DEEPGRAM_STT_URL = stub.stt_url
+    config.DEEPGRAM_SPEAK_URL = stub.speak_url
+    services.pcm_cache = PcmCache(directory=tempfile.mkdtemp(prefix="chip_replay_"))
+
+    marks = {}
+    llm = services.ask_llm_stream if args.live_llm else scripted_llm(args.reply, args.llm_ttft_ms, args.llm_ms_per_word)
+    services.ask_llm_stream = _timed(llm, marks)
+    if args.speculate:
+        state.speculator = speculation.Speculator(services.ask_llm_stream, stable_ms=args.stable_ms)
+
+    engine = audio_engine.AudioEngine()
+    engine.start()
+    state.audio_engine = engine
+    mic = audio_engine.Microphone()
+    mic.start(audio_engine.select_microphone())
+    stt = asyncio.create_task(services.start_deepgram_stt())
+
+    if args.clips:
+        from chip.audio.vad import read_wav
+        clips = [(path, read_wav(path, devices.samplerate), _clip_transcript(path, args.transcript)) for path in args.clips]
+    else:
+        clips = [(f"synthetic-{i}", synthetic_clip(devices.samplerate, seed=i), args.transcript) for i in range(args.turns)]
+
+    history, results = [], []
+    try:
+        for name, pcm, transcript in clips:
+            spans = _segments(pcm, devices.samplerate)
+            if len(spans) < 2:
+                print(f"[HARNESS] {name}: expected a wake word and a command, found {len(spans)} voiced spans; skipping")
+                continue
+            wake_end, speech_end = spans[0][1], spans[-1][1]
+
+            marks.clear()
+            state.last_speech_time = 0
+            while not state.input_queue.empty():
+                state.input_queue.get_nowait()
+            devices.porcupine.arm()
+            devices.sink.arm()
+            stub.expect(transcript, args.eot_confidence)
+            if state.speculator: state.speculator.prepare(history, config.SYSTEM_PROMPT, None)
+            devices.source.play(pcm)
+
+            row = {"clip": name, "ok": False}
+            try:
+                item = await asyncio.wait_for(state.input_queue.get(), timeout=args.timeout + pcm.shape[0] / devices.samplerate)
+                marks["transcript"] = metrics.now_ms()
+                text = item["text"].replace("[USER] ", "")
+                adopted = state.speculator.take(text) if state.speculator else None
+                if adopted:
+                    # Time the first token as the turn sees it, not when the speculation produced it
+                    marks.pop("first_token", None)
+                    adopted.replay = _timed(adopted.replay, marks)
+                history.append(types.Content(role="user", parts=[types.Part.from_text(text=text)]))
+                turn = turns.begin_turn(history, speaking=True)
+                await asyncio.wait_for(turn.run(chip_main.run_turn(turn, history, True, config.SYSTEM_PROMPT, None, {}, adopted)), args.timeout)
+                while devices.sink.first_sample_at is None or state.is_speaking() or not state.audio_buffer.empty():
+                    await asyncio.sleep(0.02)
+                row["ok"] = True
+            except asyncio.TimeoutError:
+                print(f"[HARNESS] {name}: timed out")
+
+            started = devices.source.started_at
+            heard = (started + speech_end * 1000) if started is not None else None
+            wake_at = devices.porcupine.fired_at
+            first_audio = devices.sink.first_sample_at
+            row.update({
+                "wake_detect_ms": wake_at - (started + wake_end * 1000) if wake_at and started is not None else None,
+                "wake_to_transcript_ms": marks["transcript"] - wake_at if wake_at and "transcript" in marks else None,
+                "speech_end_to_transcript_ms": marks["transcript"] - heard if heard and "transcript" in marks else None,
+                "transcript_to_first_token_ms": marks["first_token"] - marks["transcript"] if "first_token" in marks and "transcript" in marks else None,
+                "first_token_to_first_audio_ms": first_audio - marks["first_token"] if first_audio and "first_token" in marks else None,
+                "speech_end_to_first_audio_ms": first_audio - heard if first_audio and heard else None,
+            })
+            results.append(row)
+            await asyncio.sleep(args.gap)
+    finally:
+        stt.cancel()
+        engine.stop()
+        await stub.close()
+
+    extra = {"playback": engine.stats(), "mic": mic.stats(), "metrics": metrics.latency_summary()}
+    if state.speculator:
+        extra["speculation"] = state.speculator.stats()
+    return results, extra
+
+def report(results, extra):
+    columns = [
+        ("wake", "wake_detect_ms"),
+        ("wake>text", "wake_to_transcript_ms"),
+        ("end>text", "speech_end_to_transcript_ms"),
+        ("text>token", "transcript_to_first_token_ms"),
+        ("token>audio", "first_token_to_first_audio_ms"),
+        ("end>audio", "speech_end_to_first_audio_ms"),
+    ]
+    print()
+    print(f"{'clip':<24}" + "".join(f"{title:>12}" for title, _ in columns) + "   (ms)")
+    for row in results:
+        print(f"{row['clip'][:23]:<24}" + "".join(f"{_fmt(row[key]):>12}" for _, key in columns) + ("" if row["ok"] else "   FAILED"))
+    print(f"{'p50':<24}" + "".join(f"{_fmt(_median(r[key] for r in results)):>12}" for _, key in columns))
+    print(f"\nPlayback: {extra['playback']}\nMic: {extra['mic']}")
+    if "speculation" in extra:
+        print(f"Speculation: {extra['speculation']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay WAV clips through Chip's voice loop with fake devices and a local Deepgram.")
+    parser.add_argument("clips", nargs="*", help="16-bit WAV files: wake word, pause, command")
+    parser.add_argument("--turns", type=int, default=3, help="synthetic clips to play when no WAVs are given")
+    parser.add_argument("--transcript", default="what is on my calendar today")
+    parser.add_argument("--reply", default="You have two meetings today. The first one is at ten with the design team.")
+    parser.add_argument("--live-llm", action="store_true", help="use the real LLM instead of the scripted reply")
+    parser.add_argument("--llm-ttft-ms", type=float, default=350)
+    parser.add_argument("--llm-ms-per-word", type=float, default=15)
+    parser.add_argument("--tts-ttfb-ms", type=float, default=150)
+    parser.add_argument("--speculate", action="store_true", help="start the LLM on stable partial transcripts")
+    parser.add_argument("--stable-ms", type=float, default=300, help="partial stability before speculating")
+    parser.add_argument("--eot-ms", type=float, default=400, help="stand-in end-of-turn silence")
+    parser.add_argument("--eot-confidence", type=float, default=0.9,
+                        help="below FLUX_EOT_THRESHOLD, turns only end on FLUX_EOT_TIMEOUT_MS of (audio-time) silence")
+    parser.add_argument("--device-rate", type=int, default=48000, help="native rate of the fake devices")
+    parser.add_argument("--timeout", type=float, default=20)
+    parser.add_argument("--gap", type=float, default=0.5, help="seconds between clips")
+    parser.add_argument("--out", help="write the captured speaker output to this WAV")
+    parser.add_argument("--json", help="write per-turn results to this file")
+    args = parser.parse_args(argv)
+
+    # The stand-ins never check credentials; a real key is only needed for --live-llm
+    for key in ("DEEPGRAM_API_KEY", "PICOVOICE_ACCESS_KEY") + (() if args.live_llm else ("GEMINI_API_KEY",)):
+        os.environ.setdefault(key, "replay-harness")
+
+    from chip.harness import fakes
+    devices = fakes.install(samplerate=args.device_rate, keep_output=bool(args.out))
+
+    results, extra = asyncio.run(replay(args, devices))
+    report(results, extra)
+
+    if args.out:
+        with wave.open(args.out, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(devices.samplerate)
+            w.writeframes(devices.sink.pcm().tobytes())
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"turns": results, **extra}, f, indent=2)
+
+    return 0 if results and all(r["ok"] for r in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
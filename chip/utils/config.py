@@ -22,16 +22,136 @@ SAMPLE_RATE_MIC = 16000
 SAMPLE_RATE_TTS = 24000
 KEYWORD_FILE_PATH = "hey_chip_ww.ppn"
 BLOCK_SIZE = 8192
+NATIVE_DEVICE_RATES = True     # open devices at their own rate and resample in-process (SAMPLE_RATE_* stay the wire rates)
+MIC_QUEUE_BLOCKS = 32         # raw mic blocks buffered between the input callback and the wake-word worker
+PLAYBACK_BUFFER_SECONDS = 60   # capacity of the TTS -> speaker ring buffer
+PLAYBACK_FADE_MS = 10
+SPEECH_GAIN = 1.0
+EARCON_GAIN = 0.5
+EARCON_DUCK_GAIN = 0.35        # extra earcon attenuation while speech is playing
+EARCONS = {"thinking": "sounds/thinking.mp3"}  # decoded once at startup, mixed in-process
 LLM_MODEL = "gemini-3-flash-preview"
+# Latency tiers, cheapest first. The router picks one per user turn and escalates a failed round to the next
+LLM_ROUTES = {
+    "fast": {"model": "gemini-3-flash-preview", "thinking_level": "low"},
+    "capable": {"model": "gemini-3-pro-preview", "thinking_level": "high"},
+}
+LLM_DEFAULT_ROUTE = "fast"
+ROUTER_LONG_WORDS = 25      # longer requests go to the capable route
+ROUTER_CAPABLE_TOOLS = {"search_web", "sequentialthinking", "drive_search", "docs_create", "sheets_getText", "execute_command", "gmail_send"}
+# What a transcript has to say for the router to expect a tool (words or short phrases, matched whole).
+# Tools missing here fall back to the words of their name, minus ROUTER_STOPWORDS.
+ROUTER_TOOL_KEYWORDS = {
+    "search_web": {"search the web", "google", "online", "internet", "look up"},
+    "sequentialthinking": {"step by step", "think through", "reason through", "work out"},
+    "capture_take_picture": {"picture", "photo", "camera", "selfie"},
+    "capture_take_screenshot": {"screenshot"},
+    "contacts_search": {"contact", "phone number"},
+    "location_current": {"location", "where am i"},
+    "maps_search": {"map", "near me", "nearby", "nearest"},
+    "maps_directions": {"directions", "navigate", "how far", "how do i get to"},
+    "messages_fetch": {"message", "text", "imessage"},
+    "reminders_fetch": {"reminder", "remind me", "to do list", "todo"},
+    "weather_current": {"weather", "forecast", "rain", "temperature", "umbrella"},
+    "gmail_search": {"email", "mail", "inbox", "gmail"},
+    "gmail_send": {"send an email", "send email", "send a mail", "email to", "reply to", "write an email"},
+    "gmail_createDraft": {"draft"},
+    "gmail_listLabels": {"label", "email folder"},
+    "calendar_listEvents": {"calendar", "schedule", "meeting", "appointment", "event", "agenda"},
+    "calendar_createEvent": {"add to my calendar", "put in my calendar", "book a", "schedule a", "set up a meeting"},
+    "calendar_findFreeTime": {"free time", "free slot", "availability", "when am i free"},
+    "drive_search": {"google drive", "my drive", "file"},
+    "docs_create": {"document", "google doc", "new doc"},
+    "sheets_getText": {"spreadsheet", "sheet"},
+    "execute_command": {"terminal", "command", "shell", "script"},
+    "play_song": {"play", "song", "listen to"},
+    "play_playlist": {"playlist", "album"},
+    "control_playback": {"pause", "resume", "skip", "next song", "volume", "louder", "quieter", "stop the music"},
+    "what_is_playing": {"what's playing", "what is playing", "this song", "currently playing"},
+    "memory": {"remember that", "don't forget", "note that", "memorise", "memorize"},
+    "recall": {"do you remember", "recall", "last time"},
+    "whoAmI": {"who am i", "my profile", "about me"},
+}
+ROUTER_STOPWORDS = {
+    "what", "who", "get", "set", "list", "create", "send", "find", "take", "current", "time", "play",
+    "search", "fetch", "control", "free", "text", "execute",
+}
+LLM_PRICES_PER_MTOK = {     # USD per million tokens, for usage reports
+    "gemini-3-flash-preview": {"input": 0.50, "cached": 0.05, "output": 3.00},
+    "gemini-3-pro-preview": {"input": 2.00, "cached": 0.20, "output": 12.00},
+}
+METRICS_FILE = os.path.join("data", "metrics", "llm_usage.jsonl")
+DEEPGRAM_STT_URL = "wss://api.deepgram.com/v2/listen"    # overridable so the replay harness can point at a local stand-in
+DEEPGRAM_SPEAK_URL = "https://api.deepgram.com/v1/speak"
 TTS_VOICE = "aura-2-luna-en"
-SPEECH_END_TIMEOUT = 1.5
+TTS_PREFETCH = 3               # sentences synthesised concurrently (audio is still queued in order)
+TTS_MIN_SEGMENT_CHARS = 40     # shorter sentences are combined with the next when both are waiting
+TTS_FIRST_SEGMENT_CHARS = 80   # longer first sentences are split at a clause for faster first audio
+SEGMENTER_FIRST_CLAUSE_CHARS = 40  # LLM stream: emit the opening clause early once the first sentence passes this
+SEGMENTER_MAX_CHARS = 300      # LLM stream: force a break at whitespace in runaway sentences
+# End of turn (chip/core/end_of_turn.py): decided by Deepgram Flux, no fixed merge window
+FLUX_EOT_THRESHOLD = 0.7       # confidence needed for EndOfTurn (0.5-0.9; lower ends turns sooner)
+FLUX_EAGER_EOT_THRESHOLD = None  # e.g. 0.5 to get EagerEndOfTurn events (they start speculation early)
+FLUX_EOT_TIMEOUT_MS = 5000     # EndOfTurn after this much silence whatever the confidence
+EOT_HOLD_MS = 600              # extra wait when the transcript looks unfinished ("...and", "to the")
+EOT_REQUIRE_PUNCTUATION = False  # also treat a missing . ? ! as unfinished
+# Speculative dispatch (chip/core/speculation.py): start the first LLM round on a stable partial transcript
+SPECULATIVE_ENABLED = False
+SPECULATIVE_STABLE_MS = 300    # partial unchanged this long before speculating
+SPECULATIVE_MIN_WORDS = 2
 MAX_LLM_TURNS = 15
 STATE_JSON = "chip_state.json"
 CACHE_SECONDS = 86400
 SPEAK_MODE = "always" #always, never, dynamic
 PREFERRED_INPUT_DEVICE = 'MacBook Air Microphone' 
 PREFERRED_OUTPUT_DEVICE = 'Charlie’s AirPods'
-HISTORY_MAX_LENGTH = 40
+# Startup routine: a Full Startup runs if the last one was more than QUICK_RECALL_SECONDS ago, otherwise a Quick Recall.
+# The full startup always needs these calls; they start as soon as their server has booted.
+# {today_start}, {today_end} and {tomorrow_end} are filled in at boot (ISO 8601, local time).
+QUICK_RECALL_SECONDS = 3600
+STARTUP_PREFETCH = {
+    "calendar_listEvents": {"calendarId": "primary", "timeMin": "{today_start}", "timeMax": "{today_end}"},
+    "gmail_search": {"query": "is:unread newer_than:2d", "maxResults": 10},
+}
+STARTUP_PREFETCH_TIMEOUT = 10   # seconds to wait for prefetches once all servers are up
+STARTUP_MAX_ROUNDS = 5
+
+HISTORY_TOKEN_BUDGET = 32000   # conversation history, in (calibrated) prompt tokens
+HISTORY_COMPACT_AT = 0.75      # past this share of the budget, older turns are summarised in the background
+HISTORY_COMPACT_TO = 0.4       # share of the budget kept verbatim (also what a hard trim keeps)
+
+# Rolling conversation-prefix cache (chip/core/gemini_cache.py): older history is cached with the system prompt
+CONTEXT_CACHE_ENABLED = True
+CONTEXT_CACHE_ROLL_TOKENS = 4000   # roll forward once a request sends this many uncached prompt tokens
+CONTEXT_CACHE_TAIL_MESSAGES = 6    # newest messages always sent uncached
+CONTEXT_CACHE_TTL_SECONDS = 1800
+
+# Mic DSP (chip/audio/dsp.py) - applied to every block before it is sent to Deepgram
+MIC_GAIN = 3.0
+MIC_HIGHPASS_HZ = 80           # 0 disables DC / rumble removal
+MIC_NOISE_GATE_DBFS = None     # e.g. -55 to attenuate frames below this level
+MIC_NOISE_GATE_FLOOR_DB = -30
+MIC_NOISE_GATE_HOLD_MS = 200
+MIC_AGC = False
+MIC_AGC_TARGET_DBFS = -22
+MIC_AGC_MAX_GAIN_DB = 20
+
+# Echo cancellation (chip/audio/echo_cancel.py) - keeps the mic live while Chip speaks
+AEC_ENABLED = True
+AEC_FILTER_MS = 128            # echo tail the adaptive filter covers
+AEC_DELAY_MS = 0               # extra speaker->mic delay if the device under-reports its latency
+AEC_RESIDUAL_GAIN = 0.3        # attenuation of what's left while only Chip is talking
+AEC_BARGE_IN_WINDOW_MS = 1500  # while Chip talks, StartOfTurn only interrupts if the double-talk detector heard the user this recently
+
+# Local VAD (chip/audio/vad.py) - gates what is streamed to Deepgram inside the active window
+VAD_ENABLED = True
+VAD_FRAME_MS = 20
+VAD_THRESHOLD_DB = 9.0         # dB above the adaptive noise floor
+VAD_MIN_DBFS = -60.0
+VAD_MAX_ZCR = 0.5
+VAD_PREROLL_MS = 300           # audio kept before an onset so first words are never clipped
+VAD_HANGOVER_MS = 1500         # trailing audio after speech so Flux can detect end of turn
+STT_KEEPALIVE_MS = 20          # silence sent every 0.5s while the gate is closed
 
 TOOL_SPECIFIC_FILLERS = {
     "search_web": "Checking the web for you.",
@@ -65,6 +185,13 @@ TOOL_SPECIFIC_FILLERS = {
     "whoAmI": "Let me check my profile data."
 }
 
+# Tools with real-world side effects: never abandoned mid-call on barge-in
+SIDE_EFFECT_TOOLS = {
+    "gmail_send", "gmail_createDraft", "calendar_createEvent", "docs_create",
+    "execute_command", "play_song", "play_playlist", "control_playback", "memory",
+    "capture_take_picture", "capture_take_screenshot"
+}
+
 FILLERS_START = [
     "On it.", "Just a moment.", "Checking that for you.", 
     "I'll take a look.", "One second.", "Right away."
@@ -75,24 +202,58 @@ FILLERS_CONTINUED = [
     "Processing the results...", "Almost there.", "Hang tight."
 ]
 
+# Pre-synthesised PCM cache (chip/audio/tts_cache.py). Fillers and these lines are warmed at boot;
+# anything else is cached once it has been spoken TTS_CACHE_MIN_REPEATS times.
+TTS_CACHE_DIR = os.path.join("data", "tts_cache")
+TTS_CACHE_MAX_MB = 64
+TTS_CACHE_MIN_REPEATS = 2
+TTS_CACHE_MAX_COUNTS = 2000  # repeat counts kept for uncached phrases (most recently spoken)
+TTS_CACHE_PHRASES = ["Rebooting system.", "Initiating full startup routine"]
+
 RESTART_TOOL = {
     "type": "function",
     "function": {
         "name": "restart_system",
-        "description": "Restarts the entire AI system (Chip). Use this if you are stuck, experiencing errors, or if the user explicitly asks you to reboot/restart.",
+        "description": "Restarts the entire AI system (Chip). Use this if you are stuck, experiencing errors, or if the user explicitly asks you to reboot/restart. After editing config.py, personality or user customs, a restart reloads them in place; a full process restart happens automatically when Python code has changed.",
         "parameters": {
             "type": "object", 
-            "properties": {}
+            "properties": {
+                "full": {"type": "boolean", "description": "Force a full process restart (e.g. when stuck or broken) instead of reloading in place."}
+            }
         }
     }
 }
 
+READ_TOOL_OUTPUT_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "read_tool_output",
+        "description": "Reads a large tool output that was stored instead of shown in full. Pass the handle from the preview; page with offset/length (characters) or pass grep (regex) to get only the matching lines.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "handle": {"type": "string", "description": "Handle from the preview, e.g. out_0123456789abcdef"},
+                "offset": {"type": "integer", "description": "Character offset to start from (default 0)"},
+                "length": {"type": "integer", "description": "Characters to return (default and max about 4000)"},
+                "grep": {"type": "string", "description": "Case-insensitive regex; returns matching lines with line numbers"}
+            },
+            "required": ["handle"]
+        }
+    }
+}
+
+# Spill store (chip/utils/spill_store.py): tool outputs over the threshold are kept on disk, the model sees a preview
+SPILL_DIR = os.path.join("data", "tool_outputs")
+SPILL_THRESHOLD_CHARS = 4000
+SPILL_PREVIEW_CHARS = 1500
+SPILL_MAX_MB = 200
+
 TARGET_FOLDER = os.path.abspath(".")
 DATE = datetime.datetime.now().strftime("%B %d, %Y")
 TIME = datetime.datetime.now().strftime("%I:%M %p")
 SYSTEM_PROMPT = f"""
 ROLE: Chip, an advanced voice-first AI assistant.
-CURRENT_TIME: {DATE} @ {TIME}
+CURRENT_TIME: given with the latest user message
 CONFIG_PATH: chip/utils/config.py
 
 ### CRITICAL OUTPUT RULES (STRICT ENFORCEMENT)
@@ -107,6 +268,7 @@ CONFIG_PATH: chip/utils/config.py
 - **Memory**: Store user details generously (Threshold: Importance > 3/10).
 - **Terminal**: Confirm before destructive commands (rm, dd). NEVER use for web scraping.
 - **YouTube Music**: Controls music in Arc Browser. Confirm execution with a simple "Done".
+- **Large Outputs**: Big tool results arrive as a preview with a handle. Use read_tool_output (page or grep) instead of re-running the tool.
 - **Self-Evolution**: `data/personality.txt` defines your traits. Edit this file if requested to change behavior.
 
 ### OPERATIONAL & SAFETY GUIDELINES
@@ -125,6 +287,18 @@ Be personable and engaging in your responses, but avoid unnecessary verbosity. A
 
 ALLOWED_FS_PATH = os.path.abspath(".")
 
+# MCP servers with a current entry in the tool manifest are advertised from it and spawned on first use,
+# or in the background once idle this long (None: only on first use)
+MCP_MANIFEST_FILE = os.path.join("data", "mcp_manifest.json")
+MCP_IDLE_SPAWN_SECONDS = 30
+# Supervision: running servers are pinged; a dead or unresponsive one is respawned with exponential backoff
+MCP_PING_SECONDS = 30
+MCP_PING_TIMEOUT = 5
+MCP_RESPAWN_BACKOFF = 1.0       # seconds, doubled per failed attempt
+MCP_RESPAWN_BACKOFF_MAX = 60
+MCP_RECOVERY_WAIT_SECONDS = 10  # how long a tool call waits for its server to come back
+MCP_CALL_TIMEOUT_SECONDS = 120  # a tool call with no reply by then fails; its server is pinged and respawned if hung
+
 MCP_SERVERS = {
     "web_search": {
         "command": "uv",
@@ -1,27 +1,100 @@
+import json
 from google.genai import types
 
-def sanitise_tool_outputs(history):
-    """
-    Scans history for large Tool Responses and truncates them to save tokens.
-    """
-    for i in range(len(history) - 3):
-        message = history[i]
-        if message.role == "user":
-            for part in message.parts:
-                if part.function_response:
-                    current_response = part.function_response.response
-                    if "result" in current_response and len(str(current_response["result"])) > 2000:
-                        original_len = len(str(current_response["result"]))
-                        part.function_response.response = {
-                            "result": f"[Output Truncated - Original Length: {original_len} chars]. Context: Tool executed successfully."
-                        }
-    return history
-
-def safe_trim_history(history, max_length=30):
-    if len(history) <= max_length:
+def sanitise_tool_outputs(parts, store):
+    """
+    Spills oversized tool responses in newly added parts to `store`, leaving
+    a preview and a handle. Only new parts are touched; results already in
+    the history are compact by construction.
+    """
+    for part in parts:
+        if part.function_response:
+            response = part.function_response.response or {}
+            for field in ("result", "error"):
+                value = response.get(field)
+                if value is not None and not isinstance(value, str):
+                    value = json.dumps(value, default=str)
+                if value is not None and len(value) > store.threshold_chars:
+                    part.function_response.response = {**response, field: store.spill(value, part.function_response.name)}
+    return parts
+
+MEMORY_MARKER = "[CONVERSATION MEMORY]"
+
+class TokenEstimator:
+    """
+    Local prompt-size estimate (characters / 4), calibrated against the
+    prompt_token_count the server reports so budgets track real tokens.
+    """
+    def __init__(self, chars_per_token=4.0):
+        self.chars_per_token = chars_per_token
+        self.ratio = 1.0        # server tokens per estimated token (EMA)
+        self._tools = (None, 0)
+
+    def _chars(self, content):
+        total = 0
+        for part in content.parts or []:
+            if part.text:
+                total += len(part.text)
+            elif part.function_call:
+                total += len(part.function_call.name or "") + len(json.dumps(part.function_call.args or {}, default=str))
+            elif part.function_response:
+                total += len(json.dumps(part.function_response.response or {}, default=str))
+            elif part.inline_data:
+                total += 258 * self.chars_per_token     # images are a flat 258 tokens
+        return total
+
+    def content_tokens(self, content):
+        return self._chars(content) / self.chars_per_token * self.ratio
+
+    def tokens(self, history):
+        return sum(self.content_tokens(c) for c in history)
+
+    def request_tokens(self, system_instruction, tools, history):
+        if tools is not self._tools[0]:
+            self._tools = (tools, len(json.dumps(tools or [], default=str)) / self.chars_per_token)
+        return (len(system_instruction or "") / self.chars_per_token + self._tools[1]) * self.ratio + self.tokens(history)
+
+    def observe(self, estimated, actual):
+        """Feeds back one request: our (current-ratio) estimate and the server's count."""
+        if estimated > 0 and actual:
+            sample = actual / (estimated / self.ratio)
+            self.ratio = min(3.0, max(0.33, 0.8 * self.ratio + 0.2 * sample))
+
+estimator = TokenEstimator()
+
+def turn_starts(history):
+    """
+    Indices where a user turn begins (a user message with text). Cutting only
+    here never separates a function_call from its function_response.
+    """
+    return [i for i, c in enumerate(history)
+            if c.role == "user" and any(p.text for p in c.parts or [])]
+
+def keep_recent(history, tokens):
+    """Index of the earliest turn start such that history[index:] fits in `tokens` (always keeps the last turn)."""
+    starts = turn_starts(history)
+    if not starts:
+        return 0
+    remaining = estimator.tokens(history[starts[0]:])
+    for i, start in enumerate(starts[:-1]):
+        if remaining <= tokens:
+            return start
+        remaining -= estimator.tokens(history[start:starts[i + 1]])
+    return starts[-1]
+
+def trim_to_budget(history, budget, keep_tokens):
+    """
+    Hard cap for when background compaction can't keep up: over `budget`, drops
+    the oldest whole turns down to `keep_tokens` (the memory block stays).
+    """
+    if estimator.tokens(history) <= budget:
         return history
-    trimmed = history[-max_length:]
-    if trimmed and trimmed[0].role == "model":
-        trimmed = trimmed[1:]
-        
-    return trimmed
\ No newline at end of file
+    memory = history[:1] if history and is_memory(history[0]) else []
+    body = history[len(memory):]
+    return memory + body[keep_recent(body, keep_tokens):]
+
+def is_memory(content):
+    return content.role == "user" and bool(content.parts) and (content.parts[0].text or "").startswith(MEMORY_MARKER)
+
+def memory_block(summary):
+    return types.Content(role="user", parts=[types.Part.from_text(text=f"{MEMORY_MARKER} Earlier in this conversation: {summary}")])
@@ -0,0 +1,205 @@
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from colorama import Fore, Style, init
+
+from chip.utils import config
+
+init(autoreset=True)
+
+WINDOW = 200
+SESSION = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+
+_latencies = defaultdict(lambda: deque(maxlen=WINDOW))
+
+def now_ms():
+    return time.perf_counter() * 1000
+
+def record_latency(name, ms, log=True):
+    """Records a latency sample (milliseconds) under `name` and keeps a rolling window."""
+    samples = _latencies[name]
+    samples.append(ms)
+    if log:
+        p50 = sorted(samples)[len(samples) // 2]
+        print(f"{Fore.LIGHTBLACK_EX}[METRICS] {name}: {ms:.0f}ms (p50 {p50:.0f}ms, n={len(samples)}){Style.RESET_ALL}")
+
+def latency_summary():
+    summary = {}
+    for name, samples in _latencies.items():
+        if not samples:
+            continue
+        ordered = sorted(samples)
+        summary[name] = {
+            "n": len(ordered),
+            "p50": round(ordered[len(ordered) // 2], 1),
+            "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+            "max": round(ordered[-1], 1),
+        }
+    return summary
+
+class BootTimeline:
+    """Start/end of each boot stage relative to process start, printed as a text Gantt chart."""
+    def __init__(self):
+        self.t0 = now_ms()
+        self.stages = []    # (name, start_ms, end_ms)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = now_ms()
+        try:
+            yield
+        finally:
+            self.add(name, start, now_ms())
+
+    def add(self, name, start, end):
+        self.stages.append((name, start - self.t0, end - self.t0))
+
+    def report(self, width=40):
+        if not self.stages:
+            return ""
+        total = max(end for _, _, end in self.stages) or 1
+        lines = [f"Boot timeline ({total / 1000:.2f}s)"]
+        for name, start, end in sorted(self.stages, key=lambda s: s[1]):
+            a = int(start / total * width)
+            b = max(a + 1, int(end / total * width))
+            lines.append(f"  {name[:28]:<28} {' ' * a}{'#' * (b - a)}{' ' * (width - b)} {start:6.0f} -> {end:6.0f}ms")
+        return "\n".join(lines)
+
+# --- LLM token usage and cost ---
+_TOKEN_FIELDS = ("calls", "prompt", "cached", "billed", "output", "cost")
+_tokens = defaultdict(lambda: dict.fromkeys(_TOKEN_FIELDS, 0))
+_writer = None
+_records = queue.Queue()
+
+def prices(model=None):
+    """USD per million tokens for `model`: input, cached input, output (thinking counts as output)."""
+    table = getattr(config, 'LLM_PRICES_PER_MTOK', {})
+    model = model or config.LLM_MODEL
+    return table.get(model) or table.get(config.LLM_MODEL) or {"input": 0.50, "cached": 0.05, "output": 3.00}
+
+def cost(prompt, cached, output, model=None):
+    p = prices(model)
+    return ((prompt - cached) * p["input"] + cached * p["cached"] + output * p["output"]) / 1e6
+
+def record_tokens(site, usage, round_index=None, model=None, cancelled=False):
+    """
+    Records one LLM call's usage_metadata, tagged by call site (main, startup,
+    summary, ...) and tool round. Aggregates stay in memory; the record is
+    appended to the JSONL log by a background thread.
+    """
+    prompt = usage.prompt_token_count or 0
+    cached = getattr(usage, "cached_content_token_count", 0) or 0
+    output = (usage.candidates_token_count or 0) + (getattr(usage, "thoughts_token_count", 0) or 0)
+    model = model or config.LLM_MODEL
+    record = {
+        "ts": datetime.datetime.now().isoformat(timespec="seconds"),
+        "session": SESSION,
+        "site": site,
+        "round": round_index,
+        "model": model,
+        "prompt": prompt,
+        "cached": cached,
+        "billed": prompt - cached,
+        "output": output,
+        "cost": round(cost(prompt, cached, output, model), 6),
+    }
+    if cancelled:
+        record["cancelled"] = True
+    for key in (site, "total"):
+        agg = _tokens[key]
+        agg["calls"] += 1
+        for field in _TOKEN_FIELDS[1:]:
+            agg[field] += record[field]
+    _write(record)
+    return record
+
+def _write(record):
+    global _writer
+    if _writer is None:
+        _writer = threading.Thread(target=_writer_loop, daemon=True)
+        _writer.start()
+    _records.put(record)
+
+def _writer_loop():
+    path = getattr(config, 'METRICS_FILE', os.path.join("data", "metrics", "llm_usage.jsonl"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        while True:
+            record = _records.get()
+            if record is None:
+                return
+            f.write(json.dumps(record) + "\n")
+            if _records.empty():
+                f.flush()
+
+def close(timeout=2.0):
+    """Flushes pending usage records (call at shutdown)."""
+    if _writer is not None:
+        _records.put(None)
+        _writer.join(timeout)
+
+def token_summary():
+    summary = {}
+    for site, agg in _tokens.items():
+        summary[site] = {
+            **{k: agg[k] for k in ("calls", "prompt", "billed", "output")},
+            "cached_pct": round(100 * agg["cached"] / max(1, agg["prompt"]), 1),
+            "cost_usd": round(agg["cost"], 4),
+        }
+    return summary
+
+# --- Report: python -m chip.utils.metrics ---
+def _load(path, days):
+    since = (datetime.datetime.now() - datetime.timedelta(days=days)).isoformat() if days else ""
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("ts", "") >= since:
+                yield record
+
+def _table(title, groups):
+    print(f"\n{title:<20}{'calls':>7}{'prompt':>11}{'cached%':>9}{'billed':>11}{'output':>10}{'cost $':>10}")
+    for name, agg in groups.items():
+        cached_pct = 100 * agg["cached"] / max(1, agg["prompt"])
+        print(f"{name[:19]:<20}{agg['calls']:>7}{agg['prompt']:>11}{cached_pct:>8.1f}%{agg['billed']:>11}"
+              f"{agg['output']:>10}{agg['cost']:>10.4f}")
+
+def report(path, days=None, sessions=10):
+    by_day, by_session, by_site = (defaultdict(lambda: dict.fromkeys(_TOKEN_FIELDS, 0)) for _ in range(3))
+    for record in _load(path, days):
+        for groups, key in ((by_day, record["ts"][:10]), (by_session, record["session"]), (by_site, record["site"])):
+            agg = groups[key]
+            agg["calls"] += 1
+            for field in _TOKEN_FIELDS[1:]:
+                agg[field] += record.get(field, 0)
+    if not by_day:
+        print(f"No usage records in {path}")
+        return
+    _table("day", dict(sorted(by_day.items())))
+    _table("session", dict(sorted(by_session.items())[-sessions:]))
+    _table("call site", dict(sorted(by_site.items(), key=lambda kv: -kv[1]["cost"])))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LLM token usage, cost and cache efficiency from the usage log.")
+    parser.add_argument("--file", default=getattr(config, 'METRICS_FILE', os.path.join("data", "metrics", "llm_usage.jsonl")))
+    parser.add_argument("--days", type=int, help="only the last N days")
+    parser.add_argument("--sessions", type=int, default=10, help="most recent sessions to list")
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.file):
+        print(f"No usage log at {args.file}")
+        return 1
+    report(args.file, args.days, args.sessions)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+import random
+import re
+import sys
+import time
+
+from chip.utils import config
+
+TERMINATORS = ".?!"
+CLOSERS = "\"')]}”’"
+CLAUSE_MARKS = ",;:"
+
+# Always followed by a name, so never the end of a sentence
+TITLES = {"mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "gen", "col", "capt", "sgt", "rev", "hon"}
+# Ends a sentence only if the next word is capitalised
+ABBREVIATIONS = {
+    "etc", "e.g", "i.e", "vs", "approx", "no", "fig", "inc", "ltd", "co", "corp", "ave", "dept", "est",
+    "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+    "a.m", "p.m", "u.s", "u.k", "min", "max", "cf", "al",
+}
+
+_NORMAL, _TERMINAL, _ABBREV, _CLAUSE = range(4)
+
+class SentenceSegmenter:
+    """
+    Streaming sentence splitter for LLM output. Each character is looked at
+    once, so cost is linear in the reply however it is chunked.
+
+    - Splits after . ? ! (plus closing quotes/brackets) followed by whitespace,
+      and on line breaks.
+    - Not after titles (Dr.), initials, list markers ("2."), decimals (3.5)
+      or inside URLs/file names; other abbreviations (etc.) split only when
+      the next word is capitalised.
+    - Optionally emits the first clause (at , ; :) once the opening sentence
+      runs past `first_clause_chars`, so speech can start sooner. This fires
+      once per segmenter, so a turn keeps one across all its LLM rounds.
+    - Forces a break at whitespace past `max_chars` for runaway sentences.
+    """
+    def __init__(self, first_clause_chars=None, max_chars=None):
+        self.first_clause_chars = first_clause_chars if first_clause_chars is not None else getattr(config, 'SEGMENTER_FIRST_CLAUSE_CHARS', 40)
+        self.max_chars = max_chars or getattr(config, 'SEGMENTER_MAX_CHARS', 300)
+        self._chars = []
+        self._word = []
+        self._words = 0        # words completed in the current segment
+        self._state = _NORMAL
+        self._emitted = 0
+
+    def _emit(self, out):
+        text = "".join(self._chars).strip()
+        self._chars = []
+        self._word = []
+        self._words = 0
+        self._state = _NORMAL
+        if text:
+            out.append(text)
+            self._emitted += 1
+
+    def _ends_sentence(self):
+        """Called on '.': decides from the word it ends whether this could be a sentence boundary."""
+        word = "".join(self._word).lstrip("\"'([{“‘").lower()[:-1]
+        if not word:
+            return _TERMINAL
+        if word in TITLES or (len(word) == 1 and word.isalpha()):
+            return _NORMAL
+        if word.isdigit() and not self._words:
+            return _NORMAL     # numbered list marker at the start of a line
+        if word in ABBREVIATIONS:
+            return _ABBREV
+        return _TERMINAL
+
+    def feed(self, text):
+        """Adds streamed text. Returns the segments it completed (possibly none)."""
+        out = []
+        for c in text:
+            state = self._state
+            if state == _TERMINAL or state == _CLAUSE:
+                if c.isspace():
+                    self._emit(out)
+                    continue
+                if state == _TERMINAL and (c in TERMINATORS or c in CLOSERS):
+                    self._chars.append(c)
+                    continue
+                self._state = _NORMAL           # "3.5", "example.com", "1,000": not a boundary
+            elif state == _ABBREV:
+                if c.isspace():
+                    self._chars.append(c)
+                    continue
+                if c.isupper():
+                    self._emit(out)
+                else:
+                    self._state = _NORMAL
+
+            self._chars.append(c)
+            if c == "\n":
+                self._emit(out)
+            elif c.isspace():
+                if self._word:
+                    self._words += 1
+                    self._word = []
+                if len(self._chars) >= self.max_chars:
+                    self._emit(out)
+            else:
+                self._word.append(c)
+                if c in TERMINATORS:
+                    self._state = self._ends_sentence() if c == "." else _TERMINAL
+                elif (c in CLAUSE_MARKS and not self._emitted and self.first_clause_chars
+                        and len(self._chars) >= self.first_clause_chars):
+                    self._state = _CLAUSE
+        return out
+
+    def flush(self):
+        """Ends the stream: returns whatever is left as a final segment."""
+        out = []
+        self._emit(out)
+        return out
+
+    def discard(self):
+        """Drops unfinished text from a stream that failed, so a retry starts clean."""
+        self._chars = []
+        self._word = []
+        self._words = 0
+        self._state = _NORMAL
+
+# --- Self-check corpus and benchmark: python -m chip.utils.segmenter ---
+CORPUS = [
+    ("Hello there. How are you? I'm fine!", ["Hello there.", "How are you?", "I'm fine!"]),
+    ("Dr. Smith will see you at 3.30 today. Bring the forms.", ["Dr. Smith will see you at 3.30 today.", "Bring the forms."]),
+    ("It costs $3.50, roughly. That's cheap.", ["It costs $3.50, roughly.", "That's cheap."]),
+    ("Go to https://example.com/a.b?x=1. Then log in.", ["Go to https://example.com/a.b?x=1.", "Then log in."]),
+    ("Edit config.py and restart. Done.", ["Edit config.py and restart.", "Done."]),
+    ("Bring apples, pears, etc. and some bread.", ["Bring apples, pears, etc. and some bread."]),
+    ("Bring apples, pears, etc. The rest is fine.", ["Bring apples, pears, etc.", "The rest is fine."]),
+    ("He said \"stop.\" Then he left.", ["He said \"stop.\"", "Then he left."]),
+    ("Really?! Wow.", ["Really?!", "Wow."]),
+    ("Your options:\n1. Email\n2. Call", ["Your options:", "1. Email", "2. Call"]),
+    ("1. Buy milk. 2. Call mum.", ["1. Buy milk.", "2. Call mum."]),
+    ("J. R. R. Tolkien wrote it. Read it.", ["J. R. R. Tolkien wrote it.", "Read it."]),
+    ("Meet at 10 a.m. tomorrow.", ["Meet at 10 a.m. tomorrow."]),
+    ("That's 1,000 items in total.", ["That's 1,000 items in total."]),
+    ("Wait... what?", ["Wait...", "what?"]),
+    ("no punctuation at all", ["no punctuation at all"]),
+    # Early clause: only the first sentence, only once it is long
+    ("Short, sweet. Then, more.", ["Short, sweet.", "Then, more."]),
+    ("Looking at your calendar for the rest of today, you have two meetings. First, a sync.",
+     ["Looking at your calendar for the rest of today,", "you have two meetings.", "First, a sync."]),
+]
+
+def _segment(text, chunk_sizes, **kwargs):
+    seg = SentenceSegmenter(**kwargs)
+    out, i = [], 0
+    while i < len(text):
+        n = next(chunk_sizes)
+        out.extend(seg.feed(text[i:i + n]))
+        i += n
+    return out + seg.flush()
+
+def check(verbose=True):
+    rng = random.Random(0)
+    failed = set()
+    for text, expected in CORPUS:
+        # The result must not depend on how the stream happens to be chunked
+        for label, sizes in (("whole", iter(lambda: len(text), None)), ("chars", iter(lambda: 1, None)),
+                             ("random", iter(lambda: rng.randint(1, 7), None))):
+            got = _segment(text, sizes, first_clause_chars=40, max_chars=300)
+            if got != expected:
+                failed.add(text)
+                if verbose:
+                    print(f"FAIL ({label}) {text!r}\n    expected {expected}\n    got      {got}")
+    if verbose:
+        print(f"{len(CORPUS) - len(failed)}/{len(CORPUS)} corpus cases pass (whole, per-char and random chunking)")
+    return len(failed)
+
+def _legacy(chunks):
+    buf, out = "", []
+    for chunk in chunks:
+        buf += chunk
+        sentences = re.split(r'(?<=[.?!])\s+', buf)
+        if len(sentences) > 1:
+            out.extend(s.strip() for s in sentences[:-1] if s.strip())
+            buf = sentences[-1]
+    return out
+
+def benchmark(chars=20000, chunk=4):
+    """Per-reply cost with token-sized chunks: a normal reply and one long unpunctuated run."""
+    words = "the quick brown fox jumps over the lazy dog".split()
+    normal = " ".join(words[i % len(words)] + ("." if i % 15 == 14 else "") for i in range(chars // 4))[:chars]
+    runaway = " ".join(words[i % len(words)] for i in range(chars // 4))[:chars]
+    for name, text in (("punctuated", normal), ("unpunctuated", runaway)):
+        chunks = [text[i:i + chunk] for i in range(0, len(text), chunk)]
+        started = time.perf_counter()
+        _legacy(chunks)
+        legacy = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        seg = SentenceSegmenter()
+        for c in chunks:
+            seg.feed(c)
+        seg.flush()
+        new = (time.perf_counter() - started) * 1000
+        print(f"{name:<14} {len(text)} chars in {len(chunks)} chunks: regex {legacy:8.1f} ms   segmenter {new:6.1f} ms")
+
+if __name__ == "__main__":
+    failed = check()
+    benchmark()
+    sys.exit(1 if failed else 0)
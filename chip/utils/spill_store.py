@@ -0,0 +1,105 @@
+import hashlib
+import os
+import re
+from colorama import Fore, Style, init
+
+from chip.utils import config
+
+init(autoreset=True)
+
+class SpillStore:
+    """
+    On-disk, content-addressed store for tool outputs too large to keep in
+    the conversation. The model sees a preview plus a handle and pages
+    through the rest with the read_tool_output tool, instead of re-running
+    the tool. Size-bounded; the least recently read outputs go first.
+    """
+    def __init__(self, directory=None, max_bytes=None, threshold_chars=None, preview_chars=None):
+        self.directory = directory or getattr(config, 'SPILL_DIR', os.path.join("data", "tool_outputs"))
+        self.max_bytes = max_bytes or int(getattr(config, 'SPILL_MAX_MB', 200) * 1024 * 1024)
+        self.threshold_chars = threshold_chars or getattr(config, 'SPILL_THRESHOLD_CHARS', 4000)
+        self.preview_chars = preview_chars or getattr(config, 'SPILL_PREVIEW_CHARS', 1500)
+
+    def _path(self, handle):
+        return os.path.join(self.directory, f"{handle}.txt")
+
+    def put(self, text):
+        """Stores `text` (deduplicated by content) and returns its handle."""
+        handle = "out_" + hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+        path = self._path(handle)
+        try:
+            # Already stored: handed out again, so it must not be the next to be evicted
+            os.utime(path)
+        except FileNotFoundError:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, path)
+            self._evict()
+        return handle
+
+    def _evict(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".txt"):
+                st = entry.stat()
+                files.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def spill(self, text, tool_name=None):
+        """Returns `text` unchanged if small, otherwise a preview that names the handle of the full output."""
+        if len(text) <= self.threshold_chars:
+            return text
+        handle = self.put(text)
+        print(f"{Fore.LIGHTBLACK_EX}[SYSTEM] Stored {len(text)} char output{f' of {tool_name}' if tool_name else ''} as {handle}{Style.RESET_ALL}")
+        return (
+            f"{text[:self.preview_chars]}\n...\n"
+            f"[Output stored as {handle}: {len(text)} chars, {text.count(chr(10)) + 1} lines. "
+            f"Use read_tool_output with this handle to page through it (offset, length) or search it (grep) "
+            f"instead of running the tool again.]"
+        )
+
+    def read(self, handle, offset=0, length=None, grep=None):
+        """
+        A page of a stored output, or its lines matching `grep` (case-insensitive
+        regex). Arguments come from the model, so bad ones get an error string.
+        """
+        if not isinstance(handle, str) or not re.fullmatch(r"out_[0-9a-f]{16}", handle):
+            return f"Error: '{handle}' is not a tool output handle."
+        try:
+            length = int(float(length)) if length not in (None, "") else None
+            offset = int(float(offset)) if offset not in (None, "") else 0
+        except (TypeError, ValueError, OverflowError):
+            return f"Error: offset and length must be numbers (got offset={offset!r}, length={length!r})."
+        if grep is not None and not isinstance(grep, str):
+            grep = str(grep)
+        try:
+            with open(self._path(handle), "r", encoding="utf-8") as f:
+                text = f.read()
+            os.utime(self._path(handle))
+        except FileNotFoundError:
+            return f"Error: {handle} is no longer stored. Run the tool again."
+
+        # Pages must stay under the spill threshold so they are never spilled themselves
+        length = max(1, min(length or self.threshold_chars, self.threshold_chars - 200))
+        offset = max(0, offset)
+        label = f"[{handle}"
+        if grep:
+            try:
+                pattern = re.compile(grep, re.IGNORECASE)
+            except re.error:
+                pattern = re.compile(re.escape(grep), re.IGNORECASE)
+            text = "\n".join(f"L{i}: {line}" for i, line in enumerate(text.splitlines(), start=1) if pattern.search(line))
+            if not text:
+                return f"[{handle}] No lines match '{grep}'."
+            label += f" grep '{grep}'"
+
+        end = min(len(text), offset + length)
+        more = f"; next page offset={end}" if end < len(text) else "; end of output"
+        return f"{label}: chars {offset}-{end} of {len(text)}{more}]\n{text[offset:end]}"
@@ -1,8 +1,16 @@
 import json
 import os
+from google.genai import types
 from mcp import StdioServerParameters
 from colorama import Fore, Style, init
+
+from chip.utils import history as history_utils
+from chip.utils.spill_store import SpillStore
+
 init(autoreset=True)
+
+spill_store = SpillStore()
+
 class ToolManager:
     def __init__(self, server_configs):
         self.server_configs = server_configs
@@ -34,7 +42,8 @@ class ToolManager:
 
 async def execute_tool(session, fname, fargs):
     """
-    Executes a tool on the given MCP session with safety truncation.
+    Executes a tool on the given MCP session. Oversized results are spilled
+    by history.sanitise_tool_outputs when they are added to the history.
     """
     if not session:
         return f"Error: Tool {fname} not found."
@@ -42,20 +51,25 @@ async def execute_tool(session, fname, fargs):
         print(f"{Fore.LIGHTBLACK_EX}[SYSTEM] Calling tool: {fname} with args {fargs}{Style.RESET_ALL}")
         res = await session.call_tool(fname, fargs)
         
-        full_text = "".join([c.text if hasattr(c, 'text') else str(c) for c in res.content])
-        MAX_CHARS = 8000 
-        
-        if len(full_text) > MAX_CHARS:
-            truncated_text = full_text[:MAX_CHARS]
-            warning_msg = (
-                f"\n\n{Fore.RED}[ERROR] Output too large ({len(full_text)} characters). "
-                f"Truncated to first {MAX_CHARS} characters to save costs.\n"
-                "If you need to read this file, use 'head', 'tail', or 'grep' instead of 'cat'."
-                f"{Style.RESET_ALL}"
-            )
-            return truncated_text + warning_msg
-            
-        return full_text
+        return "".join([c.text if hasattr(c, 'text') else str(c) for c in res.content])
 
     except Exception as e:
-        return f"Error executing {fname}: {e}"
\ No newline at end of file
+        return f"Error executing {fname}: {e}"
+
+def function_responses(tool_names, results):
+    """
+    Function response parts for tool results, with oversized outputs spilled.
+    Exceptions (from gather(..., return_exceptions=True)) become error responses.
+    """
+    parts = [
+        types.Part.from_function_response(name=name, response={"error": f"Tool execution failed: {res}"})
+        if isinstance(res, BaseException) else
+        types.Part.from_function_response(name=name, response={"result": res})
+        for name, res in zip(tool_names, results)
+    ]
+    return history_utils.sanitise_tool_outputs(parts, spill_store)
+
+async def read_tool_output(fargs):
+    """Built-in read_tool_output: pages through (or greps) a spilled tool output."""
+    fargs = fargs or {}
+    return spill_store.read(fargs.get("handle"), fargs.get("offset", 0), fargs.get("length"), fargs.get("grep"))